@@ -3,6 +3,11 @@ ASGI config for ReviewSystemBackend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The auth views that wait on Supabase (register, login, refresh-token, logout, update-password) are async
+views; only under an ASGI server, e.g.
+``gunicorn -k uvicorn.workers.UvicornWorker ReviewSystemBackend.asgi:application``, do they wait without
+holding a worker thread. Under WSGI they call Supabase from worker threads on the shared connection pool.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
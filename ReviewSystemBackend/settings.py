@@ -40,6 +40,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -90,6 +91,86 @@ DATABASES = {
 SUPABASE_URL = os.environ.get('SUPABASE_URL')
 SUPABASE_ANON_KEY = os.environ.get('SUPABASE_ANON_KEY')
 
+# Calls to Supabase share one keep-alive connection pool per process, or per event loop for the async auth
+# views (see api.utils.supabase_client); timeouts are in seconds. MAX_CONNECTIONS caps the requests in flight
+# to Supabase. Keep MAX_KEEPALIVE small: httpx's async pool slows down sharply with hundreds of idle connections.
+SUPABASE_HTTP_MAX_CONNECTIONS = int(os.environ.get('SUPABASE_HTTP_MAX_CONNECTIONS', 20))
+SUPABASE_HTTP_MAX_KEEPALIVE = int(os.environ.get('SUPABASE_HTTP_MAX_KEEPALIVE', 10))
+SUPABASE_HTTP_KEEPALIVE_EXPIRY = float(os.environ.get('SUPABASE_HTTP_KEEPALIVE_EXPIRY', 30))
+SUPABASE_HTTP_TIMEOUT = float(os.environ.get('SUPABASE_HTTP_TIMEOUT', 10))
+SUPABASE_HTTP_CONNECT_TIMEOUT = float(os.environ.get('SUPABASE_HTTP_CONNECT_TIMEOUT', 5))
+SUPABASE_HTTP2 = os.environ.get('SUPABASE_HTTP2', 'true').lower() == 'true'
+
+# Access tokens are verified in-process when possible: HS256 tokens against the project's JWT secret and
+# RS256 tokens against the project's JWKS. Tokens that cannot be verified locally fall back to a call to
+# Supabase's auth.get_user unless SUPABASE_AUTH_REMOTE_FALLBACK is disabled.
+SUPABASE_JWT_SECRET = os.environ.get('SUPABASE_JWT_SECRET')
+SUPABASE_JWKS_URL = os.environ.get(
+    'SUPABASE_JWKS_URL',
+    f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json" if SUPABASE_URL else None,
+)
+SUPABASE_JWKS_TTL = int(os.environ.get('SUPABASE_JWKS_TTL', 600))
+SUPABASE_JWT_AUDIENCE = os.environ.get('SUPABASE_JWT_AUDIENCE', 'authenticated')
+SUPABASE_JWT_LEEWAY = int(os.environ.get('SUPABASE_JWT_LEEWAY', 10))
+SUPABASE_AUTH_VERIFY_LOCALLY = os.environ.get('SUPABASE_AUTH_VERIFY_LOCALLY', 'true').lower() == 'true'
+SUPABASE_AUTH_REMOTE_FALLBACK = os.environ.get('SUPABASE_AUTH_REMOTE_FALLBACK', 'true').lower() == 'true'
+SUPABASE_AUTH_CACHE_SIZE = int(os.environ.get('SUPABASE_AUTH_CACHE_SIZE', 10000))
+SUPABASE_AUTH_CACHE_TTL = int(os.environ.get('SUPABASE_AUTH_CACHE_TTL', 300))
+
+# Authenticated users are resolved once per request and cached per process (see api.authentication)
+USER_IDENTITY_CACHE_SIZE = int(os.environ.get('USER_IDENTITY_CACHE_SIZE', 5000))
+USER_IDENTITY_CACHE_TTL = int(os.environ.get('USER_IDENTITY_CACHE_TTL', 60))
+
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': ['api.authentication.SupabaseAuthentication'],
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.IsAuthenticated'],
+    'EXCEPTION_HANDLER': 'api.exceptions.api_exception_handler',
+    'UNAUTHENTICATED_USER': None,
+}
+
+# Seconds between checks of the shared item bank version stamp (see api.ai.item_bank)
+ITEM_BANK_VERSION_CHECK_INTERVAL = float(os.environ.get('ITEM_BANK_VERSION_CHECK_INTERVAL', 5))
+
+# Seconds a per-assessment answer key stays cached for grading (see api.utils.grading)
+ANSWER_KEY_CACHE_TTL = int(os.environ.get('ANSWER_KEY_CACHE_TTL', 300))
+
+# Computerized adaptive testing (see api.ai.adaptive_testing)
+ADAPTIVE_TEST_MIN_ITEMS = int(os.environ.get('ADAPTIVE_TEST_MIN_ITEMS', 5))
+ADAPTIVE_TEST_MAX_ITEMS = int(os.environ.get('ADAPTIVE_TEST_MAX_ITEMS', 20))
+ADAPTIVE_TEST_TARGET_SE = float(os.environ.get('ADAPTIVE_TEST_TARGET_SE', 0.3))
+ADAPTIVE_TEST_RANDOMESQUE = int(os.environ.get('ADAPTIVE_TEST_RANDOMESQUE', 1))
+
+# Seconds a class gradebook stays cached; writes to the class's results evict it sooner (see api.utils.gradebook)
+GRADEBOOK_CACHE_TTL = int(os.environ.get('GRADEBOOK_CACHE_TTL', 300))
+
+# Seconds a serialized lesson body stays cached; keys include the lesson version (see api.utils.lessons)
+LESSON_CACHE_TTL = int(os.environ.get('LESSON_CACHE_TTL', 3600))
+
+# Keyset-paginated list endpoints: default and largest page size accepted through ?limit=
+API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 50))
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 200))
+
+# Per-request phase timings: a Server-Timing header and per-route histograms served at /metrics, which
+# requires "Authorization: Bearer <API_METRICS_TOKEN>"; without a token /metrics answers 404 (see api.middleware)
+API_METRICS_ENABLED = os.environ.get('API_METRICS_ENABLED', 'true').lower() == 'true'
+API_SERVER_TIMING = os.environ.get('API_SERVER_TIMING', 'true').lower() == 'true'
+API_METRICS_TOKEN = os.environ.get('API_METRICS_TOKEN')
+
+# Background jobs run by "manage.py run_worker" (see api.jobs); delays and timeouts are in seconds. Only set
+# JOBS_ENABLED where at least one worker process runs alongside the web server: otherwise queued work, such as
+# updating student abilities after a submission, never happens. With it off, that work runs in the request's
+# process after its transaction commits. A running job whose lock is not renewed for JOBS_LOCK_TIMEOUT is
+# considered abandoned and queued again. On SQLite, run more than one worker thread or process only with
+# OPTIONS = {'transaction_mode': 'IMMEDIATE'}.
+JOBS_ENABLED = os.environ.get('JOBS_ENABLED', 'false').lower() == 'true'
+JOBS_MAX_ATTEMPTS = int(os.environ.get('JOBS_MAX_ATTEMPTS', 5))
+JOBS_RETRY_BASE_DELAY = float(os.environ.get('JOBS_RETRY_BASE_DELAY', 10))
+JOBS_RETRY_MAX_DELAY = float(os.environ.get('JOBS_RETRY_MAX_DELAY', 3600))
+JOBS_LOCK_TIMEOUT = float(os.environ.get('JOBS_LOCK_TIMEOUT', 300))
+JOBS_POLL_INTERVAL = float(os.environ.get('JOBS_POLL_INTERVAL', 1))
+JOBS_MAINTENANCE_INTERVAL = float(os.environ.get('JOBS_MAINTENANCE_INTERVAL', 60))
+JOBS_KEEP_FINISHED_DAYS = int(os.environ.get('JOBS_KEEP_FINISHED_DAYS', 7))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -135,3 +216,6 @@ CORS_ALLOWED_ORIGIN_REGEXES = [
 ]
 
 CORS_ALLOW_CREDENTIALS = True
+
+# Paginated lists return the next page's cursor in this header, which browsers hide unless it is exposed
+CORS_EXPOSE_HEADERS = ['X-Next-Cursor']
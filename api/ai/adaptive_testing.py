@@ -0,0 +1,74 @@
+import numpy as np
+
+from api.utils.metrics import AI, timed_function
+
+from .estimate_student_ability import THETA_BOUNDS, three_pl_probability
+
+# Quadrature grid for expected a posteriori (EAP) estimates; EAP stays finite after all-correct or
+# all-wrong starts, which maximum likelihood does not
+QUADRATURE_POINTS = np.linspace(THETA_BOUNDS[0], THETA_BOUNDS[1], 61)
+
+
+def item_information(theta, discrimination, difficulty, guessing):
+    """Fisher information of each 3PL item at ``theta`` (vectorized over items)."""
+    probability = three_pl_probability(theta, difficulty, discrimination, guessing)
+    probability = np.clip(probability, 1e-9, 1 - 1e-9)
+    return (discrimination ** 2 * ((probability - guessing) / (1 - guessing)) ** 2
+            * (1 - probability) / probability)
+
+
+@timed_function(AI)
+def select_next_item(theta, discrimination, difficulty, guessing, available, randomesque=1, rng=None):
+    """
+    Return the index of the most informative available item at ``theta``.
+
+    ``available`` is a boolean mask over the pool. With ``randomesque`` > 1 the pick is drawn uniformly
+    from that many most informative items, which limits exposure of the single best item.
+    Returns ``None`` when no item is available.
+    """
+    candidates = np.flatnonzero(available)
+    if not len(candidates):
+        return None
+
+    information = item_information(theta, discrimination[candidates], difficulty[candidates], guessing[candidates])
+
+    if randomesque <= 1 or len(candidates) == 1:
+        return int(candidates[np.argmax(information)])
+
+    top = np.argpartition(-information, min(randomesque, len(candidates)) - 1)[:randomesque]
+    rng = rng or np.random.default_rng()
+    return int(candidates[rng.choice(top)])
+
+
+@timed_function(AI)
+def estimate_theta_eap(discrimination, difficulty, guessing, correct, prior_mean=0.0, prior_sd=1.0):
+    """
+    EAP theta and posterior standard deviation for a response vector under a normal prior.
+
+    Arrays are aligned per answered item. With no responses the prior itself is returned.
+    """
+    points = QUADRATURE_POINTS
+    log_posterior = -0.5 * ((points - prior_mean) / prior_sd) ** 2
+
+    if len(correct):
+        probability = three_pl_probability(
+            points[:, None], np.asarray(difficulty)[None, :], np.asarray(discrimination)[None, :],
+            np.asarray(guessing)[None, :],
+        )
+        probability = np.clip(probability, 1e-9, 1 - 1e-9)
+        correct = np.asarray(correct, dtype=bool)[None, :]
+        log_posterior = log_posterior + np.where(correct, np.log(probability), np.log1p(-probability)).sum(axis=1)
+
+    weights = np.exp(log_posterior - log_posterior.max())
+    weights /= weights.sum()
+
+    theta = float(np.dot(weights, points))
+    standard_error = float(np.sqrt(np.dot(weights, (points - theta) ** 2)))
+    return theta, standard_error
+
+
+def should_stop(items_answered, standard_error, min_items, max_items, target_standard_error):
+    """Stopping rule: enough precision after the minimum length, or the maximum length reached."""
+    if items_answered >= max_items:
+        return True
+    return items_answered >= min_items and standard_error <= target_standard_error
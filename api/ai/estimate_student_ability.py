@@ -1,85 +1,315 @@
+from django.db import transaction
+from django.utils import timezone
+
 from api.models import AssessmentResult, Answer, Question, User, Assessment, UserAbility, Category
+from api.utils.metrics import AI, timed_function
 from scipy.optimize import minimize
-import math
 import numpy as np
 
+THETA_BOUNDS = (-3.0, 3.0)
+
+# Probabilities are clipped to avoid log(0); clipped responses contribute no gradient
+MIN_PROBABILITY = 0.0001
+MAX_PROBABILITY = 0.9999
+
 
 def three_pl_probability(theta, difficulty, discrimination, guessing):
-    """Calculate the probability of answering correctly using the 3PL model."""
-    exp_term = math.exp(-discrimination * (theta - difficulty))
-    return guessing + (1 - guessing) / (1 + exp_term)
+    """Calculate the probability of answering correctly using the 3PL model (scalars or NumPy arrays)."""
+    return guessing + (1 - guessing) / (1 + np.exp(-discrimination * (theta - difficulty)))
 
 
-def log_likelihood(theta_array, answers):
-    theta = theta_array[0]  # Extract scalar value from array
-    likelihood = 0.0
+def _response_terms(theta, discrimination, difficulty, guessing):
+    """Return the clipped probabilities and their first and second derivatives with respect to theta."""
+    logistic = 1.0 / (1.0 + np.exp(-discrimination * (theta - difficulty)))
+    probability = guessing + (1 - guessing) * logistic
 
-    for answer in answers:
-        difficulty = answer.question.difficulty
-        discrimination = answer.question.discrimination
-        guessing = answer.question.guessing
+    first = (1 - guessing) * discrimination * logistic * (1 - logistic)
+    second = first * discrimination * (1 - 2 * logistic)
 
-        prob_correct = three_pl_probability(theta, difficulty, discrimination, guessing)
+    clipped = (probability < MIN_PROBABILITY) | (probability > MAX_PROBABILITY)
+    probability = np.clip(probability, MIN_PROBABILITY, MAX_PROBABILITY)
+    first = np.where(clipped, 0.0, first)
+    second = np.where(clipped, 0.0, second)
 
-        # Avoid log(0)
-        prob_correct = max(min(prob_correct, 0.9999), 0.0001)
+    return probability, first, second
 
-        likelihood += math.log(prob_correct) if answer.is_correct else math.log(1 - prob_correct)
 
-    return -likelihood
+def log_likelihood(theta, discrimination, difficulty, guessing, correct):
+    """3PL log-likelihood of a response vector at ``theta``."""
+    probability, _, _ = _response_terms(theta, discrimination, difficulty, guessing)
+    return float(np.sum(np.where(correct, np.log(probability), np.log1p(-probability))))
 
 
-def estimate_theta_for_answers(answers):
-    initial_theta = np.array([0.0])
-    bounds = [(-3, 3)]
+def log_likelihood_gradient(theta, discrimination, difficulty, guessing, correct):
+    """First derivative of :func:`log_likelihood` with respect to ``theta``."""
+    probability, first, _ = _response_terms(theta, discrimination, difficulty, guessing)
+    return float(np.sum((correct - probability) / (probability * (1 - probability)) * first))
+
+
+def log_likelihood_hessian(theta, discrimination, difficulty, guessing, correct):
+    """Second derivative of :func:`log_likelihood` with respect to ``theta``."""
+    probability, first, second = _response_terms(theta, discrimination, difficulty, guessing)
+    variance = probability * (1 - probability)
+    residual = correct - probability
+    d_weight = (-variance - residual * (1 - 2 * probability)) / variance ** 2
+    return float(np.sum(d_weight * first ** 2 + residual / variance * second))
+
+
+def fisher_information(theta, discrimination, difficulty, guessing):
+    """Fisher information of a set of items at ``theta`` (the expected negative Hessian)."""
+    probability, first, _ = _response_terms(theta, discrimination, difficulty, guessing)
+    return float(np.sum(first ** 2 / (probability * (1 - probability))))
+
+
+def _negative_log_likelihood(theta_array, discrimination, difficulty, guessing, correct):
+    theta = theta_array[0]
+    probability, first, _ = _response_terms(theta, discrimination, difficulty, guessing)
+    value = np.sum(np.where(correct, np.log(probability), np.log1p(-probability)))
+    gradient = np.sum((correct - probability) / (probability * (1 - probability)) * first)
+    return -value, np.array([-gradient])
+
+
+def _newton_theta(discrimination, difficulty, guessing, correct, max_iterations=50, tolerance=1e-7):
+    """Bounded Newton ascent with step halving; returns ``None`` if it does not converge."""
+    low, high = THETA_BOUNDS
+    theta = 0.0
+    value = log_likelihood(theta, discrimination, difficulty, guessing, correct)
+
+    for _ in range(max_iterations):
+        gradient = log_likelihood_gradient(theta, discrimination, difficulty, guessing, correct)
+        hessian = log_likelihood_hessian(theta, discrimination, difficulty, guessing, correct)
+
+        # The 3PL likelihood is not globally concave; fall back to a gradient step where it curves upwards
+        step = -gradient / hessian if hessian < 0 else gradient
+        candidate = min(max(theta + step, low), high)
+        candidate_value = log_likelihood(candidate, discrimination, difficulty, guessing, correct)
+
+        while candidate_value < value and abs(candidate - theta) > tolerance:
+            candidate = (theta + candidate) / 2
+            candidate_value = log_likelihood(candidate, discrimination, difficulty, guessing, correct)
+
+        converged = abs(candidate - theta) <= tolerance
+        theta, value = candidate, max(candidate_value, value)
+
+        if converged:
+            return theta
+
+    return None
+
+
+def estimate_theta(discrimination, difficulty, guessing, correct):
+    """
+    Maximum likelihood theta for one response vector.
+
+    All arguments are aligned flat arrays (``correct`` as 0/1). Uses Newton's method on the analytic
+    gradient and Hessian and falls back to L-BFGS-B when that does not converge. Returns ``None`` when both fail.
+
+    All-correct and all-wrong response vectors return the upper and lower bound of ``THETA_BOUNDS``. The
+    previous L-BFGS-B search could stop short of the bound on such vectors, wherever the probability clipping
+    flattened the likelihood (e.g. 2.54 instead of 3.0 for two easy, highly discriminating items).
+    """
+    discrimination = np.asarray(discrimination, dtype=float)
+    difficulty = np.asarray(difficulty, dtype=float)
+    guessing = np.asarray(guessing, dtype=float)
+    correct = np.asarray(correct, dtype=float)
+
+    # Perfect and zero scores have no finite maximum; the likelihood is monotone towards the bound
+    if correct.all():
+        return THETA_BOUNDS[1]
+    if not correct.any():
+        return THETA_BOUNDS[0]
+
+    theta = _newton_theta(discrimination, difficulty, guessing, correct)
+    if theta is not None:
+        return theta
 
     result = minimize(
-        log_likelihood,
-        x0=initial_theta,
-        args=(answers,),
+        _negative_log_likelihood,
+        x0=np.array([0.0]),
+        args=(discrimination, difficulty, guessing, correct),
+        jac=True,
         method='L-BFGS-B',
-        bounds=bounds
+        bounds=[THETA_BOUNDS],
     )
-    return result.x[0] if result.success else None
+    return float(result.x[0]) if result.success else None
+
+
+def update_theta(theta, information, discrimination, difficulty, guessing, correct, max_iterations=50, tolerance=1e-7):
+    """
+    Fold new responses into a running estimate without revisiting earlier answers.
+
+    The earlier answers are summarised by a normal approximation centred on ``theta`` with precision
+    ``information``; the new responses are combined with it by maximising the penalised log-likelihood.
+    Returns ``(theta, information)`` for the updated estimate.
+    """
+    discrimination = np.asarray(discrimination, dtype=float)
+    difficulty = np.asarray(difficulty, dtype=float)
+    guessing = np.asarray(guessing, dtype=float)
+    correct = np.asarray(correct, dtype=float)
+
+    if information <= 0:
+        theta = estimate_theta(discrimination, difficulty, guessing, correct)
+        theta = theta if theta is not None else 0
+        return theta, fisher_information(theta, discrimination, difficulty, guessing)
+
+    low, high = THETA_BOUNDS
+    prior_theta = theta
+
+    def objective(value):
+        return log_likelihood(value, discrimination, difficulty, guessing, correct) \
+            - 0.5 * information * (value - prior_theta) ** 2
+
+    current = objective(theta)
+    for _ in range(max_iterations):
+        gradient = log_likelihood_gradient(theta, discrimination, difficulty, guessing, correct) \
+            - information * (theta - prior_theta)
+        hessian = log_likelihood_hessian(theta, discrimination, difficulty, guessing, correct) - information
+
+        step = -gradient / hessian if hessian < 0 else gradient
+        candidate = min(max(theta + step, low), high)
+        candidate_value = objective(candidate)
+
+        while candidate_value < current and abs(candidate - theta) > tolerance:
+            candidate = (theta + candidate) / 2
+            candidate_value = objective(candidate)
+
+        converged = abs(candidate - theta) <= tolerance
+        theta, current = candidate, max(candidate_value, current)
+        if converged:
+            break
+
+    return theta, information + fisher_information(theta, discrimination, difficulty, guessing)
+
+
+def estimate_theta_for_answers(answers):
+    """Estimate theta from ``Answer`` instances (their questions should be select_related)."""
+    item_parameters = np.array([
+        (answer.question.discrimination, answer.question.difficulty, answer.question.guessing, answer.is_correct)
+        for answer in answers
+    ], dtype=float).reshape(-1, 4)
+    return estimate_theta(*item_parameters.T)
+
+
+def load_response_arrays(answers):
+    """
+    Flatten an ``Answer`` queryset into aligned NumPy arrays with a single joined query.
+
+    Returns ``(category_ids, discrimination, difficulty, guessing, correct)``.
+    """
+    rows = np.array(list(answers.values_list(
+        'question__category_id',
+        'question__discrimination',
+        'question__difficulty',
+        'question__guessing',
+        'is_correct',
+    )), dtype=float).reshape(-1, 5)
+    return rows[:, 0].astype(np.int64), rows[:, 1], rows[:, 2], rows[:, 3], rows[:, 4]
+
+
+def _group_by_category(category_ids):
+    """Yield ``(category_id, indices)`` for every distinct category in ``category_ids``."""
+    order = np.argsort(category_ids, kind='stable')
+    sorted_ids = category_ids[order]
+    starts = np.flatnonzero(np.r_[True, np.diff(sorted_ids) != 0]) if len(order) else []
+
+    for start, indices in zip(starts, np.split(order, starts[1:])):
+        yield int(sorted_ids[start]), indices
+
+
+def estimate_abilities_by_category(category_ids, discrimination, difficulty, guessing, correct):
+    """
+    Estimate theta per category from aligned response arrays.
+
+    Returns ``{category_id: (theta, information, answer_count)}``.
+    """
+    abilities = {}
+    for category_id, indices in _group_by_category(category_ids):
+        theta = estimate_theta(discrimination[indices], difficulty[indices], guessing[indices], correct[indices])
+        # Defaulting to 0 instead of "Unable to estimate"
+        theta = theta if theta is not None else 0
+        information = fisher_information(theta, discrimination[indices], difficulty[indices], guessing[indices])
+        abilities[category_id] = (theta, information, len(indices))
+    return abilities
 
 
 def estimate_student_ability_per_category(user_id):
-    """Estimate student ability (theta) per category using the 3PL model and MLE."""
+    """
+    Re-estimate student ability (theta) per category from the full answer history using the 3PL model and MLE.
 
-    print(user_id)
+    This is the repair path; submissions keep ``UserAbility`` current through :func:`update_student_abilities`.
+    """
 
     results = AssessmentResult.objects.filter(user_id=user_id)
     all_answers = Answer.objects.filter(assessment_result__in=results)
 
-    if not all_answers.exists():
+    category_ids, discrimination, difficulty, guessing, correct = load_response_arrays(all_answers)
+
+    if not len(correct):
         return {"error": "Student has not taken any assessments."}
 
-    # Group answers by category
-    categories = {}
-    for answer in all_answers:
-        category = answer.question.category
-        category_key = str(category.name)
-        if category_key not in categories:
-            categories[category_key] = []
-        categories[category_key].append(answer)
-
-    category_abilities = {}
-    for category_name, category_answers in categories.items():
-        theta = estimate_theta_for_answers(category_answers)
-        category_abilities[
-            category_name] = theta if theta is not None else 0  # Defaulting to 0 instead of "Unable to estimate"
-
-    # Optimize category lookup
-    category_objs = {c.name: c for c in Category.objects.filter(name__in=category_abilities.keys())}
-
-    for category_name, ability_level in category_abilities.items():
-        category_obj = category_objs.get(category_name)
-
-        if category_obj:
-            user_ability, created = UserAbility.objects.get_or_create(
-                category=category_obj, user_id=user_id,
-                defaults={"ability_level": ability_level}  # Use the correct field name
+    category_abilities = estimate_abilities_by_category(category_ids, discrimination, difficulty, guessing, correct)
+
+    for category_id, (ability_level, information, answer_count) in category_abilities.items():
+        UserAbility.objects.update_or_create(
+            category_id=category_id, user_id=user_id,
+            defaults={"ability_level": ability_level, "information": information, "answer_count": answer_count}
+        )
+
+
+@timed_function(AI)
+def update_student_abilities(user_id, responses):
+    """
+    Incrementally update ``UserAbility`` for the categories touched by newly graded answers.
+
+    ``responses`` are ``(category_id, discrimination, difficulty, guessing, is_correct)`` rows, already
+    saved as ``Answer`` rows. Only the touched categories are read and written, so the cost depends on the
+    new answers rather than the student's history. Rows written before incremental updates have no
+    ``information`` to weigh the earlier answers by, and a category without a row may still have answers
+    from before; those categories are re-estimated from the full history instead, which seeds the running
+    statistics.
+    """
+    if not responses:
+        return
+
+    rows = np.array(responses, dtype=float).reshape(-1, 5)
+    category_ids = rows[:, 0].astype(np.int64)
+    discrimination, difficulty, guessing, correct = rows[:, 1], rows[:, 2], rows[:, 3], rows[:, 4]
+
+    with transaction.atomic():
+        existing = {
+            ability.category_id: ability
+            for ability in UserAbility.objects.select_for_update().filter(
+                user_id=user_id, category_id__in=set(category_ids.tolist())
             )
-            if not created:  # If the record exists, update it
-                user_ability.ability_level = ability_level
-                user_ability.save()
+        }
+
+        unseeded = [
+            category_id for category_id in set(category_ids.tolist())
+            if category_id not in existing or existing[category_id].information <= 0
+        ]
+        reestimated = estimate_abilities_by_category(*load_response_arrays(Answer.objects.filter(
+            assessment_result__user_id=user_id, question__category_id__in=unseeded,
+        ))) if unseeded else {}
+
+        to_create = []
+        to_update = []
+        for category_id, indices in _group_by_category(category_ids):
+            ability = existing.get(category_id)
+            if ability is None:
+                ability = UserAbility(user_id=user_id, category_id=category_id, ability_level=0.0)
+                to_create.append(ability)
+            else:
+                to_update.append(ability)
+
+            if category_id in reestimated:
+                ability.ability_level, ability.information, ability.answer_count = reestimated[category_id]
+            else:
+                ability.ability_level, ability.information = update_theta(
+                    ability.ability_level, ability.information,
+                    discrimination[indices], difficulty[indices], guessing[indices], correct[indices],
+                )
+                ability.answer_count += len(indices)
+            ability.updated_at = timezone.now()
+
+        UserAbility.objects.bulk_create(to_create)
+        UserAbility.objects.bulk_update(to_update, ['ability_level', 'information', 'answer_count', 'updated_at'])
@@ -0,0 +1,144 @@
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from api.models import Question
+from api.utils.content_version import ITEM_BANK, bump_version, get_version
+from api.utils.metrics import AI, timed_function
+
+
+class ItemBank:
+    """
+    Immutable in-memory index of 3PL item parameters.
+
+    Items are stored in compact NumPy arrays sorted by ``(category_id, difficulty)`` so every category is a
+    contiguous slice. Question text and choices are never loaded; callers fetch only the rows they pick.
+    """
+
+    def __init__(self, version, ids, category_ids, discrimination, difficulty, guessing):
+        order = np.lexsort((difficulty, category_ids))
+
+        self.version = version
+        self.ids = np.asarray(ids, dtype=object)[order]
+        self.category_ids = np.asarray(category_ids, dtype=np.int64)[order]
+        self.discrimination = np.asarray(discrimination, dtype=np.float64)[order]
+        self.difficulty = np.asarray(difficulty, dtype=np.float64)[order]
+        self.guessing = np.asarray(guessing, dtype=np.float64)[order]
+
+        self._positions = {question_id: position for position, question_id in enumerate(self.ids)}
+
+        categories, starts, counts = np.unique(self.category_ids, return_index=True, return_counts=True)
+        self._slices = {
+            int(category_id): slice(int(start), int(start + count))
+            for category_id, start, count in zip(categories, starts, counts)
+        }
+
+    @classmethod
+    def load(cls, version):
+        rows = list(Question.objects.values_list('id', 'category_id', 'discrimination', 'difficulty', 'guessing'))
+        if not rows:
+            return cls(version, [], [], [], [], [])
+        ids, category_ids, discrimination, difficulty, guessing = zip(*rows)
+        return cls(version, ids, category_ids, discrimination, difficulty, guessing)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def category_slice(self, category_id):
+        """Slice of the arrays holding ``category_id`` (empty for unknown categories)."""
+        return self._slices.get(int(category_id), slice(0, 0))
+
+    def count(self, category_ids):
+        return sum(self.category_slice(category_id).stop - self.category_slice(category_id).start
+                   for category_id in set(category_ids))
+
+    def category_items(self, category_id):
+        """``(ids, discrimination, difficulty, guessing)`` views for one category."""
+        items = self.category_slice(category_id)
+        return self.ids[items], self.discrimination[items], self.difficulty[items], self.guessing[items]
+
+    def sample(self, category_ids, count, rng=None):
+        """
+        Draw ``count`` distinct question ids uniformly from the given categories (all items when ``None``).
+
+        Only the drawn positions are generated, so the cost depends on ``count`` rather than the bank size.
+        Returns fewer ids when the categories hold fewer than ``count`` items.
+        """
+        rng = rng or np.random.default_rng()
+
+        if category_ids is None:
+            slices = [slice(0, len(self.ids))]
+        else:
+            slices = [self.category_slice(category_id) for category_id in set(category_ids)]
+        sizes = np.array([item_slice.stop - item_slice.start for item_slice in slices], dtype=np.int64)
+        total = int(sizes.sum())
+
+        count = min(count, total)
+        if count <= 0:
+            return []
+
+        # Map draws over the concatenated slices back onto array positions
+        drawn = rng.choice(total, size=count, replace=False)
+        boundaries = np.cumsum(sizes)
+        owners = np.searchsorted(boundaries, drawn, side='right')
+        starts = np.array([item_slice.start for item_slice in slices], dtype=np.int64)
+        offsets = drawn - (boundaries - sizes)[owners]
+        return list(self.ids[starts[owners] + offsets])
+
+    def positions(self, question_ids):
+        """Array positions of the given question ids; unknown ids are skipped."""
+        return np.array([self._positions[question_id] for question_id in question_ids
+                         if question_id in self._positions], dtype=np.int64)
+
+
+@timed_function(AI)
+def sample_questions(category_ids, count, rng=None):
+    """
+    Draw ``count`` random questions from the given categories (all categories when ``None``).
+
+    Ids come from the cached index and only the chosen rows are fetched, in draw order.
+    """
+    question_ids = get_item_bank().sample(category_ids, count, rng)
+    questions_by_id = Question.objects.in_bulk(question_ids)
+    return [questions_by_id[question_id] for question_id in question_ids if question_id in questions_by_id]
+
+
+_item_bank = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+@timed_function(AI)
+def get_item_bank():
+    """
+    Return the process-wide :class:`ItemBank`, reloading it when the shared version stamp moved.
+
+    The stamp is read at most once every ``ITEM_BANK_VERSION_CHECK_INTERVAL`` seconds, so item selection
+    costs no table scan and, most of the time, no query at all.
+    """
+    global _item_bank, _checked_at
+
+    now = time.monotonic()
+    bank = _item_bank
+    if bank is not None and now - _checked_at < settings.ITEM_BANK_VERSION_CHECK_INTERVAL:
+        return bank
+
+    with _lock:
+        if _item_bank is not None and time.monotonic() - _checked_at < settings.ITEM_BANK_VERSION_CHECK_INTERVAL:
+            return _item_bank
+
+        version = get_version(ITEM_BANK)
+        if _item_bank is None or _item_bank.version != version:
+            _item_bank = ItemBank.load(version)
+        _checked_at = time.monotonic()
+        return _item_bank
+
+
+def invalidate_item_bank():
+    """Bump the shared version stamp after the ``Question`` table changed and drop this process's copy."""
+    global _item_bank
+    bump_version(ITEM_BANK)
+    with _lock:
+        _item_bank = None
@@ -0,0 +1,215 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+from scipy import sparse
+from scipy.optimize import minimize
+
+# Marginal maximum likelihood calibration of 3PL items (Bock-Aitkin EM over a quadrature grid). Only
+# NumPy/SciPy are used here so the M-step can run in plain worker processes.
+
+# Parameter bounds during the M-step
+DISCRIMINATION_BOUNDS = (0.2, 4.0)
+DIFFICULTY_BOUNDS = (-4.0, 4.0)
+GUESSING_BOUNDS = (0.0, 0.5)
+
+# Weak priors keep items with few or extreme responses away from the bounds: log-normal on the
+# discrimination, normal on the difficulty and Beta(5, 17) (mean ~0.23) on the guessing parameter
+LOG_DISCRIMINATION_PRIOR = (0.0, 0.5)
+DIFFICULTY_PRIOR = (0.0, 2.0)
+GUESSING_PRIOR = (5.0, 17.0)
+
+PROBABILITY_EPSILON = 1e-9
+
+
+@dataclass
+class ResponseMatrix:
+    """Sparse persons x items response data; ``answered`` and ``correct`` hold response counts."""
+    answered: sparse.csr_matrix
+    correct: sparse.csr_matrix
+
+    @classmethod
+    def from_arrays(cls, person_indices, item_indices, correct, n_persons, n_items):
+        person_indices = np.asarray(person_indices, dtype=np.int64)
+        item_indices = np.asarray(item_indices, dtype=np.int64)
+        correct = np.asarray(correct, dtype=np.float64)
+        shape = (n_persons, n_items)
+        # Duplicate (person, item) pairs are summed, i.e. treated as independent responses
+        answered = sparse.csr_matrix((np.ones_like(correct), (person_indices, item_indices)), shape=shape)
+        correct = sparse.csr_matrix((correct, (person_indices, item_indices)), shape=shape)
+        return cls(answered, correct)
+
+    @property
+    def responses_per_item(self):
+        return np.asarray(self.answered.sum(axis=0)).ravel()
+
+
+@dataclass
+class CalibrationResult:
+    discrimination: np.ndarray
+    difficulty: np.ndarray
+    guessing: np.ndarray
+    calibrated: np.ndarray  # mask of items whose parameters were estimated
+    iterations: int = 0
+    converged: bool = False
+    log_likelihood: list = field(default_factory=list)
+    max_change: list = field(default_factory=list)
+
+
+def quadrature(points=41, bound=4.0):
+    """Nodes and normalized standard normal weights for the ability distribution."""
+    nodes = np.linspace(-bound, bound, points)
+    weights = np.exp(-0.5 * nodes ** 2)
+    return nodes, weights / weights.sum()
+
+
+def _probabilities(nodes, discrimination, difficulty, guessing):
+    """``(items, nodes)`` matrices of the 3PL probability and the logistic part."""
+    logistic = 1.0 / (1.0 + np.exp(-discrimination[:, None] * (nodes[None, :] - difficulty[:, None])))
+    probability = guessing[:, None] + (1 - guessing[:, None]) * logistic
+    return np.clip(probability, PROBABILITY_EPSILON, 1 - PROBABILITY_EPSILON), logistic
+
+
+def expectation(responses, nodes, weights, discrimination, difficulty, guessing):
+    """
+    E-step: expected answered and correct counts per item and node, and the marginal log-likelihood.
+
+    Person log-likelihoods at every node come from two sparse products, so the cost is linear in the
+    number of responses.
+    """
+    probability, _ = _probabilities(nodes, discrimination, difficulty, guessing)
+    log_probability = np.log(probability)
+    log_complement = np.log1p(-probability)
+
+    wrong = responses.answered - responses.correct
+    log_likelihood = responses.correct @ log_probability + wrong @ log_complement  # persons x nodes
+    log_likelihood += np.log(weights)[None, :]
+
+    peak = log_likelihood.max(axis=1, keepdims=True)
+    posterior = np.exp(log_likelihood - peak)
+    marginal = posterior.sum(axis=1, keepdims=True)
+    posterior /= marginal
+
+    expected_answered = responses.answered.T @ posterior  # items x nodes
+    expected_correct = responses.correct.T @ posterior
+    total = float(np.sum(np.log(marginal) + peak))
+    return np.asarray(expected_answered), np.asarray(expected_correct), total
+
+
+def _negative_objective(parameters, nodes, expected_answered, expected_correct):
+    """Negative expected complete-data log-posterior of a block of items, with its gradient."""
+    discrimination, difficulty, guessing = parameters.reshape(3, -1)
+    probability, logistic = _probabilities(nodes, discrimination, difficulty, guessing)
+
+    expected_wrong = expected_answered - expected_correct
+    value = np.sum(expected_correct * np.log(probability) + expected_wrong * np.log1p(-probability))
+
+    score = (expected_correct - expected_answered * probability) / (probability * (1 - probability))
+    slope = (1 - guessing[:, None]) * logistic * (1 - logistic)
+    distance = nodes[None, :] - difficulty[:, None]
+    gradient_discrimination = np.sum(score * slope * distance, axis=1)
+    gradient_difficulty = -np.sum(score * slope, axis=1) * discrimination
+    gradient_guessing = np.sum(score * (1 - logistic), axis=1)
+
+    prior_mean, prior_sd = LOG_DISCRIMINATION_PRIOR
+    log_discrimination = np.log(discrimination)
+    value += np.sum(-0.5 * ((log_discrimination - prior_mean) / prior_sd) ** 2 - log_discrimination)
+    gradient_discrimination += -(log_discrimination - prior_mean) / (prior_sd ** 2 * discrimination) - 1 / discrimination
+
+    prior_mean, prior_sd = DIFFICULTY_PRIOR
+    value += np.sum(-0.5 * ((difficulty - prior_mean) / prior_sd) ** 2)
+    gradient_difficulty += -(difficulty - prior_mean) / prior_sd ** 2
+
+    alpha, beta = GUESSING_PRIOR
+    clipped_guessing = np.clip(guessing, PROBABILITY_EPSILON, 1 - PROBABILITY_EPSILON)
+    value += np.sum((alpha - 1) * np.log(clipped_guessing) + (beta - 1) * np.log1p(-clipped_guessing))
+    gradient_guessing += (alpha - 1) / clipped_guessing - (beta - 1) / (1 - clipped_guessing)
+
+    gradient = np.concatenate([gradient_discrimination, gradient_difficulty, gradient_guessing])
+    return -value, -gradient
+
+
+def maximize_items(nodes, expected_answered, expected_correct, discrimination, difficulty, guessing,
+                   max_iterations=50):
+    """
+    M-step for a block of items, solved jointly with one bounded L-BFGS-B run.
+
+    Items are independent given the expected counts, so blocks can be handed to separate processes.
+    Returns the updated ``(discrimination, difficulty, guessing)`` arrays.
+    """
+    count = len(discrimination)
+    if not count:
+        return discrimination, difficulty, guessing
+
+    start = np.concatenate([
+        np.clip(discrimination, *DISCRIMINATION_BOUNDS),
+        np.clip(difficulty, *DIFFICULTY_BOUNDS),
+        np.clip(guessing, *GUESSING_BOUNDS),
+    ])
+    bounds = [DISCRIMINATION_BOUNDS] * count + [DIFFICULTY_BOUNDS] * count + [GUESSING_BOUNDS] * count
+
+    result = minimize(
+        _negative_objective, start, args=(nodes, expected_answered, expected_correct),
+        jac=True, method='L-BFGS-B', bounds=bounds, options={'maxiter': max_iterations},
+    )
+    return tuple(result.x.reshape(3, -1))
+
+
+def maximize_block(block):
+    """Worker entry point: ``maximize_items`` over a tuple of its positional arguments."""
+    return maximize_items(*block)
+
+
+def calibrate(responses, discrimination, difficulty, guessing, min_responses=50, max_iterations=100,
+              tolerance=1e-3, quadrature_points=41, map_blocks=None, block_size=500, log=None):
+    """
+    Calibrate 3PL parameters by marginal maximum likelihood.
+
+    ``discrimination``/``difficulty``/``guessing`` are the starting values, aligned with the item
+    columns of ``responses``. Items with fewer than ``min_responses`` responses keep their values
+    but still inform the ability posterior. ``map_blocks`` (e.g. ``executor.map``) distributes the
+    M-step over item blocks. Iterates until no parameter moves more than ``tolerance``.
+    """
+    nodes, weights = quadrature(quadrature_points)
+    discrimination = np.array(discrimination, dtype=np.float64)
+    difficulty = np.array(difficulty, dtype=np.float64)
+    guessing = np.array(guessing, dtype=np.float64)
+
+    calibrated = responses.responses_per_item >= min_responses
+    items = np.flatnonzero(calibrated)
+    result = CalibrationResult(discrimination, difficulty, guessing, calibrated)
+    map_blocks = map_blocks or map
+
+    for iteration in range(1, max_iterations + 1):
+        expected_answered, expected_correct, log_likelihood = expectation(
+            responses, nodes, weights, discrimination, difficulty, guessing,
+        )
+
+        blocks = [items[start:start + block_size] for start in range(0, len(items), block_size)]
+        updates = map_blocks(maximize_block, [
+            (nodes, expected_answered[block], expected_correct[block],
+             discrimination[block], difficulty[block], guessing[block])
+            for block in blocks
+        ])
+
+        max_change = 0.0
+        for block, (new_discrimination, new_difficulty, new_guessing) in zip(blocks, updates):
+            max_change = max(max_change, float(np.max(np.abs(np.concatenate([
+                new_discrimination - discrimination[block],
+                new_difficulty - difficulty[block],
+                new_guessing - guessing[block],
+            ])))))
+            discrimination[block] = new_discrimination
+            difficulty[block] = new_difficulty
+            guessing[block] = new_guessing
+
+        result.iterations = iteration
+        result.log_likelihood.append(log_likelihood)
+        result.max_change.append(max_change)
+        if log:
+            log(iteration, log_likelihood, max_change)
+
+        if max_change < tolerance:
+            result.converged = True
+            break
+
+    return result
@@ -0,0 +1,96 @@
+import copy
+import threading
+
+from asgiref.sync import sync_to_async
+
+from cachetools import TTLCache
+from django.conf import settings
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication
+
+from .models import User
+from .utils.jwt_verifier import verify_token
+
+_identity_cache = None
+_identity_cache_lock = threading.Lock()
+
+
+def _get_identity_cache():
+    global _identity_cache
+    if _identity_cache is None:
+        with _identity_cache_lock:
+            if _identity_cache is None:
+                _identity_cache = TTLCache(
+                    maxsize=settings.USER_IDENTITY_CACHE_SIZE,
+                    ttl=settings.USER_IDENTITY_CACHE_TTL,
+                )
+    return _identity_cache
+
+
+def invalidate_user(supabase_user_id):
+    """Evict a single user snapshot, e.g. after their ``enrolled_class`` changes."""
+    cache = _get_identity_cache()
+    with _identity_cache_lock:
+        cache.pop(supabase_user_id, None)
+
+
+def clear_identity_cache():
+    """Evict every user snapshot, e.g. after a class or teacher changes."""
+    cache = _get_identity_cache()
+    with _identity_cache_lock:
+        cache.clear()
+
+
+def get_user_snapshot(supabase_user_id):
+    """
+    Return the ``User`` for a Supabase user id with ``enrolled_class`` and its teacher already loaded.
+
+    Users are kept in a bounded per-process LRU (with a TTL bounding staleness across workers) and every
+    caller receives its own copy, so views may modify and save the instance freely.
+    """
+    cache = _get_identity_cache()
+
+    with _identity_cache_lock:
+        user = cache.get(supabase_user_id)
+
+    if user is None:
+        user = User.objects.select_related('enrolled_class__teacher').get(supabase_user_id=supabase_user_id)
+        with _identity_cache_lock:
+            cache[supabase_user_id] = user
+
+    return copy.deepcopy(user)
+
+
+class SupabaseAuthentication(BaseAuthentication):
+    """Authenticates ``Authorization: Bearer <jwt>`` requests and sets ``request.user`` to the local ``User``."""
+
+    def authenticate(self, request):
+        token = request.headers.get('Authorization')
+        if not token:
+            return None
+
+        supabase_uid = verify_token(token.split("Bearer ")[-1])
+
+        if not supabase_uid:
+            raise exceptions.AuthenticationFailed('User not authenticated.')
+
+        try:
+            user = get_user_snapshot(supabase_uid)
+        except User.DoesNotExist:
+            raise exceptions.NotFound('User does not exist.')
+
+        return user, supabase_uid
+
+    def authenticate_header(self, request):
+        return 'Bearer'
+
+
+async def authenticate_async(request):
+    """
+    :class:`SupabaseAuthentication` for async views, which DRF cannot serve: returns the ``User`` or raises
+    the same DRF exceptions (``NotAuthenticated`` when there is no token).
+    """
+    result = await sync_to_async(SupabaseAuthentication().authenticate)(request)
+    if result is None:
+        raise exceptions.NotAuthenticated('User not authenticated.')
+    return result[0]
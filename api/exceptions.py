@@ -0,0 +1,17 @@
+from rest_framework.exceptions import NotAuthenticated
+from rest_framework.views import exception_handler
+
+
+def api_exception_handler(exc, context):
+    """Render DRF errors in the ``{'error': message}`` shape every view in this API already returns."""
+    response = exception_handler(exc, context)
+
+    if response is None:
+        return None
+
+    if isinstance(exc, NotAuthenticated):
+        response.data = {'error': 'User not authenticated.'}
+    elif isinstance(response.data, dict) and 'detail' in response.data:
+        response.data = {'error': response.data['detail']}
+
+    return response
@@ -0,0 +1,309 @@
+"""
+A durable background job queue kept in the ``Job`` table, so it needs no broker.
+
+Register a handler with :func:`job`, call :func:`enqueue` (inside the request's transaction, so the job
+commits or rolls back with the data it refers to) and run ``manage.py run_worker``. Without a worker
+(``JOBS_ENABLED`` off) nothing is queued and handlers run in the calling process instead. Workers claim jobs
+with ``SELECT ... FOR UPDATE SKIP LOCKED`` where the database supports it and with a conditional
+``UPDATE`` otherwise (SQLite). A handler runs in the same transaction as the update that marks its job
+done, so database work takes effect exactly once: a worker that dies or loses its lock rolls it back
+and the job runs again. Failed jobs are retried with exponential backoff up to ``max_attempts``.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .ai.estimate_student_ability import update_student_abilities
+from .models import AssessmentResult, Job
+from .utils.assessment_results import store_result_document
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+
+class LockLost(Exception):
+    """The job's lock expired and another worker took it over while it ran."""
+
+
+def job(name):
+    """Register the decorated function as the handler of jobs called ``name``; it receives the payload as kwargs."""
+    def decorator(function):
+        _handlers[name] = function
+        return function
+    return decorator
+
+
+def enqueue(name, payload=None, *, priority=0, dedupe_key=None, delay=None, max_attempts=None):
+    """
+    Queue a job and return it.
+
+    With a ``dedupe_key``, a job with the same key that is still queued is returned instead of a new one.
+    With ``JOBS_ENABLED`` off, the handler runs in this process once the current transaction commits
+    and ``None`` is returned.
+    """
+    if name not in _handlers:
+        raise ValueError(f'No job handler registered for "{name}".')
+    if not settings.JOBS_ENABLED:
+        transaction.on_commit(lambda: run_inline(name, payload or {}))
+        return None
+
+    new_job = Job(
+        name=name,
+        payload=payload or {},
+        priority=priority,
+        dedupe_key=dedupe_key,
+        max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+        run_after=timezone.now() + (delay or timedelta()),
+    )
+    if dedupe_key is None:
+        new_job.save()
+        return new_job
+
+    try:
+        with transaction.atomic():
+            new_job.save()
+        return new_job
+    except IntegrityError:
+        existing = Job.objects.filter(dedupe_key=dedupe_key, status=Job.QUEUED).first()
+        if existing is None:
+            # The queued duplicate was claimed in the meantime; queue this one after all
+            return enqueue(name, payload, priority=priority, dedupe_key=dedupe_key, delay=delay,
+                           max_attempts=max_attempts)
+        return existing
+
+
+def run_inline(name, payload):
+    """Run a handler without the queue; a failure is logged rather than retried, like the work before jobs."""
+    try:
+        with transaction.atomic():
+            _handlers[name](**payload)
+    except Exception:
+        logger.exception('Inline job %s %s failed', name, payload)
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next attempt: exponential backoff with jitter, capped."""
+    delay = min(settings.JOBS_RETRY_BASE_DELAY * 2 ** (attempts - 1), settings.JOBS_RETRY_MAX_DELAY)
+    return delay * random.uniform(1.0, 1.25)
+
+
+def claim_jobs(worker_id, limit=1, names=None):
+    """Lock up to ``limit`` due jobs for ``worker_id``, highest priority first, and mark them running."""
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.QUEUED, run_after__lte=now).order_by('-priority', 'run_after', 'id')
+    if names:
+        due = due.filter(name__in=names)
+    claimed = {'status': Job.RUNNING, 'locked_by': worker_id, 'locked_at': now, 'attempts': F('attempts') + 1}
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(due.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            Job.objects.filter(id__in=ids).update(**claimed)
+    else:
+        # Without row locks, a conditional UPDATE decides: a job another worker claimed first updates no row
+        ids = []
+        for job_id in due.values_list('id', flat=True)[:limit * 4]:
+            if Job.objects.filter(id=job_id, status=Job.QUEUED).update(**claimed):
+                ids.append(job_id)
+                if len(ids) == limit:
+                    break
+
+    return list(Job.objects.filter(id__in=ids).order_by('-priority', 'run_after', 'id'))
+
+
+def _requeue(jobs, **fields):
+    try:
+        with transaction.atomic():
+            return jobs.update(status=Job.QUEUED, locked_by=None, locked_at=None, **fields)
+    except IntegrityError:
+        # A job with the same dedupe key was queued meanwhile and does the same work
+        return jobs.update(
+            status=Job.FAILED, locked_by=None, locked_at=None, finished_at=timezone.now(),
+            last_error=fields.get('last_error', '') + '\nSuperseded by a queued job with the same dedupe key.',
+        )
+
+
+def run_job(job_instance):
+    """Run a claimed job and record the outcome; returns ``True`` when it succeeded."""
+    handler = _handlers.get(job_instance.name)
+    try:
+        if handler is None:
+            raise LookupError(f'No job handler registered for "{job_instance.name}".')
+        with transaction.atomic():
+            handler(**job_instance.payload)
+            finished = Job.objects.filter(
+                id=job_instance.id, status=Job.RUNNING, locked_by=job_instance.locked_by,
+            ).update(status=Job.DONE, locked_by=None, locked_at=None, finished_at=timezone.now(), last_error='')
+            if not finished:
+                raise LockLost(f'Job {job_instance.id} was taken over by another worker.')
+        return True
+    except LockLost:
+        return False
+    except Exception:
+        error = traceback.format_exc()
+        logger.error('Job %s failed (attempt %s/%s)', job_instance, job_instance.attempts, job_instance.max_attempts,
+                     exc_info=True)
+
+        owned = Job.objects.filter(id=job_instance.id, status=Job.RUNNING, locked_by=job_instance.locked_by)
+        if handler is None or job_instance.attempts >= job_instance.max_attempts:
+            owned.update(status=Job.FAILED, locked_by=None, locked_at=None, finished_at=timezone.now(),
+                         last_error=error)
+        else:
+            _requeue(owned, last_error=error,
+                     run_after=timezone.now() + timedelta(seconds=retry_delay(job_instance.attempts)))
+        return False
+
+
+def requeue_stale_jobs():
+    """Hand jobs whose worker stopped renewing its lock (it died mid-job) back to the queue."""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT)
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff)
+    error = 'The worker running this job stopped before finishing it.'
+
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, locked_by=None, locked_at=None, finished_at=timezone.now(), last_error=error,
+    )
+    # One by one: a dedupe key conflict only affects its own job
+    return sum(_requeue(stale.filter(id=job_id), last_error=error) for job_id in stale.values_list('id', flat=True))
+
+
+def delete_finished_jobs():
+    """Delete jobs that finished more than ``JOBS_KEEP_FINISHED_DAYS`` ago."""
+    cutoff = timezone.now() - timedelta(days=settings.JOBS_KEEP_FINISHED_DAYS)
+    deleted, _ = Job.objects.filter(status__in=[Job.DONE, Job.FAILED], finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def run_pending(names=None, worker_id='inline'):
+    """Run every due job in this thread until none is left (tests, scripts and ``run_worker --burst``)."""
+    processed = 0
+    while jobs := claim_jobs(worker_id, names=names):
+        for claimed in jobs:
+            run_job(claimed)
+            processed += 1
+    return processed
+
+
+class Worker:
+    """
+    Runs jobs on ``threads`` threads until :meth:`stop` is called.
+
+    Each thread claims one job at a time, so a slow job never holds back jobs another thread could run.
+    Idle threads poll every ``poll_interval`` seconds and occasionally requeue stale jobs and delete old
+    finished ones. A heartbeat thread renews the locks of running jobs so long jobs are not taken for
+    stale. With ``burst``, threads exit once no job is due.
+    """
+
+    def __init__(self, threads=1, names=None, poll_interval=None, burst=False, log=print):
+        self.threads = threads
+        self.names = names
+        self.poll_interval = settings.JOBS_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.burst = burst
+        self.log = log
+        self.processed = 0
+        self.failed = 0
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._maintained_at = 0.0
+        self._running = {}  # job id -> worker id
+
+    def stop(self):
+        self._stopping.set()
+
+    def _maintain(self):
+        with self._lock:
+            if time.monotonic() - self._maintained_at < settings.JOBS_MAINTENANCE_INTERVAL:
+                return
+            self._maintained_at = time.monotonic()
+        requeued = requeue_stale_jobs()
+        deleted = delete_finished_jobs()
+        if requeued or deleted:
+            self.log(f'Requeued {requeued} stale jobs, deleted {deleted} finished jobs')
+
+    def _loop(self, worker_id):
+        try:
+            while not self._stopping.is_set():
+                close_old_connections()
+                jobs = claim_jobs(worker_id, names=self.names)
+                if not jobs:
+                    self._maintain()
+                    if self.burst:
+                        return
+                    self._stopping.wait(self.poll_interval)
+                    continue
+
+                for claimed in jobs:
+                    with self._lock:
+                        self._running[claimed.id] = worker_id
+                    succeeded = False
+                    try:
+                        succeeded = run_job(claimed)
+                    finally:
+                        with self._lock:
+                            del self._running[claimed.id]
+                            self.processed += 1
+                            self.failed += not succeeded
+        finally:
+            connection.close()
+
+    def _heartbeat(self):
+        try:
+            while not self._stopping.wait(settings.JOBS_LOCK_TIMEOUT / 3):
+                with self._lock:
+                    running = dict(self._running)
+                for job_id, worker_id in running.items():
+                    Job.objects.filter(id=job_id, status=Job.RUNNING, locked_by=worker_id).update(
+                        locked_at=timezone.now())
+        finally:
+            connection.close()
+
+    def run(self):
+        prefix = f'{socket.gethostname()}:{os.getpid()}'
+        workers = [
+            threading.Thread(target=self._loop, args=(f'{prefix}:{index}',), name=f'job-worker-{index}', daemon=True)
+            for index in range(self.threads)
+        ]
+        for thread in workers:
+            thread.start()
+        heartbeat = threading.Thread(target=self._heartbeat, name='job-worker-heartbeat', daemon=True)
+        heartbeat.start()
+
+        for thread in workers:
+            # Wake up regularly so signals reach the main thread
+            while thread.is_alive():
+                thread.join(timeout=0.5)
+        self.stop()
+        heartbeat.join()
+        return self.processed
+
+
+# Handlers
+
+
+@job('finish_submission')
+def finish_submission(assessment_result_id):
+    """Post-submit work of a graded assessment: update the student's abilities and build the results payload."""
+    assessment_result = AssessmentResult.objects.get(id=assessment_result_id)
+    answers = assessment_result.answers.select_related('question')
+    update_student_abilities(assessment_result.user_id, [
+        (answer.question.category_id, answer.question.discrimination, answer.question.difficulty,
+         answer.question.guessing, answer.is_correct)
+        for answer in answers
+    ])
+    store_result_document(assessment_result, total_questions=assessment_result.total_items)
+
+
+def enqueue_finish_submission(assessment_result):
+    # Students open their results right after submitting, so this goes ahead of bulk work
+    return enqueue('finish_submission', {'assessment_result_id': assessment_result.id}, priority=10)
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from api.models import AssessmentResult
+from api.utils.assessment_results import fill_result_tallies
+
+
+class Command(BaseCommand):
+    help = 'Fills the per-category tallies, item counts and submit dates of results graded before they were stored'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Results filled per round of queries')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        filled = 0
+        last_id = 0
+
+        while True:
+            # Walk by primary key so rows filled by this run (or concurrently by history reads) are not revisited
+            batch = list(
+                AssessmentResult.objects.filter(category_tallies__isnull=True, id__gt=last_id)
+                .only('id', 'assessment_id', 'category_tallies', 'total_items', 'submitted_at')
+                .order_by('id')[:batch_size]
+            )
+            if not batch:
+                break
+
+            fill_result_tallies(batch)
+            filled += len(batch)
+            last_id = batch[-1].id
+
+        self.stdout.write(self.style.SUCCESS(f'Filled tallies for {filled} results'))
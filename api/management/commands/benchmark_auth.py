@@ -0,0 +1,191 @@
+import base64
+import hashlib
+import hmac
+import json
+import statistics
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from api.utils import jwt_verifier
+
+BENCHMARK_SECRET = 'benchmark-secret'
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def make_token(sub, secret=BENCHMARK_SECRET, ttl=3600):
+    header = _b64encode(json.dumps({'alg': 'HS256', 'typ': 'JWT'}).encode())
+    payload = _b64encode(json.dumps({
+        'sub': sub,
+        'aud': 'authenticated',
+        'role': 'authenticated',
+        'exp': int(time.time()) + ttl,
+    }).encode())
+    signature = hmac.new(secret.encode(), f'{header}.{payload}'.encode(), hashlib.sha256).digest()
+    return f'{header}.{payload}.{_b64encode(signature)}'
+
+
+def _stub_user(sub, email=None):
+    return {
+        'id': sub,
+        'aud': 'authenticated',
+        'email': email,
+        'app_metadata': {},
+        'user_metadata': {},
+        'created_at': '2024-01-01T00:00:00Z',
+    }
+
+
+def start_stub_auth_server(latency=0.0):
+    """
+    Serve a minimal GoTrue on a free local port: ``GET``/``PUT /auth/v1/user``, ``POST /auth/v1/signup``,
+    ``POST /auth/v1/token`` (password and refresh_token grants) and ``POST /auth/v1/logout``.
+
+    ``server.connections`` counts the TCP connections accepted, to measure connection reuse, and
+    ``server.peak_in_flight`` the most requests it was serving at once.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body go out in separate writes; with Nagle on, keep-alive clients stall on delayed ACKs
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            super().setup()
+            with server.lock:
+                server.connections += 1
+
+        def _send(self, status, payload=None):
+            body = json.dumps(payload).encode() if payload is not None else b''
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_json(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return json.loads(self.rfile.read(length)) if length else {}
+
+        def _bearer_sub(self):
+            token = self.headers.get('Authorization', '').split('Bearer ')[-1]
+            return json.loads(jwt_verifier._b64decode(token.split('.')[1]))['sub']
+
+        def _session(self, sub, email=None):
+            return {
+                'access_token': make_token(sub),
+                'refresh_token': f'refresh-{sub}',
+                'expires_in': 3600,
+                'token_type': 'bearer',
+                'user': _stub_user(sub, email),
+            }
+
+        def _route(self):
+            path = self.path.split('?')[0]
+            if self.command in ('GET', 'PUT'):
+                self._read_json()
+                return 200, _stub_user(self._bearer_sub())
+            data = self._read_json()
+            if path == '/auth/v1/logout':
+                return 204, None
+            if path == '/auth/v1/token' and 'refresh_token' in data:
+                return 200, self._session(data['refresh_token'].removeprefix('refresh-'))
+            # Password sign-in and sign-up: derive a stable user id from the email
+            email = data.get('email', '')
+            return 200, self._session(str(uuid.uuid5(uuid.NAMESPACE_URL, email)), email)
+
+        def _serve(self):
+            with server.lock:
+                server.in_flight += 1
+                server.peak_in_flight = max(server.peak_in_flight, server.in_flight)
+            try:
+                if latency:
+                    time.sleep(latency)
+                self._send(*self._route())
+            finally:
+                with server.lock:
+                    server.in_flight -= 1
+
+        do_GET = do_PUT = do_POST = _serve
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        request_queue_size = 1024  # load tests open hundreds of connections at once
+
+    server = Server(('127.0.0.1', 0), Handler)
+    server.connections = 0
+    server.in_flight = 0
+    server.peak_in_flight = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks per-request auth overhead of remote token checks against local JWT verification'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+        parser.add_argument('--tokens', type=int, default=20, help='Distinct tokens cycled through')
+        parser.add_argument('--remote-latency-ms', type=float, default=0.0,
+                            help='Extra latency added by the stub server to mimic the Supabase round trip')
+
+    def _measure(self, tokens, requests, clear_cache):
+        timings = []
+        for i in range(requests):
+            if clear_cache:
+                jwt_verifier.clear_claims_cache()
+            token = tokens[i % len(tokens)]
+            start = time.perf_counter()
+            sub = jwt_verifier.verify_token(token)
+            timings.append((time.perf_counter() - start) * 1000)
+            assert sub is not None, 'benchmark token was rejected'
+        timings.sort()
+        return {
+            'mean_ms': statistics.fmean(timings),
+            'p50_ms': timings[len(timings) // 2],
+            'p95_ms': timings[int(len(timings) * 0.95) - 1],
+        }
+
+    def handle(self, *args, **options):
+        server = start_stub_auth_server(options['remote_latency_ms'] / 1000)
+        host, port = server.server_address
+        tokens = [make_token(f'00000000-0000-0000-0000-{i:012d}') for i in range(options['tokens'])]
+
+        common = {
+            'SUPABASE_URL': f'http://{host}:{port}',
+            'SUPABASE_ANON_KEY': make_token('anon'),
+            'SUPABASE_JWT_SECRET': BENCHMARK_SECRET,
+            'SUPABASE_JWKS_URL': None,
+        }
+        scenarios = [
+            ('remote auth.get_user (before)', {'SUPABASE_AUTH_VERIFY_LOCALLY': False}, True),
+            ('local verification, cold cache', {'SUPABASE_AUTH_VERIFY_LOCALLY': True}, True),
+            ('local verification, warm cache', {'SUPABASE_AUTH_VERIFY_LOCALLY': True}, False),
+        ]
+
+        try:
+            results = []
+            for name, overrides, clear_cache in scenarios:
+                with override_settings(**common, **overrides):
+                    jwt_verifier.clear_claims_cache()
+                    results.append((name, self._measure(tokens, options['requests'], clear_cache)))
+        finally:
+            server.shutdown()
+            jwt_verifier.clear_claims_cache()
+
+        baseline = results[0][1]['mean_ms']
+        for name, stats in results:
+            self.stdout.write(
+                f"{name:<34} mean {stats['mean_ms']:8.3f} ms  p50 {stats['p50_ms']:8.3f} ms  "
+                f"p95 {stats['p95_ms']:8.3f} ms  speedup x{baseline / stats['mean_ms']:.1f}"
+            )
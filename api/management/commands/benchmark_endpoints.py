@@ -0,0 +1,353 @@
+import contextlib
+import io
+import json
+import math
+import platform
+import statistics
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import timedelta
+
+import django
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import URLPattern
+from django.utils import timezone
+
+from api.authentication import clear_identity_cache
+from api.management.commands.benchmark_auth import BENCHMARK_SECRET, make_token
+from api.models import Assessment, AssessmentProgress, AssessmentResult, Chapter, Class, Lesson, Question, User
+from api.urls import urlpatterns
+from api.utils.jwt_verifier import clear_claims_cache
+from api.utils.synthetic import SCALES, seed_population
+
+# Routes that cannot be exercised against a local database, and why
+EXCLUDED_ROUTES = {
+    'register_user': 'Supabase sign-up round trip',
+    'login_user': 'Supabase sign-in round trip',
+    'logout_user': 'Supabase sign-out round trip',
+    'refresh_token': 'Supabase session refresh round trip',
+    'update_password': 'Supabase user update round trip',
+    'take_lesson_quiz': 'shadowed by student/quiz/<assessment_id>',
+}
+
+
+@dataclass(frozen=True)
+class Scenario:
+    route: str
+    method: str
+    path: str  # formatted with the probe context
+    role: str = 'student'  # student, newcomer or teacher
+    data: object = None  # callable(context) -> request data
+    prepare: object = None  # callable(command, client, context) -> extra context, run untimed
+    mutates: bool = False  # run every call in a rolled back transaction
+    status: int = 200
+
+
+def _answers(question_ids):
+    return {
+        'answers': [{'question_id': question_id, 'answer': 'Choice A', 'time_spent': 20} for question_id in question_ids],
+        'total_time_taken_seconds': 20 * len(question_ids),
+    }
+
+
+def _start_adaptive(command, client, context):
+    response = command.call(client, 'post', '/api/student/adaptive/start', 'student',
+                            {'category_id': context['category_id']})
+    data = response.json()
+    return {'adaptive_id': data['assessment_id'], 'adaptive_question_id': data['question']['question_id']}
+
+
+SCENARIOS = [
+    Scenario('get_user_details', 'get', '/api/profile/'),
+    Scenario('get_student_class', 'get', '/api/student/class'),
+    Scenario('join_class', 'post', '/api/student/class/join', role='newcomer', mutates=True,
+             data=lambda context: {'class_code': context['class_code']}),
+    Scenario('get_initial_exam', 'get', '/api/student/initial-exam'),
+    Scenario('take_initial_exam', 'get', '/api/student/take-initial-exam'),
+    Scenario('initial_exam_taken', 'get', '/api/student/initial-exam-taken'),
+    Scenario('check_time_limit', 'get', '/api/student/assessment/{initial_exam_id}/time-limit'),
+    Scenario('take_exam', 'get', '/api/student/exam/take', mutates=True),
+    Scenario('submit_exam', 'post', '/api/student/exam/{pending_quiz_id}/submit', mutates=True, status=201,
+             data=lambda context: _answers(context['pending_question_ids'])),
+    Scenario('get_exam_results', 'get', '/api/student/exam/{taken_quiz_id}'),
+    Scenario('get_student_abilities', 'get', '/api/student/ability'),
+    Scenario('get_student_history', 'get', '/api/student/history'),
+    Scenario('take_quiz', 'post', '/api/student/quiz/take', mutates=True,
+             data=lambda context: {'selected_categories': [context['category_id']], 'no_of_questions': 5,
+                                   'question_source': 'previous_exam'}),
+    Scenario('submit_quiz', 'post', '/api/student/quiz/{pending_quiz_id}/submit', mutates=True, status=201,
+             data=lambda context: _answers(context['pending_question_ids'])),
+    Scenario('get_quiz_results', 'get', '/api/student/quiz/{taken_quiz_id}'),
+    Scenario('start_adaptive_test', 'post', '/api/student/adaptive/start', mutates=True, status=201,
+             data=lambda context: {'category_id': context['category_id']}),
+    Scenario('get_adaptive_item', 'get', '/api/student/adaptive/{adaptive_id}', mutates=True,
+             prepare=_start_adaptive),
+    Scenario('answer_adaptive_item', 'post', '/api/student/adaptive/{adaptive_id}/answer', mutates=True,
+             prepare=_start_adaptive,
+             data=lambda context: {'question_id': context['adaptive_question_id'], 'answer': 'Choice A',
+                                   'time_spent': 20}),
+    Scenario('get_class_quizzes', 'get', '/api/student/class/assessments'),
+    Scenario('get_lessons_overall', 'get', '/api/lessons'),
+    Scenario('update_lesson_progress', 'post', '/api/lessons/{lesson_id}/update_progress', mutates=True,
+             data=lambda context: {'chapter_id': context['chapter_id']}),
+    Scenario('get_lesson', 'get', '/api/lessons/{lesson_id}'),
+    Scenario('get_classes', 'get', '/api/teacher/classes', role='teacher'),
+    Scenario('create_class', 'post', '/api/teacher/class/create', role='teacher', mutates=True, status=201,
+             data=lambda context: {'class_name': 'Benchmark class'}),
+    Scenario('get_student_data', 'get', '/api/teacher/class/student/{student_id}', role='teacher'),
+    Scenario('get_all_questions', 'get', '/api/teacher/get_questions', role='teacher'),
+    Scenario('create_quiz', 'post', '/api/teacher/class/{class_id}/create-quiz', role='teacher', mutates=True,
+             data=lambda context: {'name': 'Benchmark quiz', 'question_source': 'previous_exam',
+                                   'questions': context['category_question_ids']}),
+    Scenario('get_initial_exam', 'get', '/api/teacher/class/{class_id}/view-initial-exam', role='teacher'),
+    Scenario('open_initial_exam', 'post', '/api/teacher/class/{class_id}/open-initial-exam', role='teacher',
+             mutates=True, data=lambda context: {'deadline': context['deadline']}),
+    Scenario('get_all_quizzes', 'get', '/api/teacher/class/{class_id}/assessments', role='teacher'),
+    Scenario('get_class_assessment', 'get', '/api/teacher/class/{class_id}/assessment/{taken_quiz_id}',
+             role='teacher'),
+    Scenario('get_class_gradebook', 'get', '/api/teacher/class/{class_id}/gradebook', role='teacher'),
+    Scenario('export_class_results', 'get', '/api/teacher/class/{class_id}/export', role='teacher'),
+    Scenario('export_assessment_results', 'get', '/api/teacher/class/{class_id}/assessment/{taken_quiz_id}/export',
+             role='teacher'),
+    Scenario('get_teacher_class', 'get', '/api/teacher/class/{class_id}', role='teacher'),
+]
+
+
+def _percentile(timings, fraction):
+    """Nearest-rank percentile of an ascending list."""
+    return timings[max(0, math.ceil(fraction * len(timings)) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Seeds synthetic data at several scales in a throwaway test database and records latency, '
+            'query count and peak memory of every API route')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', dest='scales', action='append', choices=sorted(SCALES),
+                            help='Data scale to benchmark (repeatable; default: small and medium)')
+        parser.add_argument('--route', dest='routes', action='append', default=[],
+                            help='Only benchmark this url name (repeatable)')
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per route')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per route before timing')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic data')
+        parser.add_argument('--output', default='benchmark-endpoints.json', help='Where to write the JSON results')
+        parser.add_argument('--baseline', help='Earlier JSON results to compare against')
+
+    def call(self, client, method, path, role, data=None):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {self.tokens[role]}'}
+        if method == 'get':
+            response = client.get(path, data, **headers)
+        else:
+            response = client.post(path, data or {}, content_type='application/json', **headers)
+        return response
+
+    def _probe(self):
+        """Pick the rows every scenario runs against, and set up the state the mutating ones need."""
+        class_obj = Class.objects.select_related('teacher').order_by('id').first()
+        student = User.objects.filter(enrolled_class=class_obj).annotate(
+            taken=Count('assessmentresult')).order_by('-taken', 'id').first()
+
+        quizzes = list(Assessment.objects.filter(class_owner=class_obj, is_initial=False).order_by('id')
+                       .values_list('id', flat=True))
+        if len(quizzes) < 2:
+            raise CommandError('The benchmark needs at least two quizzes per class.')
+        pending_quiz_id = quizzes[-1]
+        # The last quiz is left for the submit scenarios
+        AssessmentResult.objects.filter(user=student, assessment_id=pending_quiz_id).delete()
+        taken_quiz_id = AssessmentResult.objects.filter(user=student, assessment_id__in=quizzes[:-1]).order_by(
+            'assessment_id').values_list('assessment_id', flat=True).first()
+        if taken_quiz_id is None:
+            raise CommandError('The benchmark student has not taken any quiz; use a larger scale.')
+
+        initial_exam = Assessment.objects.get(class_owner=class_obj, is_initial=True)
+        AssessmentProgress.objects.get_or_create(assessment=initial_exam, user=student)
+
+        newcomer = User.objects.create(supabase_user_id='benchmark-newcomer', email='benchmark-newcomer@example.com',
+                                       first_name='New', last_name='Comer', role=User.STUDENT)
+
+        lesson = Lesson.objects.order_by('id').first()
+        chapter = Chapter.objects.filter(lesson=lesson).order_by('chapter_number').last()
+        category_id = Question.objects.order_by('category_id').values_list('category_id', flat=True).first()
+
+        self.tokens = {
+            'student': make_token(student.supabase_user_id, secret=BENCHMARK_SECRET),
+            'newcomer': make_token(newcomer.supabase_user_id, secret=BENCHMARK_SECRET),
+            'teacher': make_token(class_obj.teacher.supabase_user_id, secret=BENCHMARK_SECRET),
+        }
+        return {
+            'class_id': class_obj.id,
+            'class_code': class_obj.class_code,
+            'student_id': student.id,
+            'initial_exam_id': initial_exam.id,
+            'taken_quiz_id': taken_quiz_id,
+            'pending_quiz_id': pending_quiz_id,
+            'pending_question_ids': list(Question.objects.filter(assessments=pending_quiz_id)
+                                         .values_list('id', flat=True)),
+            'lesson_id': lesson.id,
+            'chapter_id': chapter.id,
+            'category_id': category_id,
+            'category_question_ids': list(Question.objects.filter(category_id=category_id).order_by('id')
+                                          .values_list('id', flat=True)[:10]),
+            'deadline': (timezone.now() + timedelta(days=7)).isoformat(),
+        }
+
+    def _request(self, client, scenario, context):
+        """One request of ``scenario``, body included; returns ``(response, body size, elapsed seconds)``."""
+        if scenario.prepare:
+            context = {**context, **scenario.prepare(self, client, context)}
+        path = scenario.path.format(**context)
+        data = scenario.data(context) if scenario.data else None
+
+        start = time.perf_counter()
+        response = self.call(client, scenario.method, path, scenario.role, data)
+        if response.streaming:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            size = len(response.content)
+        return response, size, time.perf_counter() - start
+
+    @contextlib.contextmanager
+    def _isolated(self, scenario):
+        """Roll back whatever a mutating scenario wrote so every call sees the same data."""
+        if not scenario.mutates:
+            yield
+            return
+        with transaction.atomic():
+            yield
+            transaction.set_rollback(True)
+        # Cached users and payloads may describe rows that were just rolled back
+        clear_identity_cache()
+        cache.clear()
+
+    def _run(self, client, scenario, context, iterations, warmup):
+        timings = []
+        for iteration in range(warmup + iterations):
+            with self._isolated(scenario):
+                _, _, elapsed = self._request(client, scenario, context)
+            if iteration >= warmup:
+                timings.append(elapsed * 1000)
+
+        # Queries and memory are measured on a separate call so tracing does not skew the timings
+        with self._isolated(scenario):
+            with CaptureQueriesContext(connection) as queries:
+                tracemalloc.start()
+                try:
+                    response, size, _ = self._request(client, scenario, context)
+                    _, peak = tracemalloc.get_traced_memory()
+                finally:
+                    tracemalloc.stop()
+
+        timings.sort()
+        return {
+            'route': scenario.route,
+            'method': scenario.method.upper(),
+            'path': scenario.path,
+            'status': response.status_code,
+            'expected_status': scenario.status,
+            'p50_ms': round(_percentile(timings, 0.50), 3),
+            'p95_ms': round(_percentile(timings, 0.95), 3),
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'queries': len(queries),
+            'peak_memory_kib': round(peak / 1024, 1),
+            'response_bytes': size,
+        }
+
+    def _benchmark_scale(self, name, options, scenarios):
+        call_command('flush', interactive=False, verbosity=0)
+        clear_identity_cache()
+        clear_claims_cache()
+        cache.clear()
+
+        start = time.perf_counter()
+        population = seed_population(SCALES[name], seed=options['seed'])
+        self.stdout.write(f"\n[{name}] seeded in {time.perf_counter() - start:.1f}s: " + ', '.join(
+            f'{count} {table}' for table, count in population.as_dict().items()))
+
+        context = self._probe()
+        client = Client()
+        endpoints = []
+        for scenario in scenarios:
+            # Views print debugging output; keep it out of the report
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = self._run(client, scenario, context, options['iterations'], options['warmup'])
+            endpoints.append(result)
+            self._write_row(result)
+
+        return {'population': population.as_dict(), 'endpoints': endpoints}
+
+    def _write_row(self, result, baseline=None):
+        line = (f"  {result['method']:<4} {result['route']:<28} p50 {result['p50_ms']:9.2f} ms  "
+                f"p95 {result['p95_ms']:9.2f} ms  {result['queries']:4d} queries  "
+                f"{result['peak_memory_kib']:9.1f} KiB")
+        if baseline:
+            line += (f"  p50 x{result['p50_ms'] / max(baseline['p50_ms'], 1e-6):.2f}, "
+                     f"queries {result['queries'] - baseline['queries']:+d}")
+        if result['status'] != result['expected_status']:
+            line = self.style.WARNING(f"{line}  status {result['status']}")
+        self.stdout.write(line)
+
+    def _compare(self, results, baseline_path):
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)
+
+        self.stdout.write(f'\nCompared with {baseline_path}:')
+        for name, scale in results['scales'].items():
+            previous = {endpoint['route']: endpoint
+                        for endpoint in baseline.get('scales', {}).get(name, {}).get('endpoints', [])}
+            if not previous:
+                continue
+            self.stdout.write(f'[{name}]')
+            for endpoint in scale['endpoints']:
+                if endpoint['route'] in previous:
+                    self._write_row(endpoint, previous[endpoint['route']])
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1.')
+
+        names = {pattern.name for pattern in urlpatterns if isinstance(pattern, URLPattern)}
+        missing = names - {scenario.route for scenario in SCENARIOS} - set(EXCLUDED_ROUTES)
+        if missing:
+            raise CommandError(f"Routes without a benchmark scenario: {', '.join(sorted(missing))}")
+
+        scenarios = [scenario for scenario in SCENARIOS if not options['routes'] or scenario.route in options['routes']]
+        scales = options['scales'] or ['small', 'medium']
+
+        results = {
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'seed': options['seed'],
+            'iterations': options['iterations'],
+            'excluded_routes': EXCLUDED_ROUTES,
+            'scales': {},
+        }
+
+        old_name = connection.settings_dict['NAME']
+        setup_test_environment()
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(SUPABASE_JWT_SECRET=BENCHMARK_SECRET, SUPABASE_JWKS_URL=None,
+                                   SUPABASE_AUTH_VERIFY_LOCALLY=True, SUPABASE_AUTH_REMOTE_FALLBACK=False):
+                for name in scales:
+                    results['scales'][name] = self._benchmark_scale(name, options, scenarios)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            clear_identity_cache()
+            clear_claims_cache()
+
+        with open(options['output'], 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"\nResults written to {options['output']}"))
+
+        if options['baseline']:
+            self._compare(results, options['baseline'])
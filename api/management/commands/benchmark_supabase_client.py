@@ -0,0 +1,86 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from supabase import ClientOptions, create_client
+
+from api.utils import supabase_client
+
+from .benchmark_auth import make_token, start_stub_auth_server
+
+
+def _client_per_call():
+    # What get_supabase_client did before the pool: a new client, and new connections, on every call. Token
+    # auto-refresh is off, otherwise every sign-in leaves a refresh timer thread behind that blocks exit.
+    return create_client(settings.SUPABASE_URL, settings.SUPABASE_ANON_KEY,
+                         options=ClientOptions(auto_refresh_token=False, persist_session=False))
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks Supabase auth calls with a client per call against the pooled client, on a local stub server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300, help='Calls per scenario')
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent callers, like threaded workers')
+        parser.add_argument('--max-connections', type=int, default=20,
+                            help='SUPABASE_HTTP_MAX_CONNECTIONS of the pooled scenario')
+        parser.add_argument('--remote-latency-ms', type=float, default=0.0,
+                            help='Extra latency added by the stub server to mimic the Supabase round trip')
+
+    def _call(self, get_client, i):
+        # A login followed by a token check, like a sign-in and the first authenticated request
+        start = time.perf_counter()
+        client = get_client()
+        response = client.auth.sign_in_with_password({'email': f'user{i}@example.com', 'password': 'secret'})
+        client.auth.get_user(jwt=response.session.access_token)
+        return (time.perf_counter() - start) * 1000
+
+    def _measure(self, server, get_client, requests, threads):
+        connections_before = server.connections
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            timings = sorted(executor.map(lambda i: self._call(get_client, i), range(requests)))
+        elapsed = time.perf_counter() - start
+        return {
+            'mean_ms': statistics.fmean(timings),
+            'p50_ms': timings[len(timings) // 2],
+            'p95_ms': timings[int(len(timings) * 0.95) - 1],
+            'throughput': requests / elapsed,
+            'connections': server.connections - connections_before,
+        }
+
+    def handle(self, *args, **options):
+        server = start_stub_auth_server(options['remote_latency_ms'] / 1000)
+        host, port = server.server_address
+        overrides = {
+            'SUPABASE_URL': f'http://{host}:{port}',
+            'SUPABASE_ANON_KEY': make_token('anon'),
+            'SUPABASE_HTTP_MAX_CONNECTIONS': options['max_connections'],
+            'SUPABASE_HTTP_MAX_KEEPALIVE': options['max_connections'],
+        }
+        scenarios = [
+            ('create_client per call (before)', _client_per_call),
+            ('pooled get_supabase_client', supabase_client.get_supabase_client),
+        ]
+
+        try:
+            results = []
+            with override_settings(**overrides):
+                supabase_client.close_http_client()
+                for name, get_client in scenarios:
+                    results.append((name, self._measure(server, get_client, options['requests'], options['threads'])))
+        finally:
+            supabase_client.close_http_client()
+            server.shutdown()
+            server.server_close()
+
+        baseline = results[0][1]
+        for name, stats in results:
+            self.stdout.write(
+                f"{name:<32} mean {stats['mean_ms']:8.3f} ms  p50 {stats['p50_ms']:8.3f} ms  "
+                f"p95 {stats['p95_ms']:8.3f} ms  {stats['throughput']:7.0f} calls/s  "
+                f"{stats['connections']:5d} connections  speedup x{baseline['mean_ms'] / stats['mean_ms']:.1f}"
+            )
@@ -0,0 +1,130 @@
+import multiprocessing
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.ai.item_bank import invalidate_item_bank
+from api.ai.item_calibration import ResponseMatrix, calibrate
+from api.models import Answer, Question
+
+
+class Command(BaseCommand):
+    help = 'Calibrates 3PL item parameters from the answer history by marginal maximum likelihood (EM)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--category', dest='category_ids', type=int, action='append', default=[],
+                            help='Only calibrate questions of this category (repeatable)')
+        parser.add_argument('--min-responses', type=int, default=50,
+                            help='Questions with fewer responses keep their current parameters')
+        parser.add_argument('--max-iterations', type=int, default=100, help='EM cycles')
+        parser.add_argument('--tolerance', type=float, default=1e-3,
+                            help='Stop once no parameter moves more than this between cycles')
+        parser.add_argument('--quadrature-points', type=int, default=41)
+        parser.add_argument('--workers', type=int, default=0,
+                            help='Processes for the M-step; 0 runs it in this process')
+        parser.add_argument('--block-size', type=int, default=500, help='Questions per M-step task')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows fetched per database round trip')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk write')
+        parser.add_argument('--dry-run', action='store_true', help='Report diagnostics without writing parameters')
+
+    def _load(self, options):
+        """Stream answers into a sparse response matrix plus the starting parameters of every item."""
+        questions = Question.objects.all()
+        answers = Answer.objects.filter(assessment_result__user__isnull=False)
+        if options['category_ids']:
+            questions = questions.filter(category_id__in=options['category_ids'])
+            answers = answers.filter(question__category_id__in=options['category_ids'])
+
+        question_ids, discrimination, difficulty, guessing = [], array('d'), array('d'), array('d')
+        for question_id, a, b, c in questions.order_by('id').values_list(
+                'id', 'discrimination', 'difficulty', 'guessing').iterator(chunk_size=options['chunk_size']):
+            question_ids.append(question_id)
+            discrimination.append(a)
+            difficulty.append(b)
+            guessing.append(c)
+        item_index = {question_id: index for index, question_id in enumerate(question_ids)}
+
+        person_index = {}
+        persons, items, correct = array('l'), array('l'), array('b')
+        for user_id, question_id, is_correct in answers.values_list(
+                'assessment_result__user_id', 'question_id', 'is_correct').iterator(chunk_size=options['chunk_size']):
+            persons.append(person_index.setdefault(user_id, len(person_index)))
+            items.append(item_index[question_id])
+            correct.append(is_correct)
+
+        responses = ResponseMatrix.from_arrays(persons, items, correct, len(person_index), len(question_ids))
+        return question_ids, responses, np.array(discrimination), np.array(difficulty), np.array(guessing)
+
+    def _write(self, question_ids, result, options):
+        calibrated_at = timezone.now()
+        questions = Question.objects.in_bulk([question_ids[index] for index in np.flatnonzero(result.calibrated)])
+
+        for index in np.flatnonzero(result.calibrated):
+            question = questions[question_ids[index]]
+            question.discrimination = float(result.discrimination[index])
+            question.difficulty = float(result.difficulty[index])
+            question.guessing = float(result.guessing[index])
+            question.calibrated_at = calibrated_at
+            question.content_hash = question.compute_content_hash()
+
+        with transaction.atomic():
+            Question.objects.bulk_update(
+                questions.values(),
+                ['discrimination', 'difficulty', 'guessing', 'calibrated_at', 'content_hash'],
+                batch_size=options['batch_size'],
+            )
+            transaction.on_commit(invalidate_item_bank)
+
+    def _log_iteration(self, iteration, log_likelihood, max_change):
+        self.stdout.write(f'  cycle {iteration:3d}: log-likelihood {log_likelihood:.3f}, max change {max_change:.5f}')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        question_ids, responses, discrimination, difficulty, guessing = self._load(options)
+        loaded = time.perf_counter()
+
+        self.stdout.write(
+            f'Loaded {responses.answered.sum():.0f} responses from {responses.answered.shape[0]} students '
+            f'on {len(question_ids)} questions in {loaded - start:.2f}s'
+        )
+
+        calibration_options = dict(
+            min_responses=options['min_responses'], max_iterations=options['max_iterations'],
+            tolerance=options['tolerance'], quadrature_points=options['quadrature_points'],
+            block_size=options['block_size'], log=self._log_iteration,
+        )
+
+        if options['workers'] > 0:
+            with ProcessPoolExecutor(max_workers=options['workers'],
+                                     mp_context=multiprocessing.get_context('spawn')) as executor:
+                result = calibrate(responses, discrimination, difficulty, guessing,
+                                   map_blocks=executor.map, **calibration_options)
+        else:
+            result = calibrate(responses, discrimination, difficulty, guessing, **calibration_options)
+
+        calibrated = int(result.calibrated.sum())
+        status_message = 'converged' if result.converged else 'did not converge'
+        self.stdout.write(
+            f'EM {status_message} after {result.iterations} cycles in {time.perf_counter() - loaded:.2f}s; '
+            f'{calibrated} questions calibrated, {len(question_ids) - calibrated} below {options["min_responses"]} '
+            f'responses kept as is'
+        )
+
+        if calibrated:
+            shifts = np.abs(result.difficulty - difficulty)[result.calibrated]
+            self.stdout.write(f'Difficulty shift from the previous values: mean {shifts.mean():.3f}, '
+                              f'max {shifts.max():.3f}')
+
+        if options['dry_run'] or not calibrated:
+            self.stdout.write(self.style.SUCCESS('Nothing written'))
+            return
+
+        self._write(question_ids, result, options)
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated {calibrated} questions; run recompute_abilities to re-estimate abilities on the new scale'
+        ))
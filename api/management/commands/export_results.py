@@ -0,0 +1,42 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.utils import exports
+
+
+class Command(BaseCommand):
+    help = 'Streams answer-level results of a class or an assessment as CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        scope = parser.add_mutually_exclusive_group(required=True)
+        scope.add_argument('--class', dest='class_id', type=int, help='Export every assessment of this class')
+        scope.add_argument('--assessment', dest='assessment_id', type=int, help='Export a single assessment')
+        parser.add_argument('--format', dest='export_format', choices=sorted(exports.EXPORT_FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output')
+        parser.add_argument('--since', help='Only results submitted on or after this ISO date/datetime')
+        parser.add_argument('--until', help='Only results submitted before this ISO datetime (or through this date)')
+        parser.add_argument('--output', help='File to write; defaults to stdout')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per database round trip')
+
+    def handle(self, *args, **options):
+        try:
+            since = exports.parse_date_bound(options['since']) if options['since'] else None
+            until = exports.parse_date_bound(options['until'], end=True) if options['until'] else None
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        rows = exports.export_rows(
+            class_id=options['class_id'], assessment_id=options['assessment_id'],
+            since=since, until=until, chunk_size=options['chunk_size'],
+        )
+        chunks = exports.render_export(rows, options['export_format'], options['gzip'])
+
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
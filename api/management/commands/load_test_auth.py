@@ -0,0 +1,153 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from api.authentication import clear_identity_cache
+from api.models import User
+from api.utils import supabase_client
+
+from .benchmark_auth import make_token, start_stub_auth_server
+
+ENDPOINTS = {
+    'login': '/api/login/',
+    'refresh': '/api/refresh-token/',
+}
+
+
+def _serve_stub(latency, pipe):
+    # Runs in a child process: a stub sharing the GIL with the app under test would slow it down
+    server = start_stub_auth_server(latency)
+    pipe.send(server.server_address)
+    while pipe.recv() == 'stats':
+        with server.lock:
+            pipe.send((server.connections, server.peak_in_flight))
+            server.peak_in_flight = 0
+    server.shutdown()
+
+
+class Command(BaseCommand):
+    help = ('Load-tests the Supabase-bound auth endpoints, served by a pool of WSGI worker threads and by a '
+            'single ASGI event loop, against a local stub of Supabase Auth')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='login')
+        parser.add_argument('--requests', type=int, default=600, help='Requests per scenario')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Sync worker threads of the WSGI scenario, like gunicorn --workers x --threads')
+        parser.add_argument('--concurrency', type=int, default=200,
+                            help='Requests in flight at once in the ASGI scenario')
+        parser.add_argument('--users', type=int, default=50, help='Distinct accounts the requests cycle through')
+        parser.add_argument('--remote-latency-ms', type=float, default=100.0,
+                            help='Latency added by the stub server to mimic the Supabase round trip')
+
+    def _payloads(self, endpoint, requests, users):
+        if endpoint == 'login':
+            return [{'email': f'user{i % users}@example.com', 'password': 'secret'} for i in range(requests)]
+        return [{'refresh_token': f'refresh-{self._user_id(i % users)}'} for i in range(requests)]
+
+    @staticmethod
+    def _user_id(i):
+        # The stub derives user ids from emails
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f'user{i}@example.com'))
+
+    def _run_wsgi(self, path, payloads, workers):
+        local = threading.local()
+
+        def call(payload):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+            start = time.perf_counter()
+            response = local.client.post(path, payload, content_type='application/json')
+            return (time.perf_counter() - start) * 1000, response.status_code
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(call, payloads))
+
+    async def _run_asgi(self, path, payloads, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def call(payload):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(path, payload, content_type='application/json')
+                return (time.perf_counter() - start) * 1000, response.status_code
+
+        try:
+            return await asyncio.gather(*(call(payload) for payload in payloads))
+        finally:
+            await supabase_client.close_async_http_client()
+
+    def _measure(self, stub, run):
+        stub.send('stats')
+        connections, _ = stub.recv()
+        start = time.perf_counter()
+        calls = run()
+        elapsed = time.perf_counter() - start
+        stub.send('stats')
+        connections_after, peak_in_flight = stub.recv()
+
+        timings = sorted(ms for ms, status in calls)
+        return {
+            'throughput': len(calls) / elapsed,
+            'p50_ms': timings[len(timings) // 2],
+            'p95_ms': timings[int(len(timings) * 0.95) - 1],
+            'errors': sum(status != 200 for ms, status in calls),
+            'peak_in_flight': peak_in_flight,
+            'connections': connections_after - connections,
+        }
+
+    def handle(self, *args, **options):
+        if min(options['requests'], options['workers'], options['concurrency'], options['users']) < 1:
+            raise CommandError('--requests, --workers, --concurrency and --users must be at least 1.')
+
+        stub, child_pipe = multiprocessing.Pipe()
+        stub_process = multiprocessing.get_context('fork').Process(
+            target=_serve_stub, args=(options['remote_latency_ms'] / 1000, child_pipe), daemon=True)
+        stub_process.start()
+        host, port = stub.recv()
+        path = ENDPOINTS[options['endpoint']]
+        payloads = self._payloads(options['endpoint'], options['requests'], options['users'])
+        scenarios = [
+            (f"WSGI, {options['workers']} worker threads",
+             lambda: self._run_wsgi(path, payloads, options['workers'])),
+            (f"ASGI, one event loop, {options['concurrency']} in flight",
+             lambda: asyncio.run(self._run_asgi(path, payloads, options['concurrency']))),
+        ]
+
+        old_name = connection.settings_dict['NAME']
+        setup_test_environment()
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            User.objects.bulk_create(
+                User(supabase_user_id=self._user_id(i), email=f'user{i}@example.com', first_name='Load',
+                     last_name=f'User {i}', role=User.STUDENT)
+                for i in range(options['users'])
+            )
+            with override_settings(SUPABASE_URL=f'http://{host}:{port}', SUPABASE_ANON_KEY=make_token('anon'),
+                                   SUPABASE_HTTP_MAX_CONNECTIONS=max(options['workers'], options['concurrency'])):
+                results = [(name, self._measure(stub, run)) for name, run in scenarios]
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            clear_identity_cache()
+            stub.send('stop')
+            stub_process.join()
+
+        baseline = results[0][1]['throughput']
+        self.stdout.write(f"{options['requests']} POST {path}, {options['remote_latency_ms']:.0f} ms upstream latency")
+        for name, stats in results:
+            self.stdout.write(
+                f"{name:<40} {stats['throughput']:8.1f} req/s  p50 {stats['p50_ms']:8.1f} ms  "
+                f"p95 {stats['p95_ms']:8.1f} ms  peak upstream in flight {stats['peak_in_flight']:4d}  "
+                f"{stats['connections']:4d} connections  {stats['errors']} errors  "
+                f"x{stats['throughput'] / baseline:.1f}"
+            )
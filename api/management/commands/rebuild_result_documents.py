@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from api.models import AssessmentResult
+from api.utils.assessment_results import store_result_document
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the precomputed result documents served by the results endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--assessment', dest='assessment_ids', type=int, action='append', default=[],
+                            help='Only rebuild results of this assessment (repeatable)')
+        parser.add_argument('--missing-only', action='store_true', help='Only build documents that do not exist yet')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        results = AssessmentResult.objects.only('id', 'assessment_id', 'user_id', 'score', 'time_taken')
+        if options['assessment_ids']:
+            results = results.filter(assessment_id__in=options['assessment_ids'])
+        if options['missing_only']:
+            results = results.filter(result_document__isnull=True)
+
+        rebuilt = 0
+        for assessment_result in results.iterator(chunk_size=options['chunk_size']):
+            store_result_document(assessment_result)
+            rebuilt += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} result documents'))
@@ -0,0 +1,151 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import django
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.ai.estimate_student_ability import estimate_abilities_by_category
+from api.models import Answer, UserAbility
+
+
+def estimate_users(chunk):
+    """Worker entry point: ``[(user_id, rows)] -> [(user_id, {category_id: (theta, information, count)})]``."""
+    results = []
+    for user_id, rows in chunk:
+        rows = np.asarray(rows, dtype=float)
+        abilities = estimate_abilities_by_category(
+            rows[:, 0].astype(np.int64), rows[:, 1], rows[:, 2], rows[:, 3], rows[:, 4]
+        )
+        results.append((user_id, abilities))
+    return results
+
+
+class Command(BaseCommand):
+    help = 'Recomputes UserAbility for every student from their full answer history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--class', dest='class_ids', type=int, action='append', default=[],
+                            help='Only students enrolled in this class (repeatable)')
+        parser.add_argument('--category', dest='category_ids', type=int, action='append', default=[],
+                            help='Only recompute this category (repeatable)')
+        parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                            help='Estimation processes; 0 estimates in this process')
+        parser.add_argument('--users-per-task', type=int, default=200)
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows fetched per database round trip')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk write')
+        parser.add_argument('--dry-run', action='store_true', help='Estimate without writing UserAbility')
+
+    def _answer_rows(self, options):
+        answers = Answer.objects.filter(assessment_result__user__isnull=False)
+        if options['class_ids']:
+            answers = answers.filter(assessment_result__user__enrolled_class_id__in=options['class_ids'])
+        if options['category_ids']:
+            answers = answers.filter(question__category_id__in=options['category_ids'])
+
+        return answers.order_by('assessment_result__user_id').values_list(
+            'assessment_result__user_id',
+            'question__category_id',
+            'question__discrimination',
+            'question__difficulty',
+            'question__guessing',
+            'is_correct',
+        ).iterator(chunk_size=options['chunk_size'])
+
+    def _user_chunks(self, rows, users_per_task):
+        """Group the user-ordered row stream into lists of ``(user_id, rows)`` without loading it all."""
+        chunk = []
+        current_user = None
+        current_rows = []
+
+        for user_id, *row in rows:
+            if user_id != current_user:
+                if current_rows:
+                    chunk.append((current_user, current_rows))
+                    if len(chunk) >= users_per_task:
+                        yield chunk
+                        chunk = []
+                current_user = user_id
+                current_rows = []
+            current_rows.append(row)
+
+        if current_rows:
+            chunk.append((current_user, current_rows))
+        if chunk:
+            yield chunk
+
+    def _write(self, results, batch_size):
+        user_ids = [user_id for user_id, _ in results]
+        existing = {
+            (ability.user_id, ability.category_id): ability
+            for ability in UserAbility.objects.filter(user_id__in=user_ids)
+        }
+
+        # bulk_update skips auto_now, so updated_at is set here
+        now = timezone.now()
+        to_create = []
+        to_update = []
+        for user_id, abilities in results:
+            for category_id, (theta, information, answer_count) in abilities.items():
+                ability = existing.get((user_id, category_id))
+                if ability is None:
+                    to_create.append(UserAbility(
+                        user_id=user_id, category_id=category_id, ability_level=theta,
+                        information=information, answer_count=answer_count,
+                    ))
+                else:
+                    ability.ability_level = theta
+                    ability.information = information
+                    ability.answer_count = answer_count
+                    ability.updated_at = now
+                    to_update.append(ability)
+
+        with transaction.atomic():
+            UserAbility.objects.bulk_create(to_create, batch_size=batch_size)
+            UserAbility.objects.bulk_update(
+                to_update, ['ability_level', 'information', 'answer_count', 'updated_at'], batch_size=batch_size
+            )
+
+    def _handle_results(self, results, options, totals):
+        totals['students'] += len(results)
+        totals['abilities'] += sum(len(abilities) for _, abilities in results)
+        if not options['dry_run']:
+            self._write(results, options['batch_size'])
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        totals = {'students': 0, 'abilities': 0}
+        chunks = self._user_chunks(self._answer_rows(options), options['users_per_task'])
+
+        if options['workers'] <= 0:
+            for chunk in chunks:
+                self._handle_results(estimate_users(chunk), options, totals)
+        else:
+            # Spawned workers never inherit the open database connection used for streaming
+            with ProcessPoolExecutor(
+                max_workers=options['workers'],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup,
+            ) as executor:
+                pending = set()
+                for chunk in chunks:
+                    pending.add(executor.submit(estimate_users, chunk))
+                    # Bound the in-flight work so memory stays flat regardless of population size
+                    if len(pending) >= options['workers'] * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            self._handle_results(future.result(), options, totals)
+
+                for future in pending:
+                    self._handle_results(future.result(), options, totals)
+
+        elapsed = time.perf_counter() - start
+        rate = totals['students'] / elapsed if elapsed else 0.0
+        action = 'Estimated (dry run)' if options['dry_run'] else 'Recomputed'
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} {totals['abilities']} abilities for {totals['students']} students "
+            f"in {elapsed:.2f}s ({rate:.1f} students/s)"
+        ))
@@ -0,0 +1,61 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from api.jobs import Worker
+
+
+def _run_process(options):
+    worker = Worker(threads=options['threads'], names=options['jobs'], poll_interval=options['poll_interval'],
+                    burst=options['burst'])
+    signal.signal(signal.SIGTERM, lambda *args: worker.stop())
+    signal.signal(signal.SIGINT, lambda *args: worker.stop())
+    worker.run()
+
+
+class Command(BaseCommand):
+    help = 'Runs background jobs from the job queue until stopped with SIGTERM or Ctrl-C'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=1, help='Worker threads per process')
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Worker processes; more than one forks, which suits CPU-bound jobs')
+        parser.add_argument('--job', action='append', dest='jobs', metavar='NAME',
+                            help='Only run jobs with this name (repeatable)')
+        parser.add_argument('--poll-interval', type=float, help='Seconds between polls of an empty queue')
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is due')
+
+    def handle(self, *args, **options):
+        if options['threads'] < 1 or options['processes'] < 1:
+            raise CommandError('--threads and --processes must be at least 1.')
+
+        self.stdout.write(f"Running jobs on {options['processes']} process(es) x {options['threads']} thread(s)")
+        if options['processes'] == 1:
+            worker = Worker(threads=options['threads'], names=options['jobs'],
+                            poll_interval=options['poll_interval'], burst=options['burst'], log=self.stdout.write)
+            signal.signal(signal.SIGTERM, lambda *args: worker.stop())
+            signal.signal(signal.SIGINT, lambda *args: worker.stop())
+            worker.run()
+            self.stdout.write(self.style.SUCCESS(f'Stopped after {worker.processed} jobs ({worker.failed} failed)'))
+            return
+
+        # Children must open their own database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=_run_process, args=(options,), name=f'job-worker-{index}')
+                     for index in range(options['processes'])]
+        for process in processes:
+            process.start()
+
+        def forward(signum, frame):
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+        signal.signal(signal.SIGTERM, forward)
+        signal.signal(signal.SIGINT, forward)
+        for process in processes:
+            process.join()
+        self.stdout.write(self.style.SUCCESS('Stopped'))
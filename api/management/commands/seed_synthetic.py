@@ -0,0 +1,55 @@
+import dataclasses
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from api.utils.synthetic import SCALES, clear_population, seed_population
+
+
+class Command(BaseCommand):
+    help = 'Seeds teachers, classes, students and 3PL-sampled assessment history for load tests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--preset', choices=sorted(SCALES), default='small',
+                            help='Size preset; the presets match the benchmark_endpoints scales')
+        parser.add_argument('--seed', type=int, default=0, help='Same seed, same rows')
+        parser.add_argument('--teachers', type=int, help='Override the preset')
+        parser.add_argument('--classes-per-teacher', type=int, help='Override the preset')
+        parser.add_argument('--students-per-class', type=int, help='Override the preset')
+        parser.add_argument('--quizzes-per-class', type=int, help='Override the preset')
+        parser.add_argument('--use-existing-questions', action='store_true',
+                            help='Sample answers over the current question bank instead of generating questions')
+        parser.add_argument('--replace', action='store_true',
+                            help='Delete the rows of an earlier run with the same seed first')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk insert')
+
+    def _log_progress(self, done, total, population):
+        self.stdout.write(f'  class {done}/{total}: {population.results} results, {population.answers} answers')
+
+    def handle(self, *args, **options):
+        overrides = {
+            field: options[field] for field in ('teachers', 'classes_per_teacher', 'students_per_class',
+                                                'quizzes_per_class')
+            if options[field] is not None
+        }
+        scale = dataclasses.replace(SCALES[options['preset']], **overrides)
+
+        if options['replace']:
+            clear_population(options['seed'])
+
+        start = time.perf_counter()
+        try:
+            population = seed_population(scale, seed=options['seed'], batch_size=options['batch_size'],
+                                         use_existing_questions=options['use_existing_questions'],
+                                         log=self._log_progress)
+        except ValueError as e:
+            raise CommandError(str(e))
+        except IntegrityError:
+            raise CommandError(f"Rows of seed {options['seed']} already exist; pass --replace or another --seed.")
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded in {elapsed:.1f}s ({population.answers / max(elapsed, 1e-9):.0f} answers/s): ' +
+            ', '.join(f'{count} {table}' for table, count in population.as_dict().items())
+        ))
@@ -1,14 +1,37 @@
+import csv
+
 from django.core.management.base import BaseCommand
 from api.utils import google_sheets_reader
+from api.utils.lesson_import import LessonImportReport, import_lessons, merge_duplicate_chapters, parse_lesson_rows
 
 
 class Command(BaseCommand):
-    help = 'Uploads questions from Google Sheets to the database'
+    help = 'Uploads lessons from Google Sheets to the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--csv', dest='csv_path',
+                            help='Import a CSV export of the sheet (same columns, header row first) instead')
+        parser.add_argument('--merge-duplicates', action='store_true',
+                            help='Only merge chapters stored twice under one number; run it before adding the '
+                                 'unique (lesson, chapter_number) constraint to an existing database')
+
+    def handle(self, *args, **options):
+        if options['merge_duplicates']:
+            deleted = merge_duplicate_chapters()
+            self.stdout.write(self.style.SUCCESS(f'Merged duplicate chapters: {deleted} deleted'))
+            return
 
-    def handle(self, *args, **kwargs):
+        if options['csv_path']:
+            report = LessonImportReport()
+            with open(options['csv_path'], newline='', encoding='utf-8') as csv_file:
+                rows = list(csv.reader(csv_file))
+            import_lessons(parse_lesson_rows(rows[1:], report), report)
+            for row_number, reason in report.rejected:
+                self.stderr.write(f'Row {row_number} rejected: {reason}')
+        else:
+            spreadsheet_id = "160BuIjTsa411HjqhutWz4mkG0HPxarfeBJpsRG-Ijxg"
+            range_name = "Sheet1"
 
-        spreadsheet_id = "160BuIjTsa411HjqhutWz4mkG0HPxarfeBJpsRG-Ijxg"
-        range_name = "Sheet1"
+            report = google_sheets_reader.upload_lessons_from_sheet(spreadsheet_id, range_name)
 
-        google_sheets_reader.upload_lessons_from_sheet(spreadsheet_id, range_name)
-        self.stdout.write(self.style.SUCCESS('Successfully uploaded lessons'))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS(f'Successfully uploaded lessons: {report}'))
@@ -1,10 +1,31 @@
+import csv
+import time
+
 from django.core.management.base import BaseCommand
 from api.utils import google_sheets_reader
+from api.utils.question_import import ImportReport, import_questions, parse_question_rows
 
 
 class Command(BaseCommand):
     help = 'Uploads questions from Google Sheets to the database'
 
-    def handle(self, *args, **kwargs):
-        google_sheets_reader.upload_questions_from_sheet('1h0taQaf0d8Brx5qCouofPQfpQsrxdfgB-VT9c6Thxic', 'All')
-        self.stdout.write(self.style.SUCCESS('Successfully uploaded questions'))
\ No newline at end of file
+    def add_arguments(self, parser):
+        parser.add_argument('--csv', dest='csv_path',
+                            help='Import a CSV export of the sheet (same columns, header row first) instead')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+
+        if options['csv_path']:
+            report = ImportReport()
+            with open(options['csv_path'], newline='', encoding='utf-8') as csv_file:
+                rows = list(csv.reader(csv_file))
+            records = parse_question_rows(rows[1:], google_sheets_reader.CATEGORY_MAPPING, report)
+            import_questions(records, report)
+            for row_number, reason in report.rejected:
+                self.stderr.write(f'Row {row_number} rejected: {reason}')
+        else:
+            report = google_sheets_reader.upload_questions_from_sheet('1h0taQaf0d8Brx5qCouofPQfpQsrxdfgB-VT9c6Thxic', 'All')
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f'Successfully uploaded questions: {report} in {elapsed:.2f}s'))
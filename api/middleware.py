@@ -0,0 +1,70 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .utils import metrics
+
+METRICS_PATH = '/metrics'
+
+
+class RequestMetricsMiddleware:
+    """
+    Times every request by phase and records it in the per-process metrics registry.
+
+    Database time and query count come from a connection execute wrapper, ``auth`` and ``ai`` from
+    the code they wrap (see ``api.utils.metrics.timed``) and ``render`` covers DRF response
+    rendering. The phases are sent back in a ``Server-Timing`` header and aggregated into per-route
+    histograms served at ``/metrics``. Place it first in ``MIDDLEWARE`` so ``total`` covers the
+    other middleware too. It runs natively under both WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.API_METRICS_ENABLED or request.path == METRICS_PATH:
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        timings, token = metrics.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        return self._record(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not settings.API_METRICS_ENABLED or request.path == METRICS_PATH:
+            return await self.get_response(request)
+
+        start = time.perf_counter()
+        timings, token = metrics.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        return self._record(request, response, timings, time.perf_counter() - start)
+
+    def _record(self, request, response, timings, duration):
+        match = request.resolver_match
+        route = f'/{match.route}' if match else 'unmatched'
+        metrics.registry.record(route, request.method, response.status_code, duration, timings)
+
+        if settings.API_SERVER_TIMING:
+            response['Server-Timing'] = metrics.server_timing(timings, duration)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns; time it through a post-render callback
+        start = time.perf_counter()
+        timings = metrics.current_timings()
+        if timings is not None:
+            response.add_post_render_callback(lambda rendered: timings.add(metrics.RENDER, time.perf_counter() - start))
+        return response
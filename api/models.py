@@ -1,7 +1,11 @@
+import hashlib
+import json
+
 from django.db import models
 
 # users/models.py
 from django.db import models
+from django.utils import timezone
 from .utils.util import generate_class_code
 
 
@@ -23,6 +27,11 @@ class User(models.Model):
     role = models.CharField(max_length=255, choices=USER_ROLES, default=STUDENT)
     enrolled_class = models.ForeignKey('Class', on_delete=models.SET_NULL, null=True, blank=True)
 
+    @property
+    def is_authenticated(self):
+        # Lets DRF permission checks treat API users like Django auth users
+        return True
+
     @property
     def full_name(self):
         # Concatenate first_name and last_name with a space in between
@@ -43,6 +52,11 @@ class UserAbility(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     ability_level = models.FloatField()
+    # Running statistics for incremental updates: Fisher information accumulated at the estimates and
+    # the number of answers folded into ability_level so far
+    information = models.FloatField(default=0.0)
+    answer_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = (('user', 'category'),)
@@ -62,11 +76,33 @@ class Question(models.Model):
     choices = models.JSONField()
     correct_answer = models.CharField(max_length=255)
     is_ai_generated = models.BooleanField(default=False)
+    content_hash = models.CharField(max_length=64, blank=True, editable=False)
+    # Set when the item parameters were estimated from answers (calibrate_items); imports keep them
+    calibrated_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['category', 'difficulty'], name='question_category_diff_idx'),
+        ]
 
     def __str__(self):
         return self.question_text
 
+    def compute_content_hash(self):
+        """SHA-256 over every imported field, used to skip unchanged rows on re-import."""
+        payload = json.dumps([
+            self.question_text, self.image_url, self.category_id, self.difficulty, self.discrimination,
+            self.guessing, self.choices, self.correct_answer, self.is_ai_generated,
+        ], sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def save(self, *args, **kwargs):
+        self.content_hash = self.compute_content_hash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'content_hash' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'content_hash']
+        super().save(*args, **kwargs)
+
 
 class Assessment(models.Model):
     TYPE_CHOICES = [
@@ -96,16 +132,29 @@ class Assessment(models.Model):
 
     questions = models.ManyToManyField("Question", related_name="assessments")
     selected_categories = models.ManyToManyField(Category, blank=True)
+    # Bumped whenever ``questions`` changes; part of the cached answer key's cache key
+    questions_version = models.PositiveIntegerField(default=1)
 
     created_at = models.DateTimeField(auto_now_add=True)
     taken_at = models.DateTimeField(auto_now=True)
     time_limit = models.IntegerField(default=0)
     deadline = models.DateTimeField(null=True, blank=True)
     is_initial = models.BooleanField(default=False)
+    # Adaptive assessments deliver one item at a time; ``questions`` holds the items administered so far
+    is_adaptive = models.BooleanField(default=False)
 
     source = models.CharField(max_length=50, choices=SOURCE_CHOICES, default='admin_generated')
     question_source = models.CharField(max_length=50, choices=QUESTION_SOURCE_CHOICES, default='previous_exam')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['class_owner', 'is_initial'], name='assessment_class_initial_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['class_owner'], condition=models.Q(is_initial=True),
+                                    name='unique_initial_exam_per_class'),
+        ]
+
     def __str__(self):
         return f"{self.type.capitalize()} - {self.name or 'Unnamed'}"
 
@@ -114,6 +163,13 @@ class AssessmentProgress(models.Model):
     assessment = models.ForeignKey(Assessment, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     start_time = models.DateTimeField(auto_now_add=True)
+    # Answers of an adaptive test in progress, in order; they become Answer rows when the test finishes
+    adaptive_responses = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'assessment'], name='unique_assessment_progress_per_user'),
+        ]
 
 
 class AssessmentResult(models.Model):
@@ -121,6 +177,21 @@ class AssessmentResult(models.Model):
     score = models.IntegerField(default=0)
     time_taken = models.IntegerField(default=0)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True)
+    # Precomputed payload of the results endpoint and the item bank version it was built from
+    result_document = models.JSONField(null=True, blank=True)
+    result_document_version = models.PositiveBigIntegerField(null=True, blank=True)
+    # Denormalized at grading time so history is served without touching answers or questions
+    category_tallies = models.JSONField(null=True, blank=True)
+    total_items = models.IntegerField(default=0)
+    submitted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['assessment', 'user'], name='unique_assessment_result_per_user'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-submitted_at', '-id'], name='result_history_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user.full_name} - {self.assessment} - {self.score}'
@@ -133,6 +204,11 @@ class Answer(models.Model):
     chosen_answer = models.CharField(max_length=255)
     is_correct = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['assessment_result', 'question'], name='answer_result_question_idx'),
+        ]
+
     def __str__(self):
         return f'Answer for {self.question.question_text} by {self.assessment_result.user}'
 
@@ -153,6 +229,9 @@ class Class(models.Model):
 
 class Lesson(models.Model):
     lesson_name = models.CharField(max_length=255)
+    # Bumped whenever the lesson or one of its chapters changes; drives ETags and the cached lesson body
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.lesson_name
@@ -163,10 +242,29 @@ class Chapter(models.Model):
     chapter_name = models.CharField(max_length=255)
     chapter_number = models.PositiveIntegerField()
     content = models.TextField()
+    content_hash = models.CharField(max_length=64, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['lesson', 'chapter_number'], name='unique_chapter_number_per_lesson'),
+        ]
 
     def __str__(self):
         return f"{self.lesson.lesson_name} - {self.chapter_number}. {self.chapter_name}"
 
+    def compute_content_hash(self):
+        """SHA-256 of the chapter's name, number and content, used to detect changed chapters."""
+        payload = f"{self.chapter_number}\x1f{self.chapter_name}\x1f{self.content}"
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def save(self, *args, **kwargs):
+        self.content_hash = self.compute_content_hash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'content_hash' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'content_hash']
+        super().save(*args, **kwargs)
+
 
 class LessonProgress(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='lesson_progress')
@@ -174,6 +272,61 @@ class LessonProgress(models.Model):
     current_chapter = models.ForeignKey(Chapter, on_delete=models.SET_NULL, null=True, blank=True,
                                         related_name='progress', default=1)
     progress_percentage = models.FloatField(default=0.0)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.user.full_name} - {self.lesson.lesson_name} Progress: {self.progress_percentage}%"
+
+
+class ContentVersion(models.Model):
+    """Monotonic version stamp for a cached data set (e.g. the item bank), shared by every process."""
+    key = models.CharField(max_length=100, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.key} v{self.version}"
+
+
+class Job(models.Model):
+    """A unit of background work run by ``manage.py run_worker`` (see api.jobs)."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    # Higher runs first; within a priority the job due first runs first
+    priority = models.SmallIntegerField(default=0)
+    # At most one queued job per key: enqueueing the same work again returns the queued job
+    dedupe_key = models.CharField(max_length=255, null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=255, null=True, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-priority', 'run_after', 'id'], condition=models.Q(status='queued'),
+                         name='job_queued_idx'),
+            models.Index(fields=['status', 'locked_at'], name='job_status_locked_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['dedupe_key'], condition=models.Q(status='queued'),
+                                    name='unique_queued_job_dedupe_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
@@ -0,0 +1,25 @@
+from rest_framework.permissions import BasePermission
+
+from .models import User
+
+
+class HasRole(BasePermission):
+    """Allows access only to authenticated users whose ``role`` is ``required_role``."""
+    required_role = None
+    message = 'You are not authorized to access this link.'
+
+    def has_permission(self, request, view):
+        return bool(
+            request.user
+            and request.user.is_authenticated
+            and getattr(request.user, 'role', None) == self.required_role
+        )
+
+
+class IsStudent(HasRole):
+    required_role = User.STUDENT
+
+
+class IsTeacher(HasRole):
+    required_role = User.TEACHER
+    message = 'Only teachers can access this link.'
@@ -0,0 +1,87 @@
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .authentication import clear_identity_cache, invalidate_user
+from .models import Assessment, AssessmentResult, Chapter, Class, Lesson, User
+from .utils.content_version import LESSONS, bump_version
+from .utils.gradebook import invalidate_gradebook
+from .utils.metrics import query_timer
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    # Reconnecting fires the signal again on the same wrapper object
+    if query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_timer)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_snapshot(sender, instance, **kwargs):
+    # Student snapshots embed their class teacher, so a teacher change invalidates everyone
+    if instance.role == User.TEACHER:
+        clear_identity_cache()
+    else:
+        invalidate_user(instance.supabase_user_id)
+        invalidate_gradebook(instance.enrolled_class_id)
+
+
+@receiver(post_save, sender=Class)
+@receiver(post_delete, sender=Class)
+def invalidate_class_snapshots(sender, instance, **kwargs):
+    clear_identity_cache()
+    invalidate_gradebook(instance.id)
+
+
+@receiver(post_save, sender=AssessmentResult)
+@receiver(post_delete, sender=AssessmentResult)
+def invalidate_result_gradebook(sender, instance, **kwargs):
+    if AssessmentResult.assessment.is_cached(instance):
+        class_id = instance.assessment.class_owner_id
+    else:
+        # The assessment may already be gone when results are removed by a cascading delete
+        class_id = Assessment.objects.filter(id=instance.assessment_id).values_list('class_owner_id', flat=True).first()
+    invalidate_gradebook(class_id)
+
+
+@receiver(post_save, sender=Assessment)
+@receiver(post_delete, sender=Assessment)
+def invalidate_assessment_gradebook(sender, instance, **kwargs):
+    invalidate_gradebook(instance.class_owner_id)
+
+
+@receiver(m2m_changed, sender=Assessment.questions.through)
+def invalidate_assessment_items_gradebook(sender, instance, action, reverse, **kwargs):
+    # Item counts are part of the gradebook; question-side changes are rare bulk edits and expire by TTL
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_gradebook(instance.class_owner_id)
+
+
+@receiver(m2m_changed, sender=Assessment.questions.through)
+def bump_assessment_questions_version(sender, instance, action, reverse, pk_set, **kwargs):
+    # Changes made from the question side name the assessments in pk_set, except a clear, which is
+    # handled before the rows go
+    bump = {'questions_version': F('questions_version') + 1}
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            Assessment.objects.filter(id=instance.id).update(**bump)
+    elif action in ('post_add', 'post_remove'):
+        Assessment.objects.filter(id__in=pk_set).update(**bump)
+    elif action == 'pre_clear':
+        Assessment.objects.filter(id__in=instance.assessments.values('id')).update(**bump)
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def bump_lessons_version(sender, instance, **kwargs):
+    bump_version(LESSONS)
+
+
+@receiver(post_save, sender=Chapter)
+@receiver(post_delete, sender=Chapter)
+def bump_lesson_version(sender, instance, **kwargs):
+    # A queryset update, so the lesson list (which has no chapter data) keeps its version
+    Lesson.objects.filter(id=instance.lesson_id).update(version=F('version') + 1, updated_at=timezone.now())
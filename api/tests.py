@@ -1,3 +1,1388 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import hashlib
+import hmac
+import io
+import json
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+import rsa
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import URLPattern
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+
+from .ai.estimate_student_ability import (THETA_BOUNDS, estimate_abilities_by_category, estimate_theta,
+                                         load_response_arrays, log_likelihood, log_likelihood_gradient,
+                                         log_likelihood_hessian, update_student_abilities)
+from .ai.adaptive_testing import item_information, select_next_item, should_stop
+from .ai.item_bank import invalidate_item_bank
+from .ai.item_calibration import ResponseMatrix, calibrate
+from .authentication import clear_identity_cache
+from .jobs import claim_jobs, enqueue, job, requeue_stale_jobs, run_job, run_pending
+from .management.commands.benchmark_auth import make_token, start_stub_auth_server
+from .management.commands.benchmark_endpoints import EXCLUDED_ROUTES
+from .models import (Answer, Assessment, AssessmentProgress, AssessmentResult, Category, Chapter, Class, Job, Lesson,
+                     LessonProgress, Question, User, UserAbility)
+from .urls import urlpatterns
+from .utils import jwt_verifier, supabase_client
+from .views.teacher_views import delete_quiz, update_quiz
+from .utils.content_version import LESSONS, get_version
+from .utils.google_sheets_reader import CATEGORY_MAPPING
+from .utils.grading import get_answer_key
+from .utils.jwt_verifier import clear_claims_cache, verify_token
+from .utils.lesson_import import LessonImportReport, import_lessons, parse_lesson_rows
+from .utils.question_import import ImportReport, import_questions, parse_question_rows
+from .utils.metrics import registry
+
+TEST_JWT_SECRET = 'test-secret'
+
+# Routes with a query-count test below
+COVERED_ROUTES = {
+    'get_user_details', 'get_student_class', 'join_class', 'get_initial_exam', 'take_initial_exam',
+    'initial_exam_taken', 'check_time_limit', 'take_exam', 'submit_exam', 'get_exam_results',
+    'get_student_abilities', 'get_student_history', 'take_quiz', 'submit_quiz', 'get_quiz_results',
+    'start_adaptive_test', 'get_adaptive_item', 'answer_adaptive_item', 'get_class_quizzes',
+    'get_lessons_overall', 'update_lesson_progress', 'get_lesson', 'get_classes', 'create_class',
+    'get_student_data', 'get_all_questions', 'create_quiz', 'get_initial_exam', 'open_initial_exam',
+    'get_all_quizzes', 'get_class_assessment', 'get_class_gradebook', 'export_class_results',
+    'export_assessment_results', 'get_teacher_class',
+}
+
+
+@override_settings(SUPABASE_JWT_SECRET=TEST_JWT_SECRET, SUPABASE_AUTH_REMOTE_FALLBACK=False,
+                   ADAPTIVE_TEST_RANDOMESQUE=1, JOBS_ENABLED=True)
+class EndpointQueryCountTests(TestCase):
+    """
+    Query budgets for every routed endpoint.
+
+    Each request starts with cold process caches (identity, item bank, answer keys), so the counts
+    include the user lookup and any cache fills. A failure here means an endpoint started issuing
+    more queries, usually an N+1 loop; raise a budget only when the extra query is intended.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create(supabase_user_id='teacher', email='teacher@example.com',
+                                          first_name='Tess', last_name='Teacher', role=User.TEACHER)
+        cls.class_obj = Class.objects.create(name='Class A', teacher=cls.teacher)
+        cls.student = User.objects.create(supabase_user_id='student', email='student@example.com',
+                                          first_name='Sam', last_name='Student', role=User.STUDENT,
+                                          enrolled_class=cls.class_obj)
+        cls.classmate = User.objects.create(supabase_user_id='classmate', email='classmate@example.com',
+                                            first_name='Cam', last_name='Classmate', role=User.STUDENT,
+                                            enrolled_class=cls.class_obj)
+        cls.newcomer = User.objects.create(supabase_user_id='newcomer', email='newcomer@example.com',
+                                           first_name='Nia', last_name='Newcomer', role=User.STUDENT)
+
+        cls.categories = [Category.objects.create(id=index, name=f'Category {index}') for index in range(1, 4)]
+        cls.questions = [
+            Question.objects.create(
+                id=f'Q{index:03d}', question_text=f'Question {index}', category=cls.categories[index % 3],
+                difficulty=(index % 7 - 3) / 2, discrimination=1.2, guessing=0.2,
+                choices={'a': 'A', 'b': 'B', 'c': 'C', 'd': 'D'}, correct_answer='a',
+            )
+            for index in range(30)
+        ]
+
+        cls.initial_exam = Assessment.objects.create(
+            name='Initial Assessment', class_owner=cls.class_obj, type='exam', is_initial=True, time_limit=600,
+            deadline=timezone.now() + timedelta(days=1),
+        )
+        cls.initial_exam.questions.set(cls.questions[:12])
+        cls.initial_exam.selected_categories.set(cls.categories)
+
+        cls.quiz = Assessment.objects.create(name='Quiz 1', class_owner=cls.class_obj, type='quiz',
+                                             source='teacher_generated', created_by=cls.teacher)
+        cls.quiz.questions.set(cls.questions[12:18])
+        cls.quiz.selected_categories.set(cls.categories)
+
+        cls.lesson = Lesson.objects.create(lesson_name='Lesson 1')
+        cls.chapters = [
+            Chapter.objects.create(lesson=cls.lesson, chapter_number=number, chapter_name=f'Chapter {number}',
+                                   content='Lorem ipsum ' * 50)
+            for number in range(1, 4)
+        ]
+
+    def setUp(self):
+        clear_identity_cache()
+        clear_claims_cache()
+        cache.clear()
+        invalidate_item_bank()
+
+    def _headers(self, user):
+        return {'HTTP_AUTHORIZATION': f'Bearer {make_token(user.supabase_user_id, secret=TEST_JWT_SECRET)}'}
+
+    def _request(self, method, path, user, data=None, **extra):
+        clear_identity_cache()
+        send = getattr(self.client, method)
+        if method == 'get':
+            return send(path, data, **self._headers(user), **extra)
+        return send(path, data or {}, content_type='application/json', **self._headers(user), **extra)
+
+    def assertQueries(self, expected, method, path, user, data=None, status_code=200, **extra):
+        with self.assertNumQueries(expected):
+            response = self._request(method, path, user, data, **extra)
+            if hasattr(response, 'streaming_content'):
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, status_code, getattr(response, 'content', b'')[:500])
+        return response
+
+    def _answers(self, assessment, questions=None):
+        return [
+            {'question_id': question.id, 'answer': 'A' if index % 2 else 'B', 'time_spent': 5}
+            for index, question in enumerate(questions or assessment.questions.all())
+        ]
+
+    def _submit(self, assessment, user=None):
+        response = self._request('post', f'/api/student/exam/{assessment.id}/submit', user or self.student,
+                                 {'answers': self._answers(assessment), 'total_time_taken_seconds': 60})
+        self.assertEqual(response.status_code, 201, response.content)
+        run_pending()
+
+    def test_every_route_is_budgeted(self):
+        names = {pattern.name for pattern in urlpatterns if isinstance(pattern, URLPattern)}
+        self.assertEqual(names - COVERED_ROUTES - set(EXCLUDED_ROUTES), set())
+        self.assertEqual(COVERED_ROUTES - names, set())
+
+    # General
+
+    def test_profile(self):
+        self.assertQueries(1, 'get', '/api/profile/', self.student)
+
+    # Student
+
+    def test_student_class(self):
+        LessonProgress.objects.create(user=self.student, lesson=self.lesson, current_chapter=self.chapters[0])
+        self.assertQueries(3, 'get', '/api/student/class', self.student)
+
+    def test_join_class(self):
+        self.assertQueries(3, 'post', '/api/student/class/join', self.newcomer,
+                           {'class_code': self.class_obj.class_code})
+
+    def test_initial_exam(self):
+        self.assertQueries(2, 'get', '/api/student/initial-exam', self.student)
+
+    def test_take_initial_exam(self):
+        self.assertQueries(9, 'get', '/api/student/take-initial-exam', self.student)
+
+    def test_initial_exam_taken(self):
+        self.assertQueries(3, 'get', '/api/student/initial-exam-taken', self.student)
+
+    def test_check_time_limit(self):
+        AssessmentProgress.objects.create(assessment=self.initial_exam, user=self.student)
+        self.assertQueries(3, 'get', f'/api/student/assessment/{self.initial_exam.id}/time-limit', self.student)
+
+    def test_take_exam(self):
+        self.assertQueries(12, 'get', '/api/student/exam/take', self.student)
+
+    def test_submit_exam(self):
+        self.assertQueries(12, 'post', f'/api/student/exam/{self.initial_exam.id}/submit', self.student,
+                           {'answers': self._answers(self.initial_exam), 'total_time_taken_seconds': 60},
+                           status_code=201)
+
+    def test_submit_quiz(self):
+        self.assertQueries(11, 'post', f'/api/student/quiz/{self.quiz.id}/submit', self.student,
+                           {'answers': self._answers(self.quiz), 'total_time_taken_seconds': 60},
+                           status_code=201)
+
+    def test_exam_results(self):
+        self._submit(self.initial_exam)
+        self.assertQueries(2, 'get', f'/api/student/exam/{self.initial_exam.id}', self.student)
+
+    def test_quiz_results(self):
+        self._submit(self.quiz)
+        self.assertQueries(2, 'get', f'/api/student/quiz/{self.quiz.id}', self.student)
+
+    def test_abilities(self):
+        self._submit(self.initial_exam)
+        self.assertQueries(2, 'get', '/api/student/ability', self.student)
+
+    def test_history(self):
+        self._submit(self.initial_exam)
+        self._submit(self.quiz)
+        response = self.assertQueries(2, 'get', '/api/student/history', self.student, {'limit': 1})
+        cursor = response['X-Next-Cursor']
+        self.assertQueries(2, 'get', '/api/student/history', self.student, {'limit': 1, 'cursor': cursor})
+
+    def test_take_quiz(self):
+        self.assertQueries(13, 'post', '/api/student/quiz/take', self.student,
+                           {'selected_categories': [1, 2], 'no_of_questions': 5, 'question_source': 'previous_exam'})
+
+    def test_adaptive_test(self):
+        response = self.assertQueries(14, 'post', '/api/student/adaptive/start', self.student,
+                                      {'category_id': self.categories[0].id}, status_code=201)
+        assessment_id = response.json()['assessment_id']
+        question_id = response.json()['question']['question_id']
+
+        self.assertQueries(8, 'get', f'/api/student/adaptive/{assessment_id}', self.student)
+        self.assertQueries(15, 'post', f'/api/student/adaptive/{assessment_id}/answer', self.student,
+                           {'question_id': question_id, 'answer': 'A', 'time_spent': 3})
+
+    def test_student_class_assessments(self):
+        self._submit(self.quiz)
+        self.assertQueries(4, 'get', '/api/student/class/assessments', self.student)
+
+    # Lessons
+
+    def test_lessons(self):
+        response = self.assertQueries(3, 'get', '/api/lessons', self.student)
+        self.assertQueries(2, 'get', '/api/lessons', self.student, status_code=304,
+                           HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_lesson(self):
+        response = self.assertQueries(7, 'get', f'/api/lessons/{self.lesson.id}', self.student)
+        self.assertQueries(3, 'get', f'/api/lessons/{self.lesson.id}', self.student, status_code=304,
+                           HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_update_lesson_progress(self):
+        self.assertQueries(9, 'post', f'/api/lessons/{self.lesson.id}/update_progress', self.student,
+                           {'chapter_id': self.chapters[1].id})
+
+    # Teacher
+
+    def test_teacher_classes(self):
+        self.assertQueries(2, 'get', '/api/teacher/classes', self.teacher)
+
+    def test_create_class(self):
+        self.assertQueries(6, 'post', '/api/teacher/class/create', self.teacher, {'class_name': 'Class B'},
+                           status_code=201)
+
+    def test_student_data(self):
+        self._submit(self.initial_exam)
+        self._submit(self.quiz)
+        self.assertQueries(4, 'get', f'/api/teacher/class/student/{self.student.id}', self.teacher)
+
+    def test_question_bank(self):
+        response = self.assertQueries(3, 'get', '/api/teacher/get_questions', self.teacher,
+                                      {'limit': 10, 'category': [1, 2], 'min_difficulty': -1},
+                                      HTTP_ORIGIN='http://localhost:3000')
+        # The cursor header must be readable by the cross-origin frontend
+        self.assertIn('X-Next-Cursor', response['Access-Control-Expose-Headers'])
+        self.assertQueries(2, 'get', '/api/teacher/get_questions', self.teacher,
+                           {'limit': 10, 'category': [1, 2], 'min_difficulty': -1}, status_code=304,
+                           HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertQueries(3, 'get', '/api/teacher/get_questions', self.teacher,
+                           {'limit': 10, 'category': [1, 2], 'min_difficulty': -1,
+                            'cursor': response['X-Next-Cursor']})
+
+    def test_create_quiz(self):
+        questions = [question.id for question in self.questions[20:25]]
+        self.assertQueries(20, 'post', f'/api/teacher/class/{self.class_obj.id}/create-quiz', self.teacher,
+                           {'name': 'Quiz 2', 'question_source': 'previous_exam', 'questions': questions})
+
+    def test_view_initial_exam(self):
+        self.assertQueries(3, 'get', f'/api/teacher/class/{self.class_obj.id}/view-initial-exam', self.teacher)
+
+    def test_open_initial_exam(self):
+        self.assertQueries(4, 'post', f'/api/teacher/class/{self.class_obj.id}/open-initial-exam', self.teacher,
+                           {'deadline': (timezone.now() + timedelta(days=2)).isoformat()})
+
+    def test_teacher_class_assessments(self):
+        self.assertQueries(4, 'get', f'/api/teacher/class/{self.class_obj.id}/assessments', self.teacher)
+
+    def test_teacher_assessment(self):
+        self._submit(self.quiz)
+        self.assertQueries(7, 'get', f'/api/teacher/class/{self.class_obj.id}/assessment/{self.quiz.id}',
+                           self.teacher)
+
+    def test_gradebook(self):
+        self._submit(self.initial_exam)
+        self._submit(self.quiz, self.classmate)
+        self.assertQueries(5, 'get', f'/api/teacher/class/{self.class_obj.id}/gradebook', self.teacher)
+        self.assertQueries(2, 'get', f'/api/teacher/class/{self.class_obj.id}/gradebook', self.teacher)
+
+    def test_class_export(self):
+        self._submit(self.initial_exam)
+        self.assertQueries(3, 'get', f'/api/teacher/class/{self.class_obj.id}/export', self.teacher,
+                           {'output': 'ndjson', 'gzip': '1'})
+
+    def test_assessment_export(self):
+        self._submit(self.quiz)
+        self.assertQueries(3, 'get', f'/api/teacher/class/{self.class_obj.id}/assessment/{self.quiz.id}/export',
+                           self.teacher)
+
+    def test_teacher_class(self):
+        self.assertQueries(3, 'get', f'/api/teacher/class/{self.class_obj.id}', self.teacher)
+
+
+class AbilityEstimationTests(SimpleTestCase):
+    # (discrimination, difficulty, guessing, correct) rows and the theta the previous per-answer L-BFGS-B
+    # estimator (numerical gradient, started at 0, bounded to [-3, 3]) returned for them
+    REFERENCE = [
+        ([(1.2, -1.0, 0.2, 1), (0.8, 0.0, 0.25, 0), (1.5, 0.5, 0.2, 0), (1.0, 1.5, 0.2, 0), (0.9, -0.5, 0.15, 1),
+          (1.3, 0.2, 0.2, 0)], -0.905932442184143),
+        ([(1.0, -1.5, 0.2, 1), (1.4, -0.5, 0.2, 1), (0.7, 0.0, 0.25, 0), (1.1, 0.5, 0.2, 1), (1.6, 1.0, 0.2, 0),
+          (0.9, 2.0, 0.1, 0), (1.2, 0.3, 0.2, 1), (1.0, -0.2, 0.2, 1)], 0.6172184533038948),
+        ([(1.1, -2.0, 0.2, 1), (1.3, -1.0, 0.2, 1), (0.9, 0.0, 0.2, 1), (1.5, 1.0, 0.2, 1), (1.2, 1.5, 0.2, 0),
+          (0.8, 2.5, 0.2, 1), (1.0, 0.5, 0.2, 1)], 1.9995789375827233),
+    ]
+
+    def test_matches_previous_estimator(self):
+        for rows, expected in self.REFERENCE:
+            self.assertAlmostEqual(estimate_theta(*np.array(rows).T), expected, delta=1e-4)
+
+    def test_gradient_and_hessian(self):
+        epsilon = 1e-5
+        for rows, _ in self.REFERENCE:
+            items = np.array(rows).T
+            for theta in (-2.0, -0.3, 0.8, 2.5):
+                numerical_gradient = (log_likelihood(theta + epsilon, *items)
+                                      - log_likelihood(theta - epsilon, *items)) / (2 * epsilon)
+                numerical_hessian = (log_likelihood_gradient(theta + epsilon, *items)
+                                     - log_likelihood_gradient(theta - epsilon, *items)) / (2 * epsilon)
+                self.assertAlmostEqual(log_likelihood_gradient(theta, *items), numerical_gradient, delta=1e-5)
+                self.assertAlmostEqual(log_likelihood_hessian(theta, *items), numerical_hessian, delta=1e-4)
+
+    def test_perfect_and_zero_scores_pin_to_bounds(self):
+        rows = [(3.0, -1.0, 0.2, 1), (3.0, -0.5, 0.2, 1)]
+        # The previous estimator stopped at 2.5405 on this likelihood plateau
+        self.assertEqual(estimate_theta(*np.array(rows).T), THETA_BOUNDS[1])
+        rows = [(row[0], row[1], row[2], 0) for row in rows]
+        self.assertEqual(estimate_theta(*np.array(rows).T), THETA_BOUNDS[0])
+
+
+class ItemCalibrationTests(SimpleTestCase):
+    def test_recovers_simulated_parameters(self):
+        rng = np.random.default_rng(7)
+        persons, items = 10000, 12
+        discrimination = rng.uniform(0.8, 2.0, items)
+        difficulty = np.linspace(-1.5, 1.5, items)
+        guessing = rng.uniform(0.1, 0.25, items)
+        theta = rng.standard_normal(persons)
+        probability = guessing + (1 - guessing) / (1 + np.exp(-discrimination * (theta[:, None] - difficulty)))
+        correct = rng.random((persons, items)) < probability
+
+        # One more item with too few responses to calibrate
+        person_indices, item_indices = np.indices((persons, items)).reshape(2, -1)
+        responses = ResponseMatrix.from_arrays(np.append(person_indices, 0), np.append(item_indices, items),
+                                               np.append(correct.ravel(), 1), persons, items + 1)
+        result = calibrate(responses, np.ones(items + 1), np.zeros(items + 1), np.full(items + 1, 0.2),
+                           block_size=5)
+
+        self.assertTrue(result.converged)
+        self.assertEqual(result.calibrated.tolist(), [True] * items + [False])
+        self.assertEqual((result.discrimination[-1], result.difficulty[-1], result.guessing[-1]), (1.0, 0.0, 0.2))
+
+        # The guessing parameter is weakly identified, so per-parameter tolerances are loose
+        for expected, estimated, mean_tolerance, max_tolerance in [
+            (discrimination, result.discrimination[:items], 0.15, 0.4),
+            (difficulty, result.difficulty[:items], 0.15, 0.4),
+            (guessing, result.guessing[:items], 0.06, 0.2),
+        ]:
+            errors = np.abs(estimated - expected)
+            self.assertLess(errors.mean(), mean_tolerance)
+            self.assertLess(errors.max(), max_tolerance)
+
+        # The item characteristic curves, which ability estimation actually uses, match closely
+        def curves(a, b, c):
+            nodes = np.linspace(-2.5, 2.5, 21)
+            return c[:, None] + (1 - c[:, None]) / (1 + np.exp(-a[:, None] * (nodes - b[:, None])))
+        fitted = curves(result.discrimination[:items], result.difficulty[:items], result.guessing[:items])
+        self.assertLess(np.abs(fitted - curves(discrimination, difficulty, guessing)).max(), 0.1)
+
+
+class IncrementalAbilityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        teacher = User.objects.create(supabase_user_id='teacher', email='teacher@example.com', first_name='T',
+                                      last_name='T', role=User.TEACHER)
+        cls.class_obj = Class.objects.create(name='Class A', teacher=teacher)
+        cls.student = User.objects.create(supabase_user_id='student', email='student@example.com', first_name='S',
+                                          last_name='S', role=User.STUDENT, enrolled_class=cls.class_obj)
+        cls.category = Category.objects.create(id=1, name='Category 1')
+
+        rng = np.random.default_rng(7)
+        cls.questions = Question.objects.bulk_create(
+            Question(id=f'Q{index:03d}', question_text='Question', category=cls.category, choices={'a': 'A'},
+                     correct_answer='a', discrimination=rng.uniform(0.7, 1.8), difficulty=rng.uniform(-2, 2),
+                     guessing=0.2)
+            for index in range(60)
+        )
+        # Answers of a student with theta 0.5
+        cls.correct = [
+            bool(rng.random() < question.guessing + (1 - question.guessing)
+                 / (1 + np.exp(-question.discrimination * (0.5 - question.difficulty))))
+            for question in cls.questions
+        ]
+
+    def _submit(self, questions, correct):
+        result = AssessmentResult.objects.create(
+            assessment=Assessment.objects.create(class_owner=self.class_obj, type='quiz'), user=self.student)
+        Answer.objects.bulk_create(
+            Answer(assessment_result=result, question=question, chosen_answer='A', is_correct=is_correct)
+            for question, is_correct in zip(questions, correct)
+        )
+        return [(question.category_id, question.discrimination, question.difficulty, question.guessing, is_correct)
+                for question, is_correct in zip(questions, correct)]
+
+    def _full_estimate(self):
+        return estimate_abilities_by_category(*load_response_arrays(
+            Answer.objects.filter(assessment_result__user=self.student)))[self.category.id]
+
+    def test_incremental_matches_full_estimate(self):
+        for start in range(0, 60, 20):
+            update_student_abilities(self.student.id, self._submit(self.questions[start:start + 20],
+                                                                   self.correct[start:start + 20]))
+
+        ability = UserAbility.objects.get(user=self.student, category=self.category)
+        theta, information, answer_count = self._full_estimate()
+        self.assertAlmostEqual(ability.ability_level, theta, delta=0.05)
+        self.assertAlmostEqual(ability.information, information, delta=information * 0.1)
+        self.assertEqual(ability.answer_count, answer_count)
+
+    def test_rows_without_information_are_reestimated(self):
+        # A row written before incremental updates: an estimate but no running statistics
+        self._submit(self.questions[:40], self.correct[:40])
+        UserAbility.objects.create(user=self.student, category=self.category, ability_level=-2.0)
+
+        update_student_abilities(self.student.id, self._submit(self.questions[40:], self.correct[40:]))
+
+        ability = UserAbility.objects.get(user=self.student, category=self.category)
+        theta, information, answer_count = self._full_estimate()
+        self.assertAlmostEqual(ability.ability_level, theta)
+        self.assertAlmostEqual(ability.information, information)
+        self.assertEqual(ability.answer_count, 60)
+
+    def test_missing_rows_with_history_are_reestimated(self):
+        # Answers from before abilities were stored per category, and no row at all
+        self._submit(self.questions[:40], self.correct[:40])
+
+        update_student_abilities(self.student.id, self._submit(self.questions[40:], self.correct[40:]))
+
+        ability = UserAbility.objects.get(user=self.student, category=self.category)
+        theta, information, answer_count = self._full_estimate()
+        self.assertAlmostEqual(ability.ability_level, theta)
+        self.assertAlmostEqual(ability.information, information)
+        self.assertEqual(ability.answer_count, 60)
+
+    def test_recompute_abilities(self):
+        self._submit(self.questions, self.correct)
+        stale = timezone.now() - timedelta(days=1)
+        UserAbility.objects.create(user=self.student, category=self.category, ability_level=-2.0)
+        UserAbility.objects.update(updated_at=stale)
+
+        call_command('recompute_abilities', workers=0, stdout=io.StringIO())
+
+        ability = UserAbility.objects.get(user=self.student, category=self.category)
+        theta, information, answer_count = self._full_estimate()
+        self.assertAlmostEqual(ability.ability_level, theta)
+        self.assertEqual(ability.answer_count, answer_count)
+        self.assertGreater(ability.updated_at, stale)
+
+
+@override_settings(SUPABASE_JWT_SECRET=TEST_JWT_SECRET, SUPABASE_AUTH_REMOTE_FALLBACK=False,
+                   ADAPTIVE_TEST_RANDOMESQUE=1, ADAPTIVE_TEST_MIN_ITEMS=2, ADAPTIVE_TEST_MAX_ITEMS=4,
+                   ADAPTIVE_TEST_TARGET_SE=0.0, JOBS_ENABLED=True)
+class AdaptiveTestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = User.objects.create(supabase_user_id='student', email='student@example.com', first_name='S',
+                                          last_name='S', role=User.STUDENT)
+        cls.category = Category.objects.create(id=1, name='Category 1')
+        Question.objects.bulk_create(
+            Question(id=f'Q{index:03d}', question_text='Question', category=cls.category, difficulty=index / 2 - 2,
+                     discrimination=1.2, guessing=0.2, choices={'a': 'A', 'b': 'B'}, correct_answer='a')
+            for index in range(9)
+        )
+
+    def setUp(self):
+        clear_identity_cache()
+        invalidate_item_bank()
+
+    def _post(self, path, data):
+        token = make_token(self.student.supabase_user_id, secret=TEST_JWT_SECRET)
+        return self.client.post(path, data, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def _start(self):
+        response = self._post('/api/student/adaptive/start', {'category_id': self.category.id})
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+    def _answer(self, assessment_id, question_id, answer='A'):
+        return self._post(f'/api/student/adaptive/{assessment_id}/answer',
+                          {'question_id': question_id, 'answer': answer, 'time_spent': 3})
+
+    def test_select_next_item(self):
+        discrimination = np.array([1.0, 1.0, 1.0, 2.0])
+        difficulty = np.array([-2.0, 0.0, 2.0, 0.1])
+        guessing = np.zeros(4)
+        available = np.array([True, True, True, False])
+
+        self.assertEqual(select_next_item(0.0, discrimination, difficulty, guessing, available), 1)
+        self.assertEqual(select_next_item(2.0, discrimination, difficulty, guessing, available), 2)
+        self.assertEqual(select_next_item(0.0, discrimination, difficulty, guessing, np.ones(4, dtype=bool)), 3)
+        self.assertIsNone(select_next_item(0.0, discrimination, difficulty, guessing, np.zeros(4, dtype=bool)))
+        # 2PL information at theta == difficulty is a^2 / 4
+        self.assertAlmostEqual(item_information(0.0, discrimination, difficulty, guessing)[1], 0.25)
+
+    def test_should_stop(self):
+        self.assertFalse(should_stop(1, 0.1, min_items=2, max_items=4, target_standard_error=0.3))
+        self.assertTrue(should_stop(2, 0.3, min_items=2, max_items=4, target_standard_error=0.3))
+        self.assertFalse(should_stop(3, 0.5, min_items=2, max_items=4, target_standard_error=0.3))
+        self.assertTrue(should_stop(4, 0.5, min_items=2, max_items=4, target_standard_error=0.3))
+
+    def test_stops_at_max_items_and_finishes(self):
+        started = self._start()
+        assessment_id = started['assessment_id']
+        question_id = started['question']['question_id']
+        # Unfinished tests have no result, so they stay out of history, tallies and gradebooks
+        self.assertFalse(AssessmentResult.objects.exists())
+
+        for answered in range(1, 4):
+            data = self._answer(assessment_id, question_id, 'A' if answered % 2 else 'B').json()
+            self.assertEqual((data['finished'], data['items_answered']), (False, answered))
+            self.assertNotEqual(data['question']['question_id'], question_id)
+            question_id = data['question']['question_id']
+        self.assertFalse(AssessmentResult.objects.exists())
+
+        data = self._answer(assessment_id, question_id).json()
+        self.assertEqual((data['finished'], data['items_answered'], data['score']), (True, 4, 3))
+
+        result = AssessmentResult.objects.get(assessment_id=assessment_id, user=self.student)
+        self.assertEqual((result.score, result.total_items, result.time_taken), (3, 4, 12))
+        self.assertEqual(result.category_tallies,
+                         [{'category_name': 'Category 1', 'correct_answer': 3, 'wrong_answer': 1}])
+        self.assertEqual(result.answers.count(), 4)
+        self.assertTrue(Job.objects.filter(name='finish_submission', status=Job.QUEUED).exists())
+
+        self.assertEqual(self._answer(assessment_id, question_id).status_code, 400)
+
+    @override_settings(ADAPTIVE_TEST_TARGET_SE=5.0)
+    def test_stops_at_target_standard_error(self):
+        started = self._start()
+        data = self._answer(started['assessment_id'], started['question']['question_id']).json()
+        self.assertFalse(data['finished'])
+        data = self._answer(started['assessment_id'], data['question']['question_id']).json()
+        self.assertEqual((data['finished'], data['items_answered']), (True, 2))
+
+    def test_answer_recorded_once(self):
+        started = self._start()
+        question_id = started['question']['question_id']
+        self.assertEqual(self._answer(started['assessment_id'], question_id).status_code, 200)
+        self.assertEqual(self._answer(started['assessment_id'], question_id).status_code, 400)
+        progress = AssessmentProgress.objects.get(assessment_id=started['assessment_id'])
+        self.assertEqual([response['question_id'] for response in progress.adaptive_responses], [question_id])
+
+
+@override_settings(SUPABASE_JWT_SECRET=TEST_JWT_SECRET, SUPABASE_AUTH_REMOTE_FALLBACK=False, JOBS_ENABLED=True)
+class GradingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        teacher = User.objects.create(supabase_user_id='teacher', email='teacher@example.com', first_name='T',
+                                      last_name='T', role=User.TEACHER)
+        class_obj = Class.objects.create(name='Class A', teacher=teacher)
+        cls.student = User.objects.create(supabase_user_id='student', email='student@example.com', first_name='S',
+                                          last_name='S', role=User.STUDENT, enrolled_class=class_obj)
+        category = Category.objects.create(id=1, name='Category 1')
+        cls.questions = Question.objects.bulk_create(
+            Question(id=f'Q{index}', question_text='Question', category=category,
+                     choices={'a': 'A', 'b': 'B'}, correct_answer='a')
+            for index in range(4)
+        )
+        cls.quiz = Assessment.objects.create(name='Quiz', class_owner=class_obj, type='quiz')
+        cls.quiz.questions.set(cls.questions[:2])
+
+    def setUp(self):
+        clear_identity_cache()
+        cache.clear()
+
+    def test_answer_key_follows_question_set(self):
+        self.assertEqual(set(get_answer_key(Assessment.objects.get(id=self.quiz.id))), {'Q0', 'Q1'})
+
+        self.quiz.questions.set(self.questions[2:])
+        self.assertEqual(set(get_answer_key(Assessment.objects.get(id=self.quiz.id))), {'Q2', 'Q3'})
+
+        # Changes made from the question side count too
+        self.questions[0].assessments.add(self.quiz)
+        self.assertEqual(set(get_answer_key(Assessment.objects.get(id=self.quiz.id))), {'Q0', 'Q2', 'Q3'})
+
+    def test_double_submit(self):
+        token = make_token(self.student.supabase_user_id, secret=TEST_JWT_SECRET)
+        data = {'answers': [{'question_id': 'Q0', 'answer': 'A'}, {'question_id': 'Q1', 'answer': 'B'}]}
+
+        def submit():
+            return self.client.post(f'/api/student/exam/{self.quiz.id}/submit', data, content_type='application/json',
+                                    HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        self.assertEqual(submit().status_code, 201)
+        response = submit()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Exam was already taken.'})
+
+        # The losing submit rolled back entirely
+        result = AssessmentResult.objects.get(assessment=self.quiz, user=self.student)
+        self.assertEqual((result.score, result.answers.count()), (1, 2))
+        self.assertEqual(Job.objects.filter(name='finish_submission').count(), 1)
+
+    @override_settings(JOBS_ENABLED=False)
+    def test_submit_without_worker(self):
+        token = make_token(self.student.supabase_user_id, secret=TEST_JWT_SECRET)
+        data = {'answers': [{'question_id': 'Q0', 'answer': 'A'}, {'question_id': 'Q1', 'answer': 'B'}]}
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/student/exam/{self.quiz.id}/submit', data,
+                                        content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(Job.objects.exists())
+        # The post-submit work ran in the request's process instead
+        self.assertEqual(UserAbility.objects.get(user=self.student, category_id=1).answer_count, 2)
+
+    @override_settings(API_PAGE_SIZE=1)
+    def test_history_pages(self):
+        token = make_token(self.student.supabase_user_id, secret=TEST_JWT_SECRET)
+        for days in range(3):
+            quiz = Assessment.objects.create(name=f'Quiz {days}', class_owner=self.quiz.class_owner, type='quiz')
+            AssessmentResult.objects.create(assessment=quiz, user=self.student,
+                                            submitted_at=quiz.created_at + timedelta(days=days))
+
+        def get(**params):
+            return self.client.get('/api/student/history', params, HTTP_AUTHORIZATION=f'Bearer {token}',
+                                   HTTP_ORIGIN='http://localhost:3000')
+
+        # Without limit or cursor the whole history comes back, as before pagination
+        response = get()
+        self.assertEqual(len(response.json()), 3)
+        self.assertNotIn('X-Next-Cursor', response)
+
+        pages = [get(limit=2)]
+        pages.append(get(limit=2, cursor=pages[0]['X-Next-Cursor']))
+        self.assertEqual([len(page.json()) for page in pages], [2, 1])
+        self.assertNotIn('X-Next-Cursor', pages[1])
+        # The cross-origin frontend can read the cursor
+        self.assertIn('X-Next-Cursor', pages[0]['Access-Control-Expose-Headers'])
+
+    def test_history_date_taken(self):
+        token = make_token(self.student.supabase_user_id, secret=TEST_JWT_SECRET)
+        AssessmentResult.objects.create(assessment=self.quiz, user=self.student,
+                                        submitted_at=self.quiz.created_at + timedelta(days=3))
+
+        history = self.client.get('/api/student/history', HTTP_AUTHORIZATION=f'Bearer {token}').json()
+        # date_taken keeps meaning the assessment's creation date; submitted_at only orders the list
+        self.assertEqual(history[0]['date_taken'].replace('Z', '+00:00'), self.quiz.created_at.isoformat())
+
+
+@override_settings(SUPABASE_JWT_SECRET=TEST_JWT_SECRET, SUPABASE_AUTH_REMOTE_FALLBACK=False)
+class GradebookExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create(supabase_user_id='teacher', email='teacher@example.com', first_name='T',
+                                          last_name='T', role=User.TEACHER)
+        cls.class_obj = Class.objects.create(name='Class A', teacher=cls.teacher)
+        cls.ann, cls.bob = (
+            User.objects.create(supabase_user_id=name, email=f'{name}@example.com', first_name=name.title(),
+                                last_name=last_name, role=User.STUDENT, enrolled_class=cls.class_obj)
+            for name, last_name in (('ann', 'Adams'), ('bob', 'Brown'))
+        )
+        category = Category.objects.create(id=1, name='Algebra')
+        questions = Question.objects.bulk_create(
+            Question(id=f'Q{index}', question_text='Question', category=category, choices={'a': 'A'},
+                     correct_answer='a')
+            for index in range(3)
+        )
+        cls.quiz, cls.exam = (
+            Assessment.objects.create(name=name, class_owner=cls.class_obj, type=kind)
+            for name, kind in (('Quiz', 'quiz'), ('Exam', 'exam'))
+        )
+        cls.quiz.questions.set(questions[:2])
+        cls.exam.questions.set(questions)
+
+        def result(assessment, user, score, submitted_at, answers):
+            result = AssessmentResult.objects.create(assessment=assessment, user=user, score=score, time_taken=30,
+                                                     submitted_at=submitted_at)
+            Answer.objects.bulk_create(
+                Answer(assessment_result=result, question=questions[index], chosen_answer=chosen,
+                       is_correct=chosen == 'A', time_spent=5)
+                for index, chosen in enumerate(answers)
+            )
+
+        day = timezone.make_aware(timezone.datetime(2026, 3, 1, 12))
+        result(cls.quiz, cls.ann, 2, day, ['A', 'A'])
+        result(cls.quiz, cls.bob, 1, day + timedelta(days=1), ['A', 'B'])
+        result(cls.exam, cls.ann, 1, day + timedelta(days=2), ['B', 'A', 'C'])
+
+    def setUp(self):
+        clear_identity_cache()
+        cache.clear()
+
+    def _get(self, path, data=None):
+        token = make_token(self.teacher.supabase_user_id, secret=TEST_JWT_SECRET)
+        response = self.client.get(path, data, HTTP_AUTHORIZATION=f'Bearer {token}')
+        if hasattr(response, 'streaming_content'):
+            response.body = b''.join(response.streaming_content)
+        return response
+
+    def _export(self, data=None, path=None):
+        return self._get(path or f'/api/teacher/class/{self.class_obj.id}/export', data)
+
+    def test_gradebook(self):
+        gradebook = self._get(f'/api/teacher/class/{self.class_obj.id}/gradebook').json()
+
+        self.assertEqual([(column['name'], column['no_of_items'], column['taken_count'], column['average_score'],
+                           column['completion_rate']) for column in gradebook['assessments']],
+                         [('Quiz', 2, 2, 1.5, 1.0), ('Exam', 3, 1, 1.0, 0.5)])
+        self.assertEqual([(student['student_name'], student['scores']) for student in gradebook['students']],
+                         [('Ann Adams', [2, 1]), ('Bob Brown', [1, None])])
+
+        # A new result invalidates the cached gradebook
+        AssessmentResult.objects.create(assessment=self.exam, user=self.bob, score=3)
+        gradebook = self._get(f'/api/teacher/class/{self.class_obj.id}/gradebook').json()
+        self.assertEqual(gradebook['students'][1]['scores'], [1, 3])
+
+    def test_csv_export(self):
+        response = self._export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn(f'filename="class-{self.class_obj.id}-results.csv"', response['Content-Disposition'])
+
+        rows = list(csv.DictReader(io.StringIO(response.body.decode())))
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(
+            {key: rows[3][key] for key in ('assessment_name', 'student_first_name', 'question_id', 'category',
+                                           'chosen_answer', 'is_correct', 'score')},
+            {'assessment_name': 'Quiz', 'student_first_name': 'Bob', 'question_id': 'Q1', 'category': 'Algebra',
+             'chosen_answer': 'B', 'is_correct': 'False', 'score': '1'},
+        )
+
+    def test_ndjson_export(self):
+        response = self._export({'output': 'ndjson'},
+                                f'/api/teacher/class/{self.class_obj.id}/assessment/{self.exam.id}/export')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+
+        rows = [json.loads(line) for line in response.body.decode().splitlines()]
+        self.assertEqual([(row['question_id'], row['chosen_answer'], row['is_correct']) for row in rows],
+                         [('Q0', 'B', False), ('Q1', 'A', True), ('Q2', 'C', False)])
+        self.assertEqual(rows[0]['submitted_at'], '2026-03-03T12:00:00Z')
+
+    def test_date_filters(self):
+        def students(data):
+            body = self._export({'output': 'ndjson', **data}).body.decode()
+            return [(row['assessment_name'], row['student_first_name'])
+                    for row in map(json.loads, body.splitlines())]
+
+        self.assertEqual(set(students({'since': '2026-03-02'})), {('Quiz', 'Bob'), ('Exam', 'Ann')})
+        # A bare until date includes that whole day
+        self.assertEqual(set(students({'until': '2026-03-02'})), {('Quiz', 'Ann'), ('Quiz', 'Bob')})
+        self.assertEqual(set(students({'since': '2026-03-02T00:00:00Z', 'until': '2026-03-02T23:00:00Z'})),
+                         {('Quiz', 'Bob')})
+
+        response = self._export({'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Invalid date: yesterday'})
+        self.assertEqual(self._export({'output': 'xlsx'}).status_code, 400)
+
+    def test_gzip_export(self):
+        response = self._export({'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('results.csv.gz"', response['Content-Disposition'])
+        self.assertEqual(gzip.decompress(response.body), self._export().body)
+
+
+QUESTIONS_CSV = """flag,id,question,image,a,b,c,d,answer,category,difficulty,discrimination,guessing
+1,Q1,What is 1 + 1?,,1,2,3,4,b,Basic Theory,-1.0,1.2,0.2
+1,Q2,What is 2 + 2?,,2,4,6,8,B,Basic Theory,0.0,1.0,0.2
+1,Q3,What is 2 in binary?,https://example.com/q3.png,1,10,11,100,b,Computer System,0.5,0.8,0.25
+,Q4,Not flagged,,a,b,c,d,a,Basic Theory,0,1,0
+1,Q5,Unknown category,,a,b,c,d,a,Astrology,0,1,0
+1,Q6,Bad answer,,a,b,c,d,e,Basic Theory,0,1,0
+1,Q7,Bad parameters,,a,b,c,d,a,Basic Theory,hard,1,0
+1,,Missing id,,a,b,c,d,a,Basic Theory,0,1,0
+1,Q8,Bad guessing,,a,b,c,d,a,Basic Theory,0,1,1.5
+"""
+
+
+class QuestionImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Category.objects.create(id=1, name='Basic Theory')
+        Category.objects.create(id=2, name='Computer System')
+
+    def _import(self, text=QUESTIONS_CSV):
+        report = ImportReport()
+        rows = list(csv.reader(io.StringIO(text)))
+        import_questions(parse_question_rows(rows[1:], CATEGORY_MAPPING, report), report)
+        return report
+
+    def _counts(self, report):
+        return report.created, report.updated, report.unchanged
+
+    def test_first_import(self):
+        report = self._import()
+
+        self.assertEqual(self._counts(report), (3, 0, 0))
+        self.assertEqual([row for row, _ in report.rejected], [6, 7, 8, 9, 10])
+        self.assertEqual(report.rejected[0], (6, "Category 'Astrology' not found."))
+
+        question = Question.objects.get(id='Q3')
+        self.assertEqual((question.category_id, question.image_url, question.correct_answer, question.guessing),
+                         (2, 'https://example.com/q3.png', 'b', 0.25))
+        self.assertEqual(question.choices, {'a': '1', 'b': '10', 'c': '11', 'd': '100'})
+        self.assertEqual(question.content_hash, question.compute_content_hash())
+
+    def test_unchanged_rows_are_not_written(self):
+        self._import()
+        with self.assertNumQueries(2):  # category check and existing hashes, no writes
+            report = self._import()
+        self.assertEqual(self._counts(report), (0, 0, 3))
+
+    def test_changed_rows_are_updated(self):
+        self._import()
+        report = self._import(QUESTIONS_CSV.replace('What is 2 + 2?', 'What is 2 + 3?')
+                              .replace('0.5,0.8,0.25', '0.6,0.8,0.25'))
+
+        self.assertEqual(self._counts(report), (0, 2, 1))
+        self.assertEqual(Question.objects.get(id='Q2').question_text, 'What is 2 + 3?')
+        self.assertEqual(Question.objects.get(id='Q3').difficulty, 0.6)
+
+    def test_calibrated_parameters_are_kept(self):
+        self._import()
+        Question.objects.filter(id='Q1').update(discrimination=1.7, difficulty=0.3, guessing=0.15,
+                                                calibrated_at=timezone.now())
+
+        report = self._import(QUESTIONS_CSV.replace('What is 1 + 1?', 'What is one plus one?')
+                              .replace('-1.0,1.2,0.2', '-2.0,1.2,0.2'))
+
+        self.assertEqual(self._counts(report), (0, 1, 2))
+        question = Question.objects.get(id='Q1')
+        self.assertEqual(question.question_text, 'What is one plus one?')
+        self.assertEqual((question.discrimination, question.difficulty, question.guessing), (1.7, 0.3, 0.15))
+
+    def test_command_reports_rejected_rows(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as csv_file:
+            csv_file.write(QUESTIONS_CSV)
+            csv_file.flush()
+            stdout, stderr = io.StringIO(), io.StringIO()
+            call_command('upload_questions', csv_path=csv_file.name, stdout=stdout, stderr=stderr)
+
+        self.assertIn('3 created, 0 updated, 0 unchanged, 5 rejected', stdout.getvalue())
+        self.assertIn("Row 7 rejected: Correct answer 'e' is not one of a, b, c, d.", stderr.getvalue())
+
+
+LESSONS_CSV = """lesson,chapter number,chapter,content
+Networks,1,Layers,The OSI model has seven layers.
+Networks,2,Addresses,IPv4 addresses have 32 bits.
+Databases,1,Tables,Rows and columns.
+Databases,x,Broken,Not a number.
+"""
+
+
+class LessonImportTests(TestCase):
+    def _import(self, text=LESSONS_CSV):
+        report = LessonImportReport()
+        rows = list(csv.reader(io.StringIO(text)))
+        return import_lessons(parse_lesson_rows(rows[1:], report), report)
+
+    def _chapters(self, lesson_name):
+        return dict(Chapter.objects.filter(lesson__lesson_name=lesson_name).values_list('chapter_number', 'id'))
+
+    def _versions(self):
+        return dict(Lesson.objects.values_list('lesson_name', 'version'))
+
+    def test_first_import(self):
+        report = self._import()
+
+        self.assertEqual((report.lessons_created, report.created, report.rejected),
+                         (2, 3, [(5, "Chapter number 'x' is not an integer.")]))
+        self.assertEqual(Chapter.objects.get(lesson__lesson_name='Networks', chapter_number=2).content,
+                         'IPv4 addresses have 32 bits.')
+        self.assertEqual(get_version(LESSONS), 1)
+
+    def test_reimport_unchanged(self):
+        self._import()
+        versions = self._versions()
+
+        report = self._import()
+
+        self.assertEqual((report.created, report.updated, report.unchanged, report.deleted), (0, 0, 3, 0))
+        self.assertEqual(report.lessons_changed, 0)
+        self.assertEqual(self._versions(), versions)
+        self.assertEqual(get_version(LESSONS), 1)
+
+    def test_upsert_keeps_chapter_ids(self):
+        self._import()
+        chapters = self._chapters('Networks')
+        versions = self._versions()
+
+        report = self._import(LESSONS_CSV.replace('32 bits', '32 bits and IPv6 ones 128'))
+
+        self.assertEqual((report.created, report.updated, report.unchanged), (0, 1, 2))
+        # Updated in place, so student progress pointing at the chapter survives
+        self.assertEqual(self._chapters('Networks'), chapters)
+        self.assertEqual(Chapter.objects.get(id=chapters[2]).content, 'IPv4 addresses have 32 bits and IPv6 ones 128.')
+        self.assertEqual(self._versions(), {'Networks': versions['Networks'] + 1, 'Databases': versions['Databases']})
+
+    def test_stale_chapters_are_deleted(self):
+        self._import()
+        versions = self._versions()
+
+        report = self._import('\n'.join(LESSONS_CSV.splitlines()[:2]) + '\n')
+
+        self.assertEqual((report.unchanged, report.deleted), (1, 1))
+        self.assertEqual(set(self._chapters('Networks')), {1})
+        # Lessons missing from the source are left alone
+        self.assertEqual(set(self._chapters('Databases')), {1})
+        self.assertEqual(self._versions(), {'Networks': versions['Networks'] + 1, 'Databases': versions['Databases']})
+
+
+class LessonDuplicateMergeTests(TransactionTestCase):
+    """Chapters stored twice under one number by the old importer, before the unique constraint existed."""
+
+    def setUp(self):
+        self.constraint, = [constraint for constraint in Chapter._meta.constraints
+                            if constraint.name == 'unique_chapter_number_per_lesson']
+        # SQLite rebuilds the table from the model's constraints, so the model must not list it either
+        with mock.patch.object(Chapter._meta, 'constraints', []), connection.schema_editor() as editor:
+            editor.remove_constraint(Chapter, self.constraint)
+
+    def tearDown(self):
+        Chapter.objects.all().delete()
+        with connection.schema_editor() as editor:
+            editor.add_constraint(Chapter, self.constraint)
+
+    def test_merge_duplicates(self):
+        lesson = Lesson.objects.create(lesson_name='Networks')
+        old, new = (Chapter.objects.create(lesson=lesson, chapter_number=1, chapter_name='Layers', content=content)
+                    for content in ('Old text', 'New text'))
+        other = Chapter.objects.create(lesson=lesson, chapter_number=2, chapter_name='Addresses', content='Text')
+        student = User.objects.create(supabase_user_id='student', email='student@example.com', first_name='S',
+                                      last_name='S', role=User.STUDENT)
+        progress = LessonProgress.objects.create(user=student, lesson=lesson, current_chapter=old)
+        version = Lesson.objects.get(id=lesson.id).version
+
+        stdout = io.StringIO()
+        call_command('upload_lessons', merge_duplicates=True, stdout=stdout)
+
+        self.assertIn('1 deleted', stdout.getvalue())
+        self.assertEqual(set(Chapter.objects.values_list('id', flat=True)), {new.id, other.id})
+        progress.refresh_from_db()
+        self.assertEqual(progress.current_chapter_id, new.id)
+        self.assertEqual(Lesson.objects.get(id=lesson.id).version, version + 1)
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _encode_token(payload, secret=TEST_JWT_SECRET, private_key=None, kid='key-1'):
+    """An HS256 token signed with ``secret``, or an RS256 one signed with ``private_key``."""
+    header = {'alg': 'RS256', 'typ': 'JWT', 'kid': kid} if private_key else {'alg': 'HS256', 'typ': 'JWT'}
+    claims = {'sub': 'user-1', 'aud': 'authenticated', 'exp': int(time.time()) + 3600, **payload}
+    signing_input = f'{_b64encode(json.dumps(header).encode())}.{_b64encode(json.dumps(claims).encode())}'.encode()
+    if private_key:
+        signature = rsa.sign(signing_input, private_key, 'SHA-256')
+    else:
+        signature = hmac.new(secret.encode(), signing_input, hashlib.sha256).digest()
+    return f'{signing_input.decode()}.{_b64encode(signature)}'
+
+
+@override_settings(SUPABASE_JWT_SECRET=TEST_JWT_SECRET, SUPABASE_JWT_AUDIENCE='authenticated', SUPABASE_JWT_LEEWAY=10,
+                   SUPABASE_AUTH_VERIFY_LOCALLY=True, SUPABASE_AUTH_REMOTE_FALLBACK=False,
+                   SUPABASE_JWKS_URL='https://example.supabase.co/auth/v1/.well-known/jwks.json')
+class JwtVerifierTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.public_key, cls.private_key = rsa.newkeys(1024)
+
+    def setUp(self):
+        clear_claims_cache()
+        self.addCleanup(clear_claims_cache)
+        # A fresh JWKS cache holding the test key, fetched on first use
+        self.fetch_jwks = self.enterContext(
+            mock.patch.object(jwt_verifier, '_fetch_jwks', return_value={'key-1': self.public_key}))
+        self.enterContext(mock.patch.object(jwt_verifier, '_jwks_keys', {}))
+        self.enterContext(mock.patch.object(jwt_verifier, '_jwks_fetched_at', None))
+        self.verify_remotely = self.enterContext(
+            mock.patch.object(jwt_verifier, '_verify_remotely', return_value='remote-user'))
+
+    def test_hs256(self):
+        self.assertEqual(verify_token(_encode_token({})), 'user-1')
+
+    def test_bad_hs256_signature(self):
+        self.assertIsNone(verify_token(_encode_token({}, secret='other-secret')))
+
+    def test_expired(self):
+        self.assertIsNone(verify_token(_encode_token({'exp': int(time.time()) - 60})))
+        # Within the leeway
+        self.assertEqual(verify_token(_encode_token({'exp': int(time.time()) - 5})), 'user-1')
+
+    def test_wrong_audience(self):
+        self.assertIsNone(verify_token(_encode_token({'aud': 'anon'})))
+        self.assertEqual(verify_token(_encode_token({'aud': ['other', 'authenticated']})), 'user-1')
+
+    def test_rs256(self):
+        self.assertEqual(verify_token(_encode_token({}, private_key=self.private_key)), 'user-1')
+
+    def test_rs256_bad_signature(self):
+        _, other_key = rsa.newkeys(1024)
+        self.assertIsNone(verify_token(_encode_token({}, private_key=other_key)))
+
+    def test_rs256_unknown_kid(self):
+        self.assertIsNone(verify_token(_encode_token({}, private_key=self.private_key, kid='key-2')))
+        # The JWKS was fetched once and is not refetched for every forged kid
+        self.assertIsNone(verify_token(_encode_token({'sub': 'user-2'}, private_key=self.private_key, kid='key-3')))
+        self.assertEqual(self.fetch_jwks.call_count, 1)
+        self.verify_remotely.assert_not_called()
+
+    def test_cache_hit(self):
+        token = _encode_token({})
+        with mock.patch.object(jwt_verifier, 'decode_token', wraps=jwt_verifier.decode_token) as decode:
+            self.assertEqual(verify_token(token), 'user-1')
+            self.assertEqual(verify_token(token), 'user-1')
+        self.assertEqual(decode.call_count, 1)
+
+    def test_cached_token_expires(self):
+        token = _encode_token({'exp': int(time.time()) + 1})
+        self.assertEqual(verify_token(token), 'user-1')
+        with mock.patch.object(jwt_verifier.time, 'time', return_value=time.time() + 60):
+            self.assertIsNone(verify_token(token))
+
+    @override_settings(SUPABASE_AUTH_REMOTE_FALLBACK=True)
+    def test_remote_fallback(self):
+        self.assertEqual(verify_token(_encode_token({}, private_key=self.private_key, kid='key-2')), 'remote-user')
+        with override_settings(SUPABASE_JWT_SECRET=None):
+            self.assertEqual(verify_token(_encode_token({'sub': 'user-2'})), 'remote-user')
+        # Tokens that fail local checks are never sent to Supabase
+        self.assertIsNone(verify_token(_encode_token({'sub': 'user-3'}, secret='other-secret')))
+        self.assertEqual(self.verify_remotely.call_count, 2)
+
+    @override_settings(SUPABASE_AUTH_REMOTE_FALLBACK=True)
+    def test_remote_fallback_rejects(self):
+        self.verify_remotely.side_effect = RuntimeError('invalid JWT')
+        self.assertIsNone(verify_token(_encode_token({}, private_key=self.private_key, kid='key-2')))
+
+    @override_settings(SUPABASE_JWT_SECRET=None)
+    def test_remote_fallback_disabled(self):
+        self.assertIsNone(verify_token(_encode_token({})))
+        self.verify_remotely.assert_not_called()
+
+
+@override_settings(SUPABASE_JWT_SECRET=TEST_JWT_SECRET, SUPABASE_AUTH_REMOTE_FALLBACK=False)
+class QuizOwnershipTests(TestCase):
+    """``update_quiz`` and ``delete_quiz`` are not routed yet; they must still only act on the teacher's own quizzes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create(supabase_user_id='teacher', email='teacher@example.com', first_name='T',
+                                          last_name='T', role=User.TEACHER)
+        cls.other_teacher = User.objects.create(supabase_user_id='other', email='other@example.com', first_name='O',
+                                                last_name='O', role=User.TEACHER)
+        cls.student = User.objects.create(supabase_user_id='student', email='student@example.com', first_name='S',
+                                          last_name='S', role=User.STUDENT)
+        class_obj = Class.objects.create(name='Class A', teacher=cls.teacher)
+        cls.quiz = Assessment.objects.create(name='Quiz', class_owner=class_obj, type='quiz')
+
+    def setUp(self):
+        clear_identity_cache()
+        self.factory = APIRequestFactory()
+
+    def _call(self, view, method, user=None, data=None):
+        headers = {}
+        if user:
+            headers['HTTP_AUTHORIZATION'] = f'Bearer {make_token(user.supabase_user_id, secret=TEST_JWT_SECRET)}'
+        request = getattr(self.factory, method)(f'/quiz/{self.quiz.id}', data, format='json', **headers)
+        return view(request, quiz_id=self.quiz.id)
+
+    def test_update_quiz(self):
+        deadline = '2030-01-01T00:00:00Z'
+        self.assertEqual(self._call(update_quiz, 'put', data={'deadline': deadline}).status_code, 401)
+        self.assertEqual(self._call(update_quiz, 'put', self.student, {'deadline': deadline}).status_code, 403)
+        self.assertEqual(self._call(update_quiz, 'put', self.other_teacher, {'deadline': deadline}).status_code, 404)
+        self.assertEqual(self._call(update_quiz, 'put', self.teacher, {'deadline': deadline}).status_code, 200)
+        self.quiz.refresh_from_db()
+        self.assertEqual(self.quiz.deadline.year, 2030)
+
+    def test_delete_quiz(self):
+        self.assertEqual(self._call(delete_quiz, 'delete', self.other_teacher).status_code, 404)
+        self.assertEqual(self._call(delete_quiz, 'delete', self.teacher).status_code, 204)
+        self.assertFalse(Assessment.objects.filter(id=self.quiz.id).exists())
+
+
+@override_settings(SUPABASE_JWT_SECRET=TEST_JWT_SECRET, SUPABASE_AUTH_REMOTE_FALLBACK=False, API_METRICS_ENABLED=True,
+                   API_SERVER_TIMING=True, API_METRICS_TOKEN='scrape-token')
+class RequestMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create(supabase_user_id='teacher', email='teacher@example.com', first_name='T',
+                                          last_name='T', role=User.TEACHER)
+        Class.objects.create(name='Class A', teacher=cls.teacher)
+
+    def setUp(self):
+        clear_identity_cache()
+        registry.reset()
+
+    def _get_classes(self):
+        clear_identity_cache()
+        token = make_token(self.teacher.supabase_user_id, secret=TEST_JWT_SECRET)
+        return self.client.get('/api/teacher/classes', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_server_timing(self):
+        response = self._get_classes()
+        phases = {entry.split(';')[0]: entry for entry in response['Server-Timing'].split(', ')}
+        self.assertEqual(set(phases), {'auth', 'db', 'render', 'total'})
+        self.assertIn('desc="2 queries"', phases['db'])
+
+    def test_metrics_endpoint(self):
+        self._get_classes()
+        self._get_classes()
+
+        body = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token').content.decode()
+        self.assertIn('api_requests_total{route="/api/teacher/classes",method="GET",status="200"} 2', body)
+        self.assertIn('api_request_duration_seconds_count{route="/api/teacher/classes",method="GET"} 2', body)
+        self.assertIn('api_request_phase_seconds_count{route="/api/teacher/classes",phase="db"} 2', body)
+        self.assertIn('api_db_queries_total{route="/api/teacher/classes"} 4', body)
+
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token').status_code, 200)
+
+    @override_settings(API_METRICS_TOKEN=None)
+    def test_metrics_private_without_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+
+class SupabaseClientPoolTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = start_stub_auth_server()
+        host, port = cls.server.server_address
+        cls.enterClassContext(override_settings(SUPABASE_URL=f'http://{host}:{port}',
+                                                SUPABASE_ANON_KEY=make_token('anon')))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        supabase_client.close_http_client()
+        self.addCleanup(supabase_client.close_http_client)
+
+    def test_clients_share_connections_but_not_sessions(self):
+        first = supabase_client.get_supabase_client()
+        second = supabase_client.get_supabase_client()
+        connections = self.server.connections
+
+        first.auth.sign_in_with_password({'email': 'first@example.com', 'password': 'secret'})
+        second.auth.sign_in_with_password({'email': 'second@example.com', 'password': 'secret'})
+
+        self.assertEqual(self.server.connections - connections, 1)
+        self.assertEqual(first.auth.get_session().user.email, 'first@example.com')
+        self.assertEqual(second.auth.get_session().user.email, 'second@example.com')
+
+    def test_fork_resets_pool(self):
+        pool = supabase_client.get_http_client()
+        supabase_client._reset_after_fork()
+        self.assertIsNot(supabase_client.get_http_client(), pool)
+        self.assertFalse(pool.is_closed)
+        pool.close()
+
+
+@override_settings(SUPABASE_JWT_SECRET=TEST_JWT_SECRET, SUPABASE_AUTH_REMOTE_FALLBACK=False, API_METRICS_ENABLED=True,
+                   API_SERVER_TIMING=True)
+class AsyncAuthViewTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = start_stub_auth_server()
+        host, port = cls.server.server_address
+        cls.enterClassContext(override_settings(SUPABASE_URL=f'http://{host}:{port}',
+                                                SUPABASE_ANON_KEY=make_token('anon')))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        # The stub derives user ids from emails
+        cls.student = User.objects.create(supabase_user_id=str(uuid.uuid5(uuid.NAMESPACE_URL, 'student@example.com')),
+                                          email='student@example.com', first_name='S', last_name='S',
+                                          role=User.STUDENT)
+
+    def setUp(self):
+        clear_identity_cache()
+
+    async def test_login(self):
+        response = await self.async_client.post('/api/login/', {'email': 'student@example.com', 'password': 'secret'},
+                                                content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['role'], User.STUDENT)
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+    async def test_register(self):
+        response = await self.async_client.post('/api/register/', {
+            'email': 'new@example.com', 'password': 'secret', 'first_name': 'N', 'last_name': 'N',
+            'role': User.STUDENT,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(await User.objects.filter(email='new@example.com').aexists())
+
+    async def test_update_password(self):
+        token = make_token(self.student.supabase_user_id, secret=TEST_JWT_SECRET)
+        data = {'current_password': 'secret', 'new_password': 'new-secret'}
+        response = await self.async_client.post('/api/update-password/', data, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), {'error': 'User not authenticated.'})
+
+        response = await self.async_client.post('/api/update-password/', data, content_type='application/json',
+                                                headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_sync_client(self):
+        response = self.client.post('/api/refresh-token/', {'refresh_token': f'refresh-{self.student.supabase_user_id}'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/refresh-token/').status_code, 405)
+
+    def test_wsgi_requests_share_the_sync_pool(self):
+        supabase_client.close_http_client()
+        self.addCleanup(supabase_client.close_http_client)
+        connections, pools = self.server.connections, len(supabase_client._async_http_clients)
+
+        # Each WSGI request runs the async view on a new event loop
+        for _ in range(5):
+            response = self.client.post('/api/login/', {'email': 'student@example.com', 'password': 'secret'},
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.server.connections - connections, 1)
+        self.assertEqual(len(supabase_client._async_http_clients), pools)
+
+
+_flaky_calls = []
+
+
+@job('test_flaky')
+def _flaky(fail_times=0, token=None):
+    _flaky_calls.append(token)
+    if len([call for call in _flaky_calls if call == token]) <= fail_times:
+        raise RuntimeError('flaky')
+
+
+@override_settings(JOBS_ENABLED=True, JOBS_RETRY_BASE_DELAY=0, JOBS_MAX_ATTEMPTS=3, JOBS_LOCK_TIMEOUT=60)
+class JobQueueTests(TestCase):
+    def setUp(self):
+        _flaky_calls.clear()
+
+    def test_priority_order(self):
+        low = enqueue('test_flaky', {'token': 'low'})
+        high = enqueue('test_flaky', {'token': 'high'}, priority=5)
+        self.assertEqual([job.id for job in claim_jobs('w', limit=2)], [high.id, low.id])
+
+    def test_claimed_once(self):
+        enqueue('test_flaky')
+        self.assertEqual(len(claim_jobs('first')), 1)
+        self.assertEqual(claim_jobs('second'), [])
+
+    def test_dedupe_key(self):
+        first = enqueue('test_flaky', dedupe_key='report:1')
+        self.assertEqual(enqueue('test_flaky', dedupe_key='report:1').id, first.id)
+
+        claim_jobs('w')
+        self.assertNotEqual(enqueue('test_flaky', dedupe_key='report:1').id, first.id)
+
+    def test_retry_then_succeed(self):
+        queued = enqueue('test_flaky', {'fail_times': 2, 'token': 'retry'})
+        with self.assertLogs('api.jobs', 'ERROR'):
+            self.assertEqual(run_pending(), 3)
+
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Job.DONE, 3))
+
+    def test_fail_after_max_attempts(self):
+        queued = enqueue('test_flaky', {'fail_times': 5, 'token': 'fail'})
+        with self.assertLogs('api.jobs', 'ERROR'):
+            run_pending()
+
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Job.FAILED, 3))
+        self.assertIn('RuntimeError: flaky', queued.last_error)
+
+    @override_settings(JOBS_ENABLED=False)
+    def test_runs_inline_without_worker(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertIsNone(enqueue('test_flaky', {'token': 'inline'}))
+            self.assertEqual(_flaky_calls, [])  # not before the transaction commits
+        self.assertEqual(_flaky_calls, ['inline'])
+
+        with self.assertLogs('api.jobs', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            enqueue('test_flaky', {'fail_times': 1, 'token': 'inline-fail'})
+        self.assertFalse(Job.objects.exists())
+
+    def test_stale_job_requeued(self):
+        queued = enqueue('test_flaky', {'token': 'stale'})
+        claimed, = claim_jobs('dead-worker')
+        Job.objects.filter(id=queued.id).update(locked_at=timezone.now() - timedelta(minutes=5))
+
+        self.assertEqual(requeue_stale_jobs(), 1)
+        self.assertFalse(run_job(claimed))  # the dead worker's lock is gone
+        self.assertEqual(run_pending(), 1)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.DONE)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'index usage is checked with PostgreSQL EXPLAIN')
+class IndexUsageTests(TestCase):
+    """The hot lookups must be answerable from their composite indexes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        teacher = User.objects.create(supabase_user_id='teacher', email='teacher@example.com', first_name='T',
+                                      last_name='T', role=User.TEACHER)
+        cls.class_obj = Class.objects.create(name='Class A', teacher=teacher)
+        cls.student = User.objects.create(supabase_user_id='student', email='student@example.com', first_name='S',
+                                          last_name='S', role=User.STUDENT, enrolled_class=cls.class_obj)
+        cls.category = Category.objects.create(id=1, name='Category 1')
+        cls.question = Question.objects.create(id='Q1', question_text='Question', category=cls.category,
+                                               choices={'a': 'A'}, correct_answer='a')
+        cls.assessment = Assessment.objects.create(class_owner=cls.class_obj, type='exam', is_initial=True)
+        cls.result = AssessmentResult.objects.create(assessment=cls.assessment, user=cls.student)
+        Answer.objects.create(assessment_result=cls.result, question=cls.question, chosen_answer='A')
+        AssessmentProgress.objects.create(assessment=cls.assessment, user=cls.student)
+
+    def assertUsesIndex(self, queryset, *index_names):
+        # The test tables are tiny, so take sequential scans off the table to see which index the planner picks
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        self.assertTrue(any(name in plan for name in index_names), plan)
+
+    def test_result_by_assessment_and_user(self):
+        self.assertUsesIndex(AssessmentResult.objects.filter(assessment=self.assessment, user=self.student),
+                             'unique_assessment_result_per_user')
+
+    def test_result_history(self):
+        self.assertUsesIndex(AssessmentResult.objects.filter(user=self.student).order_by('-submitted_at', '-id'),
+                             'result_history_idx')
+
+    def test_progress_by_user_and_assessment(self):
+        self.assertUsesIndex(AssessmentProgress.objects.filter(user=self.student, assessment=self.assessment),
+                             'unique_assessment_progress_per_user')
+
+    def test_answers_by_result_and_question(self):
+        self.assertUsesIndex(Answer.objects.filter(assessment_result=self.result, question=self.question),
+                             'answer_result_question_idx')
+
+    def test_questions_by_category_and_difficulty(self):
+        self.assertUsesIndex(Question.objects.filter(category=self.category, difficulty__gte=-1, difficulty__lte=1),
+                             'question_category_diff_idx')
+
+    def test_initial_exam_by_class(self):
+        self.assertUsesIndex(Assessment.objects.filter(class_owner=self.class_obj, is_initial=True),
+                             'assessment_class_initial_idx', 'unique_initial_exam_per_class')
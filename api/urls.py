@@ -47,6 +47,12 @@ urlpatterns = [
 
     path('student/quiz/take-lesson-quiz', student_views.take_lesson_quiz, name='take_lesson_quiz'),
 
+    path('student/adaptive/start', student_views.start_adaptive_test, name='start_adaptive_test'),
+
+    path('student/adaptive/<int:assessment_id>', student_views.get_adaptive_item, name='get_adaptive_item'),
+
+    path('student/adaptive/<int:assessment_id>/answer', student_views.answer_adaptive_item, name='answer_adaptive_item'),
+
     path('student/class/assessments', student_views.get_class_assessments, name='get_class_quizzes'),
 
     path('student/quiz/<quiz_id>', student_views.get_exam_results, name='get_quiz_results'),
@@ -83,6 +89,13 @@ urlpatterns = [
 
     path('teacher/class/<class_id>/assessment/<assessment_id>', teacher_views.get_assessment, name='get_class_assessment'),
 
+    path('teacher/class/<int:class_id>/gradebook', teacher_views.get_gradebook, name='get_class_gradebook'),
+
+    path('teacher/class/<int:class_id>/export', teacher_views.export_class_results, name='export_class_results'),
+
+    path('teacher/class/<int:class_id>/assessment/<int:assessment_id>/export', teacher_views.export_assessment_results,
+         name='export_assessment_results'),
+
     path('teacher/class/<int:class_id>', teacher_views.get_class, name='get_teacher_class'),
 
 ]
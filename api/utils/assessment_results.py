@@ -0,0 +1,153 @@
+from collections import defaultdict
+
+from django.db.models import Count
+
+from api.ai.item_bank import get_item_bank
+from api.models import Answer, Assessment, AssessmentResult, Question
+
+
+def build_result_document(assessment_result, total_questions=None):
+    """
+    Build the full results payload for an ``AssessmentResult`` from one joined query over its answers.
+
+    ``total_questions`` may be passed when the caller already knows it (e.g. from the answer key).
+    """
+    rows = Answer.objects.filter(assessment_result=assessment_result).order_by('id').values_list(
+        'question_id', 'question__question_text', 'question__choices', 'question__correct_answer',
+        'question__category__name', 'chosen_answer', 'is_correct', 'time_spent',
+    )
+
+    overall_correct_answers = 0
+    overall_wrong_answers = 0
+    category_stats = defaultdict(lambda: {'total_questions': 0, 'correct_answers': 0, 'wrong_answers': 0})
+
+    serialized_answers = []
+    for question_id, question_text, choices, correct_answer, category_name, chosen_answer, is_correct, time_spent \
+            in rows:
+        category_stats[category_name]['total_questions'] += 1
+
+        if is_correct:
+            category_stats[category_name]['correct_answers'] += 1
+            overall_correct_answers += 1
+        else:
+            category_stats[category_name]['wrong_answers'] += 1
+            overall_wrong_answers += 1
+
+        serialized_answers.append({
+            'question_id': question_id,
+            'question_text': question_text,
+            'choices': list(choices.values()),
+            'correct_answer': choices.get(correct_answer),
+            'chosen_answer': chosen_answer,
+            'is_correct': is_correct,
+            'time_spent': time_spent,
+        })
+
+    if total_questions is None:
+        total_questions = Question.objects.filter(assessments=assessment_result.assessment_id).count()
+
+    return {
+        'exam_id': assessment_result.assessment_id,
+        'student_id': assessment_result.user_id,
+        'total_time_taken_seconds': assessment_result.time_taken,
+        'score': assessment_result.score,
+        'categories': [
+            {
+                'category_name': category_name,
+                'total_questions': stats['total_questions'],
+                'correct_answers': stats['correct_answers'],
+                'wrong_answers': stats['wrong_answers'],
+            }
+            for category_name, stats in category_stats.items()
+        ],
+        'overall_correct_answers': overall_correct_answers,
+        'overall_wrong_answers': overall_wrong_answers,
+        'total_questions': total_questions,
+        'answers': serialized_answers,
+    }
+
+
+def store_result_document(assessment_result, total_questions=None):
+    """Build and persist the results payload, stamped with the item bank version it was built from."""
+    assessment_result.result_document = build_result_document(assessment_result, total_questions)
+    assessment_result.result_document_version = get_item_bank().version
+    AssessmentResult.objects.filter(pk=assessment_result.pk).update(
+        result_document=assessment_result.result_document,
+        result_document_version=assessment_result.result_document_version,
+    )
+    return assessment_result.result_document
+
+
+def get_result_document(assessment_result):
+    """Return the stored payload, rebuilding it first if questions were edited since it was built."""
+    if (assessment_result.result_document is None
+            or assessment_result.result_document_version != get_item_bank().version):
+        return store_result_document(assessment_result)
+    return assessment_result.result_document
+
+
+def tally_categories(selected_categories, graded):
+    """
+    Per-category correct/wrong counts in the shape served by the history endpoints.
+
+    ``selected_categories`` are ``(category_id, category_name)`` pairs and ``graded`` yields
+    ``(category_id, is_correct)`` per answer. Selected categories without answers are kept with zero counts.
+    """
+    counts = {category_id: [0, 0] for category_id, _ in selected_categories}
+    for category_id, is_correct in graded:
+        if category_id in counts:
+            counts[category_id][0 if is_correct else 1] += 1
+
+    return [
+        {
+            'category_name': category_name,
+            'correct_answer': counts[category_id][0],
+            'wrong_answer': counts[category_id][1],
+        }
+        for category_id, category_name in selected_categories
+    ]
+
+
+def fill_result_tallies(assessment_results, save=True):
+    """
+    Compute ``category_tallies`` and ``total_items`` for results graded before they were denormalized.
+
+    Works on a batch with three aggregate queries regardless of its size. Rows that already carry
+    tallies are left alone. Their real submission time was never recorded, so ``submitted_at`` (which only
+    orders history; ``date_taken`` is still ``assessment.created_at``) is set to ``assessment.created_at``.
+    """
+    missing = [result for result in assessment_results if result.category_tallies is None]
+    if not missing:
+        return assessment_results
+
+    assessment_ids = {result.assessment_id for result in missing}
+    result_ids = [result.id for result in missing]
+
+    selected = defaultdict(list)
+    for assessment_id, category_id, category_name in Assessment.selected_categories.through.objects.filter(
+            assessment_id__in=assessment_ids).order_by('category_id').values_list(
+            'assessment_id', 'category_id', 'category__name'):
+        selected[assessment_id].append((category_id, category_name))
+
+    total_items = dict(
+        Assessment.questions.through.objects.filter(assessment_id__in=assessment_ids)
+        .values_list('assessment_id').annotate(total=Count('id')).values_list('assessment_id', 'total')
+    )
+
+    graded = defaultdict(list)
+    for result_id, category_id, is_correct, total in Answer.objects.filter(
+            assessment_result_id__in=result_ids).values_list(
+            'assessment_result_id', 'question__category_id', 'is_correct').annotate(total=Count('id')):
+        graded[result_id].extend([(category_id, is_correct)] * total)
+
+    created_at = dict(Assessment.objects.filter(id__in=assessment_ids).values_list('id', 'created_at'))
+
+    for result in missing:
+        result.category_tallies = tally_categories(selected[result.assessment_id], graded[result.id])
+        result.total_items = total_items.get(result.assessment_id, 0)
+        result.submitted_at = created_at[result.assessment_id]
+
+    if save:
+        AssessmentResult.objects.bulk_update(missing, ['category_tallies', 'total_items', 'submitted_at'])
+
+    return assessment_results
@@ -0,0 +1,29 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from api.models import ContentVersion
+
+ITEM_BANK = 'item_bank'
+LESSONS = 'lessons'
+
+
+def get_version(key):
+    """Current version stamp for ``key`` (0 when it was never bumped)."""
+    return ContentVersion.objects.filter(key=key).values_list('version', flat=True).first() or 0
+
+
+def get_version_info(key):
+    """``(version, updated_at)`` for ``key``; ``(0, None)`` when it was never bumped."""
+    return ContentVersion.objects.filter(key=key).values_list('version', 'updated_at').first() or (0, None)
+
+
+def bump_version(key):
+    """Increment the version stamp for ``key`` so every process drops caches derived from it."""
+    updated = ContentVersion.objects.filter(key=key).update(version=F('version') + 1, updated_at=timezone.now())
+    if not updated:
+        try:
+            with transaction.atomic():
+                ContentVersion.objects.create(key=key, version=1)
+        except IntegrityError:
+            ContentVersion.objects.filter(key=key).update(version=F('version') + 1, updated_at=timezone.now())
@@ -0,0 +1,134 @@
+import csv
+import zlib
+from datetime import datetime, time, timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from api.models import Answer
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# (column name, Answer lookup) for every exported row; one row per answer
+EXPORT_COLUMNS = [
+    ('result_id', 'assessment_result_id'),
+    ('assessment_id', 'assessment_result__assessment_id'),
+    ('assessment_name', 'assessment_result__assessment__name'),
+    ('assessment_type', 'assessment_result__assessment__type'),
+    ('student_id', 'assessment_result__user_id'),
+    ('student_first_name', 'assessment_result__user__first_name'),
+    ('student_last_name', 'assessment_result__user__last_name'),
+    ('submitted_at', 'assessment_result__submitted_at'),
+    ('score', 'assessment_result__score'),
+    ('time_taken', 'assessment_result__time_taken'),
+    ('question_id', 'question_id'),
+    ('category', 'question__category__name'),
+    ('chosen_answer', 'chosen_answer'),
+    ('is_correct', 'is_correct'),
+    ('time_spent', 'time_spent'),
+]
+
+# Rows rendered per yielded chunk; keeps the number of tiny writes to the socket down
+ROWS_PER_CHUNK = 500
+
+
+def parse_date_bound(value, end=False):
+    """
+    Parse an ISO date or datetime used as an export bound; raises ``ValueError`` when malformed.
+
+    A bare date covers the whole day, so as an ``end`` bound it means the start of the next day.
+    """
+    # Dates first: parse_datetime also accepts a bare date, as midnight
+    day = parse_date(value)
+    if day is not None:
+        parsed = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    else:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValueError(f'Invalid date: {value}')
+
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def export_rows(class_id=None, assessment_id=None, since=None, until=None, chunk_size=2000):
+    """
+    Stream answer rows (as tuples ordered like :data:`EXPORT_COLUMNS`) for a class or an assessment.
+
+    ``since`` is inclusive and ``until`` exclusive, both compared with the result's submit time.
+    Rows come from a server-side cursor, so memory use does not grow with the export size.
+    """
+    answers = Answer.objects.all()
+    if class_id is not None:
+        answers = answers.filter(assessment_result__assessment__class_owner_id=class_id)
+    if assessment_id is not None:
+        answers = answers.filter(assessment_result__assessment_id=assessment_id)
+    if since is not None:
+        answers = answers.filter(assessment_result__submitted_at__gte=since)
+    if until is not None:
+        answers = answers.filter(assessment_result__submitted_at__lt=until)
+
+    return answers.order_by('assessment_result_id', 'id').values_list(
+        *(lookup for _, lookup in EXPORT_COLUMNS)
+    ).iterator(chunk_size=chunk_size)
+
+
+class _Echo:
+    """File-like object whose ``write`` returns the value, so ``csv.writer`` can feed a generator."""
+
+    def write(self, value):
+        return value
+
+
+def _chunked(lines):
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= ROWS_PER_CHUNK:
+            yield ''.join(buffer).encode()
+            buffer = []
+    if buffer:
+        yield ''.join(buffer).encode()
+
+
+def render_csv(rows):
+    writer = csv.writer(_Echo())
+
+    def lines():
+        yield writer.writerow([name for name, _ in EXPORT_COLUMNS])
+        for row in rows:
+            yield writer.writerow(row)
+
+    return _chunked(lines())
+
+
+def render_ndjson(rows):
+    names = [name for name, _ in EXPORT_COLUMNS]
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    return _chunked(encoder.encode(dict(zip(names, row))) + '\n' for row in rows)
+
+
+def gzip_stream(chunks):
+    """Gzip a stream of byte chunks incrementally."""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def render_export(rows, export_format, compress=False):
+    """Encode ``rows`` as byte chunks in ``export_format`` (a key of :data:`EXPORT_FORMATS`)."""
+    chunks = render_csv(rows) if export_format == 'csv' else render_ndjson(rows)
+    return gzip_stream(chunks) if compress else chunks
+
+
+def export_filename(name, export_format, compress=False):
+    return f'{name}.{export_format}' + ('.gz' if compress else '')
+
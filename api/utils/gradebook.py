@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from api.models import Assessment, AssessmentResult, User
+
+
+def _cache_key(class_id):
+    return f'gradebook:{class_id}'
+
+
+def build_gradebook(class_obj):
+    """
+    Students x assessments score matrix for a class.
+
+    Every cell comes from one query over the class's results; the student and assessment axes are one
+    query each. ``scores`` rows are aligned with ``assessments`` and hold ``None`` where the student has
+    not taken that assessment.
+    """
+    assessments = list(
+        Assessment.objects.filter(class_owner=class_obj).annotate(no_of_items=Count('questions'))
+        .order_by('created_at', 'id').values('id', 'name', 'type', 'is_initial', 'deadline', 'no_of_items')
+    )
+    students = list(
+        User.objects.filter(enrolled_class=class_obj, role=User.STUDENT).order_by('last_name', 'first_name', 'id')
+        .values_list('id', 'first_name', 'last_name')
+    )
+
+    columns = {assessment['id']: index for index, assessment in enumerate(assessments)}
+    rows = {student_id: index for index, (student_id, _, _) in enumerate(students)}
+    matrix = [[None] * len(assessments) for _ in students]
+
+    for user_id, assessment_id, score in AssessmentResult.objects.filter(
+            assessment__class_owner=class_obj, user__enrolled_class=class_obj).values_list(
+            'user_id', 'assessment_id', 'score'):
+        if user_id in rows and assessment_id in columns:
+            matrix[rows[user_id]][columns[assessment_id]] = score
+
+    for column, assessment in enumerate(assessments):
+        scores = [row[column] for row in matrix if row[column] is not None]
+        assessment['taken_count'] = len(scores)
+        assessment['average_score'] = sum(scores) / len(scores) if scores else None
+        assessment['completion_rate'] = len(scores) / len(students) if students else 0.0
+
+    return {
+        'class_id': class_obj.id,
+        'class_name': class_obj.name,
+        'assessments': assessments,
+        'students': [
+            {
+                'student_id': student_id,
+                'student_name': f'{first_name} {last_name}',
+                'scores': matrix[index],
+            }
+            for index, (student_id, first_name, last_name) in enumerate(students)
+        ],
+    }
+
+
+def get_gradebook(class_obj):
+    """Return the cached gradebook for a class, building it on a miss."""
+    gradebook = cache.get(_cache_key(class_obj.id))
+    if gradebook is None:
+        gradebook = build_gradebook(class_obj)
+        cache.set(_cache_key(class_obj.id), gradebook, settings.GRADEBOOK_CACHE_TTL)
+    return gradebook
+
+
+def invalidate_gradebook(class_id):
+    if class_id is not None:
+        cache.delete(_cache_key(class_id))
@@ -0,0 +1,38 @@
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from api.ai.item_bank import get_item_bank
+from api.models import Question
+
+AnswerKeyItem = namedtuple('AnswerKeyItem', [
+    'correct_choice', 'category_id', 'category_name', 'discrimination', 'difficulty', 'guessing',
+])
+
+
+def get_answer_key(assessment):
+    """
+    Return ``{question_id: AnswerKeyItem}`` for an assessment, built with one query and cached.
+
+    The cache key includes the item bank version and the assessment's ``questions_version``, so neither
+    re-imported questions nor a changed question set grade against a stale key.
+    """
+    cache_key = f'answer-key:{assessment.id}:{assessment.questions_version}:{get_item_bank().version}'
+    answer_key = cache.get(cache_key)
+
+    if answer_key is None:
+        rows = Question.objects.filter(assessments=assessment).values_list(
+            'id', 'choices', 'correct_answer', 'category_id', 'category__name',
+            'discrimination', 'difficulty', 'guessing',
+        )
+        answer_key = {
+            question_id: AnswerKeyItem(
+                choices.get(correct_answer), category_id, category_name, discrimination, difficulty, guessing,
+            )
+            for question_id, choices, correct_answer, category_id, category_name, discrimination, difficulty, guessing
+            in rows
+        }
+        cache.set(cache_key, answer_key, settings.ANSWER_KEY_CACHE_TTL)
+
+    return answer_key
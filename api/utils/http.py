@@ -0,0 +1,70 @@
+import hashlib
+
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def make_etag(*parts):
+    """Quoted ETag derived from the given parts (version stamps, normalized query parameters, ...)."""
+    digest = hashlib.sha1('\x1f'.join(str(part) for part in parts).encode()).hexdigest()
+    return quote_etag(digest)
+
+
+def query_fingerprint(request, exclude=()):
+    """Order-independent representation of the query string, for use as an ETag part."""
+    params = request.query_params
+    return '&'.join(
+        f'{key}={value}'
+        for key in sorted(params)
+        if key not in exclude
+        for value in sorted(params.getlist(key))
+    )
+
+
+def _strip_weak(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def etag_matches(request, etag):
+    """Whether the request's ``If-None-Match`` already names ``etag`` (weak comparison, as for GET)."""
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+
+    candidates = parse_etags(header)
+    if '*' in candidates:
+        return True
+    return _strip_weak(etag) in {_strip_weak(candidate) for candidate in candidates}
+
+
+def is_not_modified(request, etag, last_modified=None):
+    """
+    Evaluate the request's validators against the current representation.
+
+    ``If-None-Match`` takes precedence; ``If-Modified-Since`` is only consulted without it.
+    """
+    if request.headers.get('If-None-Match'):
+        return etag_matches(request, etag)
+
+    since = parse_http_date_safe(request.headers.get('If-Modified-Since') or '')
+    return since is not None and last_modified is not None and int(last_modified.timestamp()) <= since
+
+
+def set_validators(response, etag, last_modified=None):
+    """
+    Attach ``ETag`` (and ``Last-Modified`` when given) to a response.
+
+    Responses are per user, so shared caches must not store them and clients revalidate every time.
+    """
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def not_modified(etag, last_modified=None):
+    """Empty ``304 Not Modified`` response carrying the validators."""
+    return set_validators(Response(status=status.HTTP_304_NOT_MODIFIED), etag, last_modified)
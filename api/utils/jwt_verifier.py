@@ -0,0 +1,228 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+
+import requests
+import rsa
+from cachetools import TTLCache
+from django.conf import settings
+
+from .metrics import AUTH, timed_function
+from .supabase_client import get_supabase_client
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidToken(Exception):
+    """The token was checked locally and is not acceptable (bad signature, expired, wrong audience)."""
+
+
+class UnverifiableToken(Exception):
+    """The token cannot be checked locally (no key configured, unsupported algorithm, unknown key id)."""
+
+
+_claims_cache = None
+_claims_cache_lock = threading.Lock()
+
+_jwks_keys = {}
+_jwks_fetched_at = None
+_jwks_lock = threading.Lock()
+
+
+def _get_claims_cache():
+    global _claims_cache
+    if _claims_cache is None:
+        with _claims_cache_lock:
+            if _claims_cache is None:
+                _claims_cache = TTLCache(
+                    maxsize=settings.SUPABASE_AUTH_CACHE_SIZE,
+                    ttl=settings.SUPABASE_AUTH_CACHE_TTL,
+                )
+    return _claims_cache
+
+
+def clear_claims_cache():
+    """Drop every cached token -> subject entry (used by tests and benchmarks)."""
+    global _claims_cache
+    with _claims_cache_lock:
+        _claims_cache = None
+
+
+def _b64decode(segment):
+    padding = '=' * (-len(segment) % 4)
+    return base64.urlsafe_b64decode(segment + padding)
+
+
+def _split_token(token):
+    try:
+        header_segment, payload_segment, signature_segment = token.split('.')
+        header = json.loads(_b64decode(header_segment))
+        payload = json.loads(_b64decode(payload_segment))
+        signature = _b64decode(signature_segment)
+    except (ValueError, TypeError) as e:
+        raise InvalidToken(f'Malformed token: {e}')
+
+    if not isinstance(header, dict) or not isinstance(payload, dict):
+        raise InvalidToken('Malformed token: header and payload must be JSON objects')
+
+    signing_input = f'{header_segment}.{payload_segment}'.encode('ascii')
+    return header, payload, signing_input, signature
+
+
+def _fetch_jwks(url):
+    response = requests.get(url, timeout=5)
+    response.raise_for_status()
+    keys = {}
+    for jwk in response.json().get('keys', []):
+        if jwk.get('kty') != 'RSA':
+            continue
+        keys[jwk.get('kid')] = rsa.PublicKey(
+            int.from_bytes(_b64decode(jwk['n']), 'big'),
+            int.from_bytes(_b64decode(jwk['e']), 'big'),
+        )
+    return keys
+
+
+def _get_jwks_key(kid):
+    """Return the RSA public key for ``kid`` from the cached JWKS, refreshing it when stale or missing."""
+    global _jwks_keys, _jwks_fetched_at
+
+    url = settings.SUPABASE_JWKS_URL
+    if not url:
+        raise UnverifiableToken('No JWKS URL configured')
+
+    with _jwks_lock:
+        now = time.monotonic()
+        key = _jwks_keys.get(kid)
+        is_stale = _jwks_fetched_at is None or now - _jwks_fetched_at > settings.SUPABASE_JWKS_TTL
+        # Unknown key ids only trigger a refetch once per minute so forged kids cannot hammer the endpoint
+        retry_unknown = key is None and (_jwks_fetched_at is None or now - _jwks_fetched_at > 60)
+
+        if is_stale or retry_unknown:
+            try:
+                _jwks_keys = _fetch_jwks(url)
+                _jwks_fetched_at = now
+            except (requests.RequestException, ValueError, KeyError) as e:
+                raise UnverifiableToken(f'Unable to fetch JWKS: {e}')
+            key = _jwks_keys.get(kid)
+
+    if key is None:
+        raise UnverifiableToken(f'Unknown key id {kid!r}')
+    return key
+
+
+def _verify_signature(header, signing_input, signature):
+    algorithm = header.get('alg')
+
+    if algorithm == 'HS256':
+        secret = settings.SUPABASE_JWT_SECRET
+        if not secret:
+            raise UnverifiableToken('No JWT secret configured')
+        expected = hmac.new(secret.encode(), signing_input, hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, signature):
+            raise InvalidToken('Signature verification failed')
+
+    elif algorithm == 'RS256':
+        key = _get_jwks_key(header.get('kid'))
+        try:
+            if rsa.verify(signing_input, signature, key) != 'SHA-256':
+                raise InvalidToken('Unexpected signature hash')
+        except rsa.VerificationError:
+            raise InvalidToken('Signature verification failed')
+
+    else:
+        raise UnverifiableToken(f'Unsupported algorithm {algorithm!r}')
+
+
+def _check_claims(payload, now):
+    leeway = settings.SUPABASE_JWT_LEEWAY
+
+    exp = payload.get('exp')
+    if not isinstance(exp, (int, float)):
+        raise InvalidToken('Token has no expiry')
+    if exp + leeway < now:
+        raise InvalidToken('Token has expired')
+
+    nbf = payload.get('nbf')
+    if isinstance(nbf, (int, float)) and nbf - leeway > now:
+        raise InvalidToken('Token is not valid yet')
+
+    audience = settings.SUPABASE_JWT_AUDIENCE
+    if audience:
+        token_audience = payload.get('aud')
+        audiences = token_audience if isinstance(token_audience, list) else [token_audience]
+        if audience not in audiences:
+            raise InvalidToken('Token audience mismatch')
+
+    if not payload.get('sub'):
+        raise InvalidToken('Token has no subject')
+
+
+def decode_token(token):
+    """Verify the token signature and standard claims in-process and return its payload."""
+    header, payload, signing_input, signature = _split_token(token)
+    _verify_signature(header, signing_input, signature)
+    _check_claims(payload, time.time())
+    return payload
+
+
+def _verify_remotely(token):
+    response = get_supabase_client().auth.get_user(jwt=token)
+    return response.user.id
+
+
+@timed_function(AUTH)
+def verify_token(token):
+    """
+    Resolve a Supabase access token to the user id (``sub`` claim).
+
+    Tokens are checked locally against ``SUPABASE_JWT_SECRET`` (HS256) or the cached JWKS (RS256) and the
+    result is kept in a bounded TTL cache. Tokens that cannot be checked locally fall back to Supabase's
+    ``auth.get_user`` when ``SUPABASE_AUTH_REMOTE_FALLBACK`` is enabled. Returns ``None`` for rejected tokens.
+    """
+    cache = _get_claims_cache()
+    now = time.time()
+
+    with _claims_cache_lock:
+        cached = cache.get(token)
+    if cached is not None:
+        sub, exp = cached
+        if exp is None or exp + settings.SUPABASE_JWT_LEEWAY >= now:
+            return sub
+
+    sub = None
+    exp = None
+
+    if settings.SUPABASE_AUTH_VERIFY_LOCALLY:
+        try:
+            payload = decode_token(token)
+            sub, exp = payload['sub'], payload['exp']
+        except InvalidToken as e:
+            logger.info('Rejected access token: %s', e)
+            return None
+        except UnverifiableToken as e:
+            if not settings.SUPABASE_AUTH_REMOTE_FALLBACK:
+                logger.info('Rejected access token: %s', e)
+                return None
+
+    if sub is None:
+        try:
+            sub = _verify_remotely(token)
+        except Exception as e:
+            logger.info('Supabase rejected access token: %s', e)
+            return None
+
+        # Bound the cache entry by the token's own expiry even though Supabase did the checking
+        try:
+            exp = _split_token(token)[1].get('exp')
+        except InvalidToken:
+            exp = None
+
+    with _claims_cache_lock:
+        cache[token] = (sub, exp)
+
+    return sub
@@ -0,0 +1,203 @@
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from api.models import Chapter, Lesson, LessonProgress
+from api.utils.content_version import LESSONS, bump_version
+
+
+@dataclass(frozen=True)
+class ChapterRecord:
+    """A validated chapter row; chapters are identified by ``(lesson_name, chapter_number)``."""
+    lesson_name: str
+    chapter_number: int
+    chapter_name: str
+    content: str
+
+    def to_chapter(self, lesson_id):
+        chapter = Chapter(
+            lesson_id=lesson_id,
+            chapter_number=self.chapter_number,
+            chapter_name=self.chapter_name,
+            content=self.content,
+        )
+        chapter.content_hash = chapter.compute_content_hash()
+        return chapter
+
+
+@dataclass
+class LessonImportReport:
+    lessons_created: int = 0
+    lessons_changed: int = 0
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+    rejected: list = field(default_factory=list)  # (row number, reason)
+
+    def __str__(self):
+        return (f'{self.lessons_created} lessons created, {self.lessons_changed} lessons changed; chapters: '
+                f'{self.created} created, {self.updated} updated, {self.unchanged} unchanged, '
+                f'{self.deleted} deleted, {len(self.rejected)} rejected')
+
+
+def parse_lesson_rows(rows, report):
+    """
+    Validate data rows (header excluded) into records keyed by ``(lesson_name, chapter_number)``.
+
+    Columns: lesson name, chapter number, chapter name, content. Later rows win; invalid rows are
+    added to ``report``.
+    """
+    records = {}
+    for row_number, row in enumerate(rows, start=2):
+        cells = [cell.strip() if isinstance(cell, str) else cell for cell in row] + [''] * (4 - len(row))
+        lesson_name, chapter_number, chapter_name, content = cells[:4]
+
+        if not lesson_name:
+            report.rejected.append((row_number, 'Missing lesson name.'))
+            continue
+        try:
+            chapter_number = int(chapter_number)
+        except (TypeError, ValueError):
+            report.rejected.append((row_number, f"Chapter number '{chapter_number}' is not an integer."))
+            continue
+        if chapter_number < 1:
+            report.rejected.append((row_number, 'Chapter numbers start at 1.'))
+            continue
+
+        record = ChapterRecord(lesson_name, chapter_number, chapter_name, content)
+        records[(lesson_name, chapter_number)] = record
+    return records
+
+
+def _resolve_lessons(lesson_names, report):
+    """``{lesson_name: lesson_id}``, creating the lessons that do not exist yet."""
+    lesson_ids = {}
+    for lesson_id, lesson_name in Lesson.objects.filter(lesson_name__in=lesson_names).order_by('-id').values_list(
+            'id', 'lesson_name'):
+        # Lesson names are not unique in the schema; the oldest lesson with a name owns the sheet rows
+        lesson_ids[lesson_name] = lesson_id
+
+    missing = [Lesson(lesson_name=lesson_name) for lesson_name in lesson_names if lesson_name not in lesson_ids]
+    if missing:
+        Lesson.objects.bulk_create(missing)
+        lesson_ids.update({lesson.lesson_name: lesson.id for lesson in missing})
+        report.lessons_created = len(missing)
+
+    return lesson_ids
+
+
+def _existing_chapters(chapters):
+    """
+    ``{(lesson_id, chapter_number): (chapter_id, content_hash)}`` for a chapter queryset.
+
+    Earlier imports could store several chapters under one number; the newest one is kept, student
+    progress pointing at the others is moved to it, and the others are returned for deletion.
+    """
+    existing = {}
+    duplicates = defaultdict(list)
+    for chapter_id, lesson_id, chapter_number, content_hash in chapters.order_by('-id').values_list(
+            'id', 'lesson_id', 'chapter_number', 'content_hash'):
+        key = (lesson_id, chapter_number)
+        if key in existing:
+            duplicates[existing[key][0]].append(chapter_id)
+        else:
+            existing[key] = (chapter_id, content_hash)
+
+    for kept_id, duplicate_ids in duplicates.items():
+        LessonProgress.objects.filter(current_chapter_id__in=duplicate_ids).update(current_chapter_id=kept_id)
+
+    return existing, [chapter_id for duplicate_ids in duplicates.values() for chapter_id in duplicate_ids]
+
+
+def _delete_chapters(chapter_ids):
+    """
+    Delete chapters and return ``(deleted count, ids of the lessons they belonged to)``.
+
+    The ``post_delete`` signal bumps the version of those lessons.
+    """
+    lesson_ids = set(Chapter.objects.filter(id__in=chapter_ids).values_list('lesson_id', flat=True).distinct())
+    deleted = Chapter.objects.filter(id__in=chapter_ids).delete()[1].get(Chapter._meta.label, 0)
+    return deleted, lesson_ids
+
+
+def _bump_lesson_versions(lesson_ids):
+    # Bulk writes skip the per-chapter signals, so versions are bumped here once per lesson
+    Lesson.objects.filter(id__in=lesson_ids).update(version=F('version') + 1, updated_at=timezone.now())
+
+
+def merge_duplicate_chapters():
+    """
+    Collapse chapters that the old importer stored more than once under one ``(lesson, chapter_number)``.
+
+    The newest chapter is kept and student progress is moved to it. :func:`import_lessons` upserts on
+    the unique ``(lesson, chapter_number)`` constraint, so an existing database must run this
+    (``upload_lessons --merge-duplicates``) before that constraint is added. Returns the number of
+    chapters deleted.
+    """
+    with transaction.atomic():
+        _, duplicate_ids = _existing_chapters(Chapter.objects.all())
+        if not duplicate_ids:
+            return 0
+        deleted, _ = _delete_chapters(duplicate_ids)
+    return deleted
+
+
+def import_lessons(records, report=None, batch_size=500):
+    """
+    Incrementally sync lessons and chapters with the source records in one transaction.
+
+    Only chapters that are new or whose content hash changed are written (one bulk upsert on
+    ``(lesson, chapter_number)``); chapters of the imported lessons that are no longer in the source
+    are deleted. Lessons absent from the source are left alone. Every lesson that changed gets its
+    version bumped, so ETags and cached lesson bodies move with it.
+    """
+    report = report or LessonImportReport()
+    records = list(records.values()) if isinstance(records, dict) else list(records)
+    if not records:
+        return report
+
+    with transaction.atomic():
+        lesson_ids = _resolve_lessons(sorted({record.lesson_name for record in records}), report)
+        existing, stale_ids = _existing_chapters(Chapter.objects.filter(lesson_id__in=lesson_ids.values()))
+
+        changed = []
+        changed_lessons = set()
+        seen = set()
+        for record in records:
+            lesson_id = lesson_ids[record.lesson_name]
+            key = (lesson_id, record.chapter_number)
+            seen.add(key)
+
+            chapter = record.to_chapter(lesson_id)
+            if key not in existing:
+                report.created += 1
+            elif existing[key][1] != chapter.content_hash:
+                report.updated += 1
+            else:
+                report.unchanged += 1
+                continue
+            changed.append(chapter)
+            changed_lessons.add(lesson_id)
+
+        stale_ids += [chapter_id for key, (chapter_id, _) in existing.items() if key not in seen]
+        deleted_from = set()
+        if stale_ids:
+            report.deleted, deleted_from = _delete_chapters(stale_ids)
+
+        if changed:
+            Chapter.objects.bulk_create(
+                changed, batch_size=batch_size, update_conflicts=True, unique_fields=['lesson', 'chapter_number'],
+                update_fields=['chapter_name', 'content', 'content_hash', 'updated_at'],
+            )
+
+        if changed_lessons - deleted_from:
+            _bump_lesson_versions(changed_lessons - deleted_from)
+        if report.lessons_created:
+            bump_version(LESSONS)
+        report.lessons_changed = len(changed_lessons | deleted_from)
+
+    return report
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from api.models import Chapter
+
+
+def get_lesson_body(lesson_id, lesson_name, version):
+    """
+    Serialized lesson with its chapters, cached per lesson version.
+
+    A new version gets a new cache key, so edits never serve stale chapters and need no explicit eviction.
+    """
+    cache_key = f'lesson:{lesson_id}:{version}'
+    body = cache.get(cache_key)
+
+    if body is None:
+        body = {
+            "id": lesson_id,
+            "lesson_name": lesson_name,
+            "chapters": [
+                {
+                    "id": chapter_id,
+                    "chapter_name": chapter_name,
+                    "chapter_number": chapter_number,
+                    "content": content,
+                }
+                for chapter_id, chapter_name, chapter_number, content in Chapter.objects.filter(
+                    lesson_id=lesson_id).order_by('chapter_number').values_list(
+                    'id', 'chapter_name', 'chapter_number', 'content')
+            ],
+        }
+        cache.set(cache_key, body, settings.LESSON_CACHE_TTL)
+
+    return body
@@ -0,0 +1,213 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Upper bounds (seconds) of the latency histogram buckets
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Phases timed inside a request; they can overlap (e.g. a query issued while authenticating counts as db too)
+AUTH = 'auth'
+DB = 'db'
+AI = 'ai'
+RENDER = 'render'
+
+_current_timings = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Seconds spent per phase and the number of queries of the request being served."""
+    __slots__ = ('phases', 'queries', '_active')
+
+    def __init__(self):
+        self.phases = {}
+        self.queries = 0
+        self._active = set()
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+
+def start_request():
+    """Start collecting timings for the current request (or task); returns the collector and a reset token."""
+    timings = RequestTimings()
+    return timings, _current_timings.set(timings)
+
+
+def finish_request(token):
+    _current_timings.reset(token)
+
+
+def current_timings():
+    """The collector of the request being served, or ``None``."""
+    return _current_timings.get()
+
+
+@contextmanager
+def timed(phase):
+    """Add the time spent in the block to ``phase`` of the current request; a no-op outside requests."""
+    timings = _current_timings.get()
+    # Re-entering a phase (e.g. one api.ai function calling another) must not count the time twice
+    if timings is None or phase in timings._active:
+        yield
+        return
+
+    timings._active.add(phase)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(phase, time.perf_counter() - start)
+        timings._active.discard(phase)
+
+
+def timed_function(phase):
+    """Decorator form of :func:`timed`."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with timed(phase):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def query_timer(execute, sql, params, many, context):
+    """
+    A ``connection.execute_wrapper`` adding every query's time and count to the current request.
+
+    It is installed on every database connection (see ``api.signals``) rather than per request, because
+    the request's context, unlike a wrapper, follows ORM calls into ``sync_to_async`` threads.
+    """
+    timings = _current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add(DB, time.perf_counter() - start)
+        timings.queries += 1
+
+
+class Histogram:
+    __slots__ = ('bucket_counts', 'sum', 'count')
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(DURATION_BUCKETS) + 1)  # last slot: above the largest bound
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.bucket_counts[bisect_left(DURATION_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+
+class MetricsRegistry:
+    """
+    Per-process request metrics, rendered in the Prometheus text exposition format.
+
+    Each worker process keeps its own registry, so scrape every worker and aggregate with
+    ``sum by (route)``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._requests = defaultdict(int)  # (route, method, status) -> count
+            self._durations = defaultdict(Histogram)  # (route, method) -> histogram
+            self._phases = defaultdict(Histogram)  # (route, phase) -> histogram
+            self._queries = defaultdict(int)  # route -> count
+
+    def record(self, route, method, status, duration, timings):
+        with self._lock:
+            self._requests[(route, method, status)] += 1
+            self._durations[(route, method)].observe(duration)
+            for phase, seconds in timings.phases.items():
+                self._phases[(route, phase)].observe(seconds)
+            self._queries[route] += timings.queries
+
+    def _render_histogram(self, lines, name, histograms, label_names):
+        for key, histogram in sorted(histograms.items()):
+            labels = dict(zip(label_names, key))
+            cumulative = 0
+            for bound, count in zip(DURATION_BUCKETS, histogram.bucket_counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{_labels(**labels, le=bound)}}} {cumulative}')
+            lines.append(f'{name}_bucket{{{_labels(**labels, le="+Inf")}}} {histogram.count}')
+            lines.append(f'{name}_sum{{{_labels(**labels)}}} {histogram.sum}')
+            lines.append(f'{name}_count{{{_labels(**labels)}}} {histogram.count}')
+
+    def render(self):
+        with self._lock:
+            requests = dict(self._requests)
+            durations = {key: self._copy(histogram) for key, histogram in self._durations.items()}
+            phases = {key: self._copy(histogram) for key, histogram in self._phases.items()}
+            queries = dict(self._queries)
+
+        lines = [
+            '# HELP api_requests_total Requests served, by route, method and status code.',
+            '# TYPE api_requests_total counter',
+        ]
+        for (route, method, status), count in sorted(requests.items()):
+            lines.append(f'api_requests_total{{{_labels(route=route, method=method, status=status)}}} {count}')
+
+        lines += [
+            '# HELP api_request_duration_seconds Time from the first middleware to the response, by route.',
+            '# TYPE api_request_duration_seconds histogram',
+        ]
+        self._render_histogram(lines, 'api_request_duration_seconds', durations, ('route', 'method'))
+
+        lines += [
+            '# HELP api_request_phase_seconds Time per request spent in auth, db, ai and render, by route.',
+            '# TYPE api_request_phase_seconds histogram',
+        ]
+        self._render_histogram(lines, 'api_request_phase_seconds', phases, ('route', 'phase'))
+
+        lines += [
+            '# HELP api_db_queries_total SQL queries issued while serving requests, by route.',
+            '# TYPE api_db_queries_total counter',
+        ]
+        for route, count in sorted(queries.items()):
+            lines.append(f'api_db_queries_total{{{_labels(route=route)}}} {count}')
+
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _copy(histogram):
+        copy = Histogram()
+        copy.bucket_counts = list(histogram.bucket_counts)
+        copy.sum = histogram.sum
+        copy.count = histogram.count
+        return copy
+
+
+registry = MetricsRegistry()
+
+
+def server_timing(timings, duration):
+    """``Server-Timing`` header value for a finished request."""
+    entries = []
+    for phase, seconds in timings.phases.items():
+        entry = f'{phase};dur={seconds * 1000:.2f}'
+        if phase == DB:
+            entry += f';desc="{timings.queries} queries"'
+        entries.append(entry)
+    entries.append(f'total;dur={duration * 1000:.2f}')
+    return ', '.join(entries)
@@ -0,0 +1,52 @@
+import base64
+import json
+
+from django.conf import settings
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+def encode_cursor(*values):
+    """Opaque, URL-safe cursor for the sort key of the last row on a page."""
+    payload = json.dumps(values, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of :func:`encode_cursor`; raises ``ValueError`` for anything it did not produce."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (TypeError, ValueError, UnicodeDecodeError) as error:
+        raise ValueError('Invalid cursor.') from error
+
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor.')
+    return values
+
+
+def get_page_size(request):
+    """Page size from ``?limit=``, clamped to ``API_MAX_PAGE_SIZE``; raises ``ValueError`` when malformed."""
+    limit = request.query_params.get('limit')
+    if limit is None:
+        return settings.API_PAGE_SIZE
+
+    limit = int(limit)
+    if limit <= 0:
+        raise ValueError('limit must be a positive integer.')
+    return min(limit, settings.API_MAX_PAGE_SIZE)
+
+
+def paginate(queryset, page_size, cursor_values):
+    """
+    Evaluate one page of an already keyset-filtered queryset.
+
+    Returns ``(rows, next_cursor)``; ``cursor_values`` maps the last row to its sort key, and
+    ``next_cursor`` is ``None`` on the final page.
+    """
+    rows = list(queryset[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+
+    rows = rows[:page_size]
+    return rows, encode_cursor(*cursor_values(rows[-1]))
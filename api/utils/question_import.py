@@ -0,0 +1,182 @@
+from dataclasses import dataclass, field, replace
+
+from django.db import transaction
+
+from api.ai.item_bank import invalidate_item_bank
+from api.models import Category, Question
+
+CHOICE_KEYS = ('a', 'b', 'c', 'd')
+
+# Columns written on conflict; everything the sheet controls plus the hash
+UPDATE_FIELDS = [
+    'question_text', 'image_url', 'category', 'difficulty', 'discrimination', 'guessing',
+    'choices', 'correct_answer', 'content_hash',
+]
+
+
+@dataclass(frozen=True)
+class QuestionRecord:
+    """A validated question row, independent of where it was read from."""
+    id: str
+    question_text: str
+    image_url: str | None
+    category_id: int
+    difficulty: float
+    discrimination: float
+    guessing: float
+    choices: dict
+    correct_answer: str
+
+    def to_question(self):
+        question = Question(
+            id=self.id,
+            question_text=self.question_text,
+            image_url=self.image_url,
+            category_id=self.category_id,
+            difficulty=self.difficulty,
+            discrimination=self.discrimination,
+            guessing=self.guessing,
+            choices=self.choices,
+            correct_answer=self.correct_answer,
+        )
+        question.content_hash = question.compute_content_hash()
+        return question
+
+
+@dataclass
+class ImportReport:
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    rejected: list = field(default_factory=list)  # (row number, reason)
+
+    def __str__(self):
+        return (f'{self.created} created, {self.updated} updated, {self.unchanged} unchanged, '
+                f'{len(self.rejected)} rejected')
+
+
+def _cell(row, index, default=''):
+    return row[index].strip() if len(row) > index and row[index] is not None else default
+
+
+def _float_cell(row, index, default):
+    value = _cell(row, index)
+    return float(value) if value else default
+
+
+def parse_question_row(row, category_mapping):
+    """
+    Validate one sheet row into a :class:`QuestionRecord`; raises ``ValueError`` with the reason.
+
+    Columns: flag, id, text, image url, choices a-d, correct choice, category name, difficulty,
+    discrimination, guessing.
+    """
+    question_id = _cell(row, 1)
+    if not question_id:
+        raise ValueError('Missing question id.')
+    if len(question_id) > Question._meta.get_field('id').max_length:
+        raise ValueError(f"Question id '{question_id}' is too long.")
+
+    category_name = _cell(row, 9)
+    category_id = category_mapping.get(category_name)
+    if category_id is None:
+        raise ValueError(f"Category '{category_name}' not found.")
+
+    correct_answer = _cell(row, 8).lower()
+    if correct_answer not in CHOICE_KEYS:
+        raise ValueError(f"Correct answer '{correct_answer}' is not one of {', '.join(CHOICE_KEYS)}.")
+
+    try:
+        difficulty = _float_cell(row, 10, 0.0)
+        discrimination = _float_cell(row, 11, 1.0)
+        guessing = _float_cell(row, 12, 0.0)
+    except ValueError:
+        raise ValueError('Item parameters must be numbers.')
+
+    if not 0.0 <= guessing < 1.0:
+        raise ValueError('Guessing must be in [0, 1).')
+
+    return QuestionRecord(
+        id=question_id,
+        question_text=_cell(row, 2),
+        image_url=_cell(row, 3) or None,
+        category_id=category_id,
+        difficulty=difficulty,
+        discrimination=discrimination,
+        guessing=guessing,
+        choices={key: _cell(row, 4 + offset) for offset, key in enumerate(CHOICE_KEYS)},
+        correct_answer=correct_answer,
+    )
+
+
+def parse_question_rows(rows, category_mapping, report):
+    """
+    Validate data rows (header excluded) into records keyed by question id; later rows win.
+
+    Rows without a flag in the first column are skipped as before; invalid rows are added to ``report``.
+    """
+    known_categories = set(Category.objects.filter(id__in=set(category_mapping.values())).values_list('id', flat=True))
+    mapping = {name: category_id for name, category_id in category_mapping.items() if category_id in known_categories}
+
+    records = {}
+    for row_number, row in enumerate(rows, start=2):
+        if len(row) < 2 or not row[0]:
+            continue
+        try:
+            record = parse_question_row(row, mapping)
+        except ValueError as error:
+            report.rejected.append((row_number, str(error)))
+            continue
+        records[record.id] = record
+    return records
+
+
+def import_questions(records, report=None, batch_size=1000):
+    """
+    Upsert validated records, writing only rows that are new or whose content hash changed.
+
+    Existing hashes are read in batches, and the changed rows are written with
+    ``bulk_create(update_conflicts=True)`` inside one transaction. Calibrated questions keep their
+    estimated item parameters. The item bank is invalidated once the transaction commits if anything
+    was written.
+    """
+    report = report or ImportReport()
+    records = list(records.values()) if isinstance(records, dict) else list(records)
+
+    existing_hashes = {}
+    calibrated = {}
+    for start in range(0, len(records), batch_size):
+        batch_ids = [record.id for record in records[start:start + batch_size]]
+        for question_id, content_hash, calibrated_at, discrimination, difficulty, guessing in \
+                Question.objects.filter(id__in=batch_ids).values_list(
+                    'id', 'content_hash', 'calibrated_at', 'discrimination', 'difficulty', 'guessing'):
+            existing_hashes[question_id] = content_hash
+            if calibrated_at is not None:
+                calibrated[question_id] = {
+                    'discrimination': discrimination, 'difficulty': difficulty, 'guessing': guessing,
+                }
+
+    # Parameters estimated from real answers take precedence over the sheet's
+    records = [replace(record, **calibrated[record.id]) if record.id in calibrated else record for record in records]
+
+    changed = []
+    for record in records:
+        question = record.to_question()
+        if record.id not in existing_hashes:
+            report.created += 1
+        elif existing_hashes[record.id] != question.content_hash:
+            report.updated += 1
+        else:
+            report.unchanged += 1
+            continue
+        changed.append(question)
+
+    if changed:
+        with transaction.atomic():
+            Question.objects.bulk_create(
+                changed, batch_size=batch_size, update_conflicts=True, unique_fields=['id'], update_fields=UPDATE_FIELDS,
+            )
+            # Let every process rebuild its item bank index from the new parameters
+            transaction.on_commit(invalidate_item_bank)
+
+    return report
@@ -1,5 +1,159 @@
-from supabase import create_client
+import asyncio
+import functools
+import os
+import threading
+import weakref
+
+import httpx
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from gotrue import AsyncGoTrueClient, SyncGoTrueClient
+from gotrue.http_clients import AsyncClient, SyncClient
+from supabase.lib.client_options import DEFAULT_HEADERS
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+# Async connections belong to the event loop that opened them, so there is one pool per loop. Only ASGI
+# servers keep a loop for the life of the process; see get_async_supabase_client
+_async_http_clients = weakref.WeakKeyDictionary()
+
+
+@functools.cache
+def _ssl_context():
+    # Loading the CA bundle takes tens of milliseconds; every pool (one per event loop) reuses the context
+    return httpx.create_ssl_context()
+
+
+def _http_client_options():
+    return dict(
+        verify=_ssl_context(),
+        timeout=httpx.Timeout(settings.SUPABASE_HTTP_TIMEOUT, connect=settings.SUPABASE_HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=settings.SUPABASE_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.SUPABASE_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=settings.SUPABASE_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        http2=settings.SUPABASE_HTTP2,
+        follow_redirects=True,
+    )
+
+
+def get_http_client():
+    """The process-wide keep-alive connection pool used for every call to Supabase; httpx clients are thread-safe."""
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                _http_client = SyncClient(**_http_client_options())
+    return _http_client
+
+
+def close_http_client():
+    """Close the pooled connections; the next call opens a new pool (used by tests and benchmarks)."""
+    global _http_client
+    with _http_client_lock:
+        client, _http_client = _http_client, None
+    if client is not None:
+        client.close()
+
+
+def get_async_http_client():
+    """The keep-alive connection pool of the running event loop, shared by the async views it serves."""
+    loop = asyncio.get_running_loop()
+    client = _async_http_clients.get(loop)
+    if client is None:
+        with _http_client_lock:
+            client = _async_http_clients.get(loop)
+            if client is None:
+                client = _async_http_clients[loop] = AsyncClient(**_http_client_options())
+    return client
+
+
+async def close_async_http_client():
+    """Close the running event loop's pool (used by tests and benchmarks)."""
+    with _http_client_lock:
+        client = _async_http_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _reset_after_fork():
+    # The parent's sockets (and possibly its lock) were copied into the child: forget them without closing,
+    # since closing would shut down connections the parent is still using
+    global _http_client, _http_client_lock, _async_http_clients
+    _http_client = None
+    _http_client_lock = threading.Lock()
+    _async_http_clients = weakref.WeakKeyDictionary()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _auth_options():
+    key = settings.SUPABASE_ANON_KEY
+    return dict(
+        url=f"{settings.SUPABASE_URL.rstrip('/')}/auth/v1",
+        headers={**DEFAULT_HEADERS, 'apiKey': key, 'Authorization': f'Bearer {key}'},
+        auto_refresh_token=False,
+        persist_session=False,
+    )
+
+
+class SupabaseClient:
+    """
+    The Supabase auth API on the shared connection pool.
+
+    Creating one is cheap and makes no network calls. Each holds its own session state (a sign-in followed
+    by ``update_user`` acts on that session), so create one per request instead of sharing it; never call
+    ``auth.close()``, which would close the shared pool.
+    """
+
+    def __init__(self):
+        self.auth = SyncGoTrueClient(**_auth_options(), http_client=get_http_client())
+
+
+class AsyncSupabaseClient:
+    """:class:`SupabaseClient` for async views: its ``auth`` methods are coroutines on the event loop's pool."""
+
+    def __init__(self):
+        self.auth = AsyncGoTrueClient(**_auth_options(), http_client=get_async_http_client())
+
+
+class _ThreadedMethods:
+    """Exposes the methods of a sync object, and of the objects it holds, as coroutines run in worker threads."""
+
+    def __init__(self, target):
+        self._target = target
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if callable(value):
+            return sync_to_async(value, thread_sensitive=False)
+        return _ThreadedMethods(value)
+
+
+class ThreadedSupabaseClient:
+    """:class:`SupabaseClient` on the process-wide sync pool, with the coroutine ``auth`` API of the async client."""
+
+    def __init__(self):
+        self.auth = _ThreadedMethods(SupabaseClient().auth)
+
 
 def get_supabase_client():
-    return create_client(settings.SUPABASE_URL, settings.SUPABASE_ANON_KEY)
\ No newline at end of file
+    return SupabaseClient()
+
+
+def get_async_supabase_client(request):
+    """
+    A client for an async view serving ``request``; must be called from the event loop that will use it.
+
+    Under WSGI, Django runs every async view on a new event loop, so a per-loop pool would open new
+    connections for each request and never close them: those requests use the shared sync pool from
+    worker threads instead.
+    """
+    if isinstance(request, ASGIRequest):
+        return AsyncSupabaseClient()
+    return ThreadedSupabaseClient()
@@ -0,0 +1,372 @@
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from api.ai.item_bank import invalidate_item_bank
+from api.models import (Answer, Assessment, AssessmentProgress, AssessmentResult, Category, Chapter, Class, Lesson,
+                        LessonProgress, Question, User, UserAbility)
+from api.utils.assessment_results import tally_categories
+from api.utils.content_version import LESSONS, bump_version
+
+CHOICES = {'a': 'Choice A', 'b': 'Choice B', 'c': 'Choice C', 'd': 'Choice D'}
+CLASS_CODE_ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+# Latent abilities: a class mean, a general ability per student and a per-category deviation from it
+CLASS_MEAN_SD = 0.3
+STUDENT_SD = 1.0
+CATEGORY_SD = 0.5
+
+# Seconds per item are log-normal around a median that grows when the item is hard for the student
+MEDIAN_TIME_SPENT = 40.0
+TIME_SPENT_SD = 0.45
+TIME_SPENT_BOUNDS = (3, 600)
+
+
+@dataclass(frozen=True)
+class SyntheticScale:
+    teachers: int
+    classes_per_teacher: int
+    students_per_class: int
+    categories: int
+    questions: int
+    quizzes_per_class: int
+    items_per_quiz: int
+    initial_exam_items: int
+    lessons: int
+    chapters_per_lesson: int
+    completion_rate: float = 0.8  # share of a class's assessments each student has submitted
+
+
+# One preset per benchmark tier; large writes about 2.5 million answers
+SCALES = {
+    'small': SyntheticScale(teachers=2, classes_per_teacher=2, students_per_class=25, categories=6, questions=300,
+                            quizzes_per_class=5, items_per_quiz=10, initial_exam_items=20, lessons=4,
+                            chapters_per_lesson=6),
+    'medium': SyntheticScale(teachers=5, classes_per_teacher=4, students_per_class=40, categories=10, questions=3000,
+                             quizzes_per_class=20, items_per_quiz=10, initial_exam_items=30, lessons=10,
+                             chapters_per_lesson=10),
+    'large': SyntheticScale(teachers=20, classes_per_teacher=5, students_per_class=50, categories=20,
+                            questions=20000, quizzes_per_class=40, items_per_quiz=15, initial_exam_items=40,
+                            lessons=20, chapters_per_lesson=12),
+}
+
+
+@dataclass
+class SyntheticPopulation:
+    """Row counts written by :func:`seed_population`."""
+    teachers: int = 0
+    classes: int = 0
+    students: int = 0
+    questions: int = 0
+    assessments: int = 0
+    results: int = 0
+    answers: int = 0
+    lessons: int = 0
+
+    def as_dict(self):
+        return asdict(self)
+
+
+class _ItemPool:
+    """Columnar 3PL parameters and answer texts of the questions answers are sampled from."""
+
+    def __init__(self, rows, categories):
+        ids, category_ids, discrimination, difficulty, guessing, choices, correct_answers = zip(*rows)
+        category_index = {category.id: index for index, category in enumerate(categories)}
+
+        self.categories = categories
+        self.ids = list(ids)
+        self.category_ids = list(category_ids)
+        self.category_positions = np.array([category_index[category_id] for category_id in category_ids])
+        self.discrimination = np.array(discrimination, dtype=np.float64)
+        self.difficulty = np.array(difficulty, dtype=np.float64)
+        self.guessing = np.array(guessing, dtype=np.float64)
+        self.correct_texts = [item_choices.get(correct) for item_choices, correct in zip(choices, correct_answers)]
+        self.wrong_texts = [
+            [text for key, text in item_choices.items() if key != correct] or ['']
+            for item_choices, correct in zip(choices, correct_answers)
+        ]
+        self.by_category = [np.flatnonzero(self.category_positions == index) for index in range(len(categories))]
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def _label(seed):
+    return f'synthetic-s{seed}'
+
+
+def _seed_questions(scale, seed, rng, batch_size):
+    label = _label(seed)
+    categories = Category.objects.bulk_create([
+        Category(name=f'{label} category {index + 1}') for index in range(scale.categories)
+    ])
+
+    # Ids are limited to 10 characters, so they carry the seed modulo 1000
+    prefix = f'S{seed % 1000:03d}'
+    difficulty = np.round(rng.normal(0.0, 1.0, scale.questions), 3)
+    discrimination = np.round(rng.lognormal(0.0, 0.3, scale.questions), 3)
+    guessing = np.round(rng.uniform(0.1, 0.3, scale.questions), 3)
+    correct_answers = rng.choice(list(CHOICES), scale.questions)
+
+    questions = []
+    for index in range(scale.questions):
+        question = Question(
+            id=f'{prefix}{index:06d}',
+            question_text=f'Synthetic question {index + 1}',
+            category=categories[index % len(categories)],
+            difficulty=float(difficulty[index]),
+            discrimination=float(discrimination[index]),
+            guessing=float(guessing[index]),
+            choices=CHOICES,
+            correct_answer=str(correct_answers[index]),
+        )
+        question.content_hash = question.compute_content_hash()
+        questions.append(question)
+    Question.objects.bulk_create(questions, batch_size=batch_size)
+
+    return _ItemPool([
+        (question.id, question.category_id, question.discrimination, question.difficulty, question.guessing,
+         question.choices, question.correct_answer)
+        for question in questions
+    ], categories)
+
+
+def _existing_questions():
+    rows = list(Question.objects.order_by('id').values_list(
+        'id', 'category_id', 'discrimination', 'difficulty', 'guessing', 'choices', 'correct_answer'))
+    if not rows:
+        raise ValueError('There are no questions to sample answers from.')
+    categories = list(Category.objects.filter(id__in={row[1] for row in rows}).order_by('id'))
+    return _ItemPool(rows, categories)
+
+
+def _seed_lessons(scale, seed, batch_size):
+    lessons = Lesson.objects.bulk_create([
+        Lesson(lesson_name=f'{_label(seed)} lesson {index + 1}') for index in range(scale.lessons)
+    ])
+    chapters = []
+    for lesson in lessons:
+        for number in range(1, scale.chapters_per_lesson + 1):
+            chapter = Chapter(lesson=lesson, chapter_number=number, chapter_name=f'Chapter {number}',
+                              content=f'Synthetic content of chapter {number}. ' * 40)
+            chapter.content_hash = chapter.compute_content_hash()
+            chapters.append(chapter)
+    Chapter.objects.bulk_create(chapters, batch_size=batch_size)
+
+    chapters_by_lesson = {lesson.id: [] for lesson in lessons}
+    for chapter in chapters:
+        chapters_by_lesson[chapter.lesson_id].append(chapter.id)
+    return chapters_by_lesson
+
+
+def _class_codes(count, rng):
+    codes = set(Class.objects.values_list('class_code', flat=True))
+    new_codes = []
+    while len(new_codes) < count:
+        code = ''.join(rng.choice(list(CLASS_CODE_ALPHABET), 8))
+        if code not in codes:
+            codes.add(code)
+            new_codes.append(code)
+    return new_codes
+
+
+def _sample_answers(pool, items, theta, rng):
+    """
+    Sample correctness, seconds spent and a uniform draw for picking a wrong choice for one student
+    on ``items`` under the 3PL model.
+
+    ``theta`` holds the student's ability per category, indexed like ``pool.categories``.
+    """
+    ability = theta[pool.category_positions[items]]
+    discrimination, difficulty, guessing = pool.discrimination[items], pool.difficulty[items], pool.guessing[items]
+    probability = guessing + (1 - guessing) / (1 + np.exp(-discrimination * (ability - difficulty)))
+    is_correct = rng.random(len(items)) < probability
+
+    # Harder items take longer and wrong answers a little longer still
+    log_median = np.log(MEDIAN_TIME_SPENT) + 0.25 * (difficulty - ability) + 0.15 * ~is_correct
+    time_spent = np.clip(np.rint(rng.lognormal(log_median, TIME_SPENT_SD)), *TIME_SPENT_BOUNDS).astype(int)
+    return is_correct, time_spent, rng.random(len(items))
+
+
+def _seed_assessments(scale, class_obj, pool, rng, now, batch_size):
+    """The initial exam and quizzes of one class, with their items and selected categories."""
+    assessments = [Assessment(
+        name='Initial Assessment', type='exam', class_owner=class_obj, created_by_id=class_obj.teacher_id,
+        is_initial=True, time_limit=90 * scale.initial_exam_items, deadline=now + timedelta(days=30),
+        source='admin_generated',
+    )]
+    items = [rng.choice(len(pool), min(scale.initial_exam_items, len(pool)), replace=False)]
+    selected = [list(range(len(pool.categories)))]
+
+    for number in range(1, scale.quizzes_per_class + 1):
+        quiz_categories = sorted(rng.choice(len(pool.categories), min(int(rng.integers(1, 4)), len(pool.categories)),
+                                            replace=False).tolist())
+        candidates = np.concatenate([pool.by_category[category] for category in quiz_categories])
+        assessments.append(Assessment(
+            name=f'Quiz {number}', type='quiz', class_owner=class_obj, created_by_id=class_obj.teacher_id,
+            source='teacher_generated', time_limit=90 * scale.items_per_quiz,
+        ))
+        items.append(rng.choice(candidates, min(scale.items_per_quiz, len(candidates)), replace=False))
+        selected.append(quiz_categories)
+
+    Assessment.objects.bulk_create(assessments)
+    Assessment.questions.through.objects.bulk_create([
+        Assessment.questions.through(assessment_id=assessment.id, question_id=pool.ids[item])
+        for assessment, assessment_items in zip(assessments, items) for item in assessment_items
+    ], batch_size=batch_size)
+    Assessment.selected_categories.through.objects.bulk_create([
+        Assessment.selected_categories.through(assessment_id=assessment.id, category_id=pool.categories[category].id)
+        for assessment, categories in zip(assessments, selected) for category in categories
+    ], batch_size=batch_size)
+
+    return list(zip(assessments, items, selected))
+
+
+def _seed_class(scale, class_obj, student_ids, pool, chapters_by_lesson, rng, now, batch_size, population):
+    """Assessments of one class and the results, answers, progress and abilities of its students."""
+    assessments = _seed_assessments(scale, class_obj, pool, rng, now, batch_size)
+    population.assessments += len(assessments)
+
+    class_mean = rng.normal(0.0, CLASS_MEAN_SD)
+    general = rng.normal(class_mean, STUDENT_SD, len(student_ids))
+    thetas = general[:, None] + rng.normal(0.0, CATEGORY_SD, (len(student_ids), len(pool.categories)))
+
+    results, sampled, progress = [], [], []
+    answer_counts = np.zeros_like(thetas, dtype=int)
+    for student, student_id in enumerate(student_ids):
+        for assessment, items, selected in assessments:
+            if rng.random() >= scale.completion_rate:
+                continue
+            is_correct, time_spent, wrong_pick = _sample_answers(pool, items, thetas[student], rng)
+            np.add.at(answer_counts[student], pool.category_positions[items], 1)
+
+            results.append(AssessmentResult(
+                assessment=assessment,
+                user_id=student_id,
+                score=int(is_correct.sum()),
+                time_taken=int(time_spent.sum()),
+                category_tallies=tally_categories(
+                    [(pool.categories[category].id, pool.categories[category].name) for category in selected],
+                    [(pool.category_ids[item], bool(correct)) for item, correct in zip(items, is_correct)],
+                ),
+                total_items=len(items),
+                submitted_at=now - timedelta(days=float(rng.uniform(0, 120))),
+            ))
+            sampled.append((items, is_correct, time_spent, wrong_pick))
+            progress.append(AssessmentProgress(assessment=assessment, user_id=student_id))
+
+    AssessmentResult.objects.bulk_create(results, batch_size=batch_size)
+    AssessmentProgress.objects.bulk_create(progress, batch_size=batch_size)
+    population.results += len(results)
+
+    answers = []
+    for result, (items, is_correct, time_spent, wrong_pick) in zip(results, sampled):
+        for item, correct, seconds, pick in zip(items.tolist(), is_correct.tolist(), time_spent.tolist(),
+                                                wrong_pick.tolist()):
+            wrong_texts = pool.wrong_texts[item]
+            answers.append(Answer(
+                assessment_result_id=result.id,
+                question_id=pool.ids[item],
+                is_correct=correct,
+                time_spent=seconds,
+                chosen_answer=pool.correct_texts[item] if correct else wrong_texts[int(pick * len(wrong_texts))],
+            ))
+        if len(answers) >= batch_size:
+            Answer.objects.bulk_create(answers, batch_size=batch_size)
+            population.answers += len(answers)
+            answers = []
+    Answer.objects.bulk_create(answers, batch_size=batch_size)
+    population.answers += len(answers)
+
+    # Stored abilities are the latent ones blurred by estimation noise that shrinks with more answers
+    noise = rng.normal(0.0, 1.0, thetas.shape) / np.sqrt(1 + answer_counts)
+    UserAbility.objects.bulk_create([
+        UserAbility(user_id=student_id, category_id=category.id,
+                    ability_level=round(float(thetas[student, index] + noise[student, index]), 3),
+                    answer_count=int(answer_counts[student, index]))
+        for student, student_id in enumerate(student_ids)
+        for index, category in enumerate(pool.categories) if answer_counts[student, index]
+    ], batch_size=batch_size)
+
+    LessonProgress.objects.bulk_create([
+        LessonProgress(user_id=student_id, lesson_id=lesson_id,
+                       current_chapter_id=chapter_ids[int(rng.integers(len(chapter_ids)))],
+                       progress_percentage=round(float(rng.uniform(0, 100)), 1))
+        for student_id in student_ids for lesson_id, chapter_ids in chapters_by_lesson.items()
+        if chapter_ids and rng.random() < 0.5
+    ], batch_size=batch_size)
+
+
+def clear_population(seed):
+    """Delete every row an earlier :func:`seed_population` with this ``seed`` wrote."""
+    label = _label(seed)
+    with transaction.atomic():
+        # Classes (and with them assessments, results and answers) go with their teachers
+        User.objects.filter(supabase_user_id__startswith=f'{label}-').delete()
+        # Generated questions go with their categories
+        Category.objects.filter(name__startswith=f'{label} ').delete()
+        Lesson.objects.filter(lesson_name__startswith=f'{label} ').delete()
+        invalidate_item_bank()
+        bump_version(LESSONS)
+
+
+def seed_population(scale, seed=0, batch_size=5000, use_existing_questions=False, log=None):
+    """
+    Write a synthetic school of the given :class:`SyntheticScale` with ``bulk_create`` only.
+
+    Every student gets a latent ability per category, and each submitted assessment is answered by
+    sampling from the 3PL model with the stored item parameters, along with a plausible time per item.
+    With ``use_existing_questions`` answers are drawn over the current question bank instead of
+    generated questions. The same ``seed`` always yields the same rows. Everything is written in one
+    transaction, one class at a time, and the item bank and lesson versions are bumped at the end.
+    """
+    rng = np.random.default_rng(seed)
+    now = timezone.now()
+    label = _label(seed)
+    population = SyntheticPopulation(lessons=scale.lessons)
+
+    with transaction.atomic():
+        if use_existing_questions:
+            pool = _existing_questions()
+        else:
+            pool = _seed_questions(scale, seed, rng, batch_size)
+            population.questions = len(pool)
+        chapters_by_lesson = _seed_lessons(scale, seed, batch_size)
+
+        teachers = User.objects.bulk_create([
+            User(supabase_user_id=f'{label}-t{index}', email=f'{label}-t{index}@example.com',
+                 first_name='Teacher', last_name=str(index), role=User.TEACHER)
+            for index in range(scale.teachers)
+        ])
+        population.teachers = len(teachers)
+
+        class_codes = _class_codes(scale.teachers * scale.classes_per_teacher, rng)
+        classes = Class.objects.bulk_create([
+            Class(name=f'Class {teacher_index}-{index}', teacher=teacher, class_code=class_codes.pop())
+            for teacher_index, teacher in enumerate(teachers) for index in range(scale.classes_per_teacher)
+        ])
+        population.classes = len(classes)
+
+        for class_index, class_obj in enumerate(classes):
+            students = User.objects.bulk_create([
+                User(supabase_user_id=f'{label}-c{class_index}-s{index}',
+                     email=f'{label}-c{class_index}-s{index}@example.com',
+                     first_name='Student', last_name=f'{class_index}-{index}', role=User.STUDENT,
+                     enrolled_class=class_obj)
+                for index in range(scale.students_per_class)
+            ])
+            population.students += len(students)
+
+            _seed_class(scale, class_obj, [student.id for student in students], pool, chapters_by_lesson, rng, now,
+                        batch_size, population)
+            if log:
+                log(class_index + 1, len(classes), population)
+
+        invalidate_item_bank()
+        bump_version(LESSONS)
+
+    return population
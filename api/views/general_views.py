@@ -1,156 +1,172 @@
-from rest_framework import status
-from rest_framework.decorators import api_view
+import functools
+import hmac
+import json
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from ..utils.supabase_client import get_supabase_client
+from ..authentication import authenticate_async
+from ..utils.supabase_client import get_async_supabase_client, get_supabase_client
 from ..models import User, Lesson, Chapter, LessonProgress
+from ..permissions import IsStudent
+from ..utils.content_version import LESSONS, get_version_info
+from ..utils.http import is_not_modified, make_etag, not_modified, set_validators
+from ..utils.lessons import get_lesson_body
+from ..utils.metrics import registry
 from django.shortcuts import get_object_or_404
 
 
-@api_view(['POST'])
-def register_user(request):
-    if request.method == 'POST':
-        # Parse data from the request
-        data = request.data  # Automatically parses JSON into a dictionary
-        email = data.get('email')
-        password = data.get('password')
-        first_name = data.get('first_name')
-        last_name = data.get('last_name')
-        role = data.get('role')
-
-        supabase = get_supabase_client()
-
-        # Register the user with Supabase Auth
-        try:
-            # Supabase registration call
-            auth_response = supabase.auth.sign_up({
-                'email': email,
-                'password': password,
-                'options': {
-                    'email_redirect_to': 'https://localhost:3000/login/',
-                }
-            })
-
-            # Store user in the local database (PostgresSQL)
-            new_user = User(
-                supabase_user_id=auth_response.user.id,
-                email=email,
-                first_name=first_name,
-                last_name=last_name,
-                role=role,
-            )
-            new_user.save()
-
-            # Return success response
-            return Response({'message': 'User registered successfully!'}, status=status.HTTP_201_CREATED)
-        except Exception as e:
-
-            if "already exists" in str(e).lower():
-                return Response({'error': 'Email already registered'}, status=status.HTTP_400_BAD_REQUEST)
-            return Response({'error': f'Error: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
+def _async_api_view(authenticated=True):
+    """
+    ``@api_view(['POST'])`` for the views that wait on Supabase, which run as async views instead.
+
+    DRF views cannot be async, so this parses the JSON body into ``request.data``, authenticates into
+    ``request.user`` unless ``authenticated`` is false and renders errors as ``{'error': message}``.
+    """
+    def decorator(view):
+        @csrf_exempt
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method != 'POST':
+                return JsonResponse({'error': f'Method "{request.method}" not allowed.'},
+                                    status=status.HTTP_405_METHOD_NOT_ALLOWED, headers={'Allow': 'POST'})
+            try:
+                request.data = json.loads(request.body) if request.body else {}
+            except ValueError:
+                return JsonResponse({'error': 'Malformed JSON body.'}, status=status.HTTP_400_BAD_REQUEST)
+
+            if authenticated:
+                try:
+                    request.user = await authenticate_async(request)
+                except exceptions.APIException as e:
+                    response = JsonResponse({'error': str(e.detail)}, status=e.status_code)
+                    if e.status_code == status.HTTP_401_UNAUTHORIZED:
+                        response['WWW-Authenticate'] = 'Bearer'
+                    return response
+
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@_async_api_view(authenticated=False)
+async def register_user(request):
+    # Parse data from the request
+    data = request.data
+    email = data.get('email')
+    password = data.get('password')
+    first_name = data.get('first_name')
+    last_name = data.get('last_name')
+    role = data.get('role')
 
-@api_view(['POST'])
-def login_user(request):
-    if request.method == 'POST':
-        # Parse data from the request
-        data = request.data  # Automatically parses JSON into a dictionary
-        email = data.get('email')
-        password = data.get('password')
-
-        supabase = get_supabase_client()
-
-        try:
-            # Authenticate user with Supabase
-            auth_response = supabase.auth.sign_in_with_password({
-                'email': email,
-                'password': password
-            })
-
-            user = User.objects.get(supabase_user_id=auth_response.user.id)
-            role = user.role
-            first_name = user.first_name
-            last_name = user.last_name
-
-            
-            # Return success response with role and user information
-            return Response({
-                'message': 'Login successful',
-                'jwt_token': auth_response.session.access_token,
-                'refresh_token': auth_response.session.refresh_token,
-                'role': role,
-                'first_name': first_name,
-                'last_name': last_name
-            }, status=status.HTTP_200_OK)
+    supabase = get_async_supabase_client(request)
 
-        except Exception as e:
+    # Register the user with Supabase Auth
+    try:
+        # Supabase registration call
+        auth_response = await supabase.auth.sign_up({
+            'email': email,
+            'password': password,
+            'options': {
+                'email_redirect_to': 'https://localhost:3000/login/',
+            }
+        })
 
-            if "invalid login credentials" in str(e).lower():
-                return Response({'error': 'Email or Password is incorrect'}, status=status.HTTP_400_BAD_REQUEST)
+        # Store user in the local database (PostgresSQL)
+        new_user = User(
+            supabase_user_id=auth_response.user.id,
+            email=email,
+            first_name=first_name,
+            last_name=last_name,
+            role=role,
+        )
+        await new_user.asave()
 
-            return Response({'error': f'Error: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
+        # Return success response
+        return JsonResponse({'message': 'User registered successfully!'}, status=status.HTTP_201_CREATED)
+    except Exception as e:
 
+        if "already exists" in str(e).lower():
+            return JsonResponse({'error': 'Email already registered'}, status=status.HTTP_400_BAD_REQUEST)
+        return JsonResponse({'error': f'Error: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
 
-@api_view(['POST'])
-def refresh_token(request):
-    # Retrieve the refresh_token from the frontend request
 
+@_async_api_view(authenticated=False)
+async def login_user(request):
+    # Parse data from the request
+    data = request.data
+    email = data.get('email')
+    password = data.get('password')
+
+    supabase = get_async_supabase_client(request)
+
+    try:
+        # Authenticate user with Supabase
+        auth_response = await supabase.auth.sign_in_with_password({
+            'email': email,
+            'password': password
+        })
+
+        user = await User.objects.aget(supabase_user_id=auth_response.user.id)
+
+        # Return success response with role and user information
+        return JsonResponse({
+            'message': 'Login successful',
+            'jwt_token': auth_response.session.access_token,
+            'refresh_token': auth_response.session.refresh_token,
+            'role': user.role,
+            'first_name': user.first_name,
+            'last_name': user.last_name
+        }, status=status.HTTP_200_OK)
+
+    except Exception as e:
+
+        if "invalid login credentials" in str(e).lower():
+            return JsonResponse({'error': 'Email or Password is incorrect'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return JsonResponse({'error': f'Error: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@_async_api_view(authenticated=False)
+async def refresh_token(request):
+    # Retrieve the refresh_token from the frontend request
     ref_token = request.data.get('refresh_token')
 
     if not ref_token:
-        return Response({'error': 'Refresh token is required'}, status=status.HTTP_400_BAD_REQUEST)
+        return JsonResponse({'error': 'Refresh token is required'}, status=status.HTTP_400_BAD_REQUEST)
 
-    # Get the Supabase client
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client(request)
 
     try:
         # Use the Supabase client to refresh the token
-        auth_response = supabase.auth.refresh_session(ref_token)
+        auth_response = await supabase.auth.refresh_session(ref_token)
 
         if auth_response:
-            # Extract new access and refresh tokens
-            new_access_token = auth_response.session.access_token
-
-            return Response({
-                'jwt_token': new_access_token,
+            return JsonResponse({
+                'jwt_token': auth_response.session.access_token,
                 'refresh_token': auth_response.session.refresh_token,
             }, status=status.HTTP_200_OK)
         else:
-            return Response({'error': 'Unable to refresh token'}, status=status.HTTP_400_BAD_REQUEST)
+            return JsonResponse({'error': 'Unable to refresh token'}, status=status.HTTP_400_BAD_REQUEST)
 
     except Exception as e:
-        return Response({'error': f'Error: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
+        return JsonResponse({'error': f'Error: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
 
 
-@api_view(['POST'])
-def logout_user(request):
+@_async_api_view()
+async def logout_user(request):
     """Logs out the user by revoking their session token."""
-    token = request.headers.get('Authorization')
-
-    if not token:
-        return Response({'error': 'Authorization token required'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    token = token.split("Bearer ")[-1]
-    supabase = get_supabase_client()
-
-    try:
-        supabase.auth.sign_out()
-        return Response({'message': 'Logout successful'}, status=status.HTTP_200_OK)
-    except Exception as e:
-        return Response({'error': f'Error: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
-
-
-def get_user_id_from_token(request):
-    """Helper function to extract the user ID from the Supabase JWT token."""
-    token = request.headers.get('Authorization')
-    if not token:
-        return None
-    token = token.split("Bearer ")[-1]
+    token = request.headers['Authorization'].split("Bearer ")[-1]
+    supabase = get_async_supabase_client(request)
 
     try:
-        response = get_supabase_client().auth.get_user(jwt=token)
-        return response.user.id
+        await supabase.auth.admin.sign_out(token)
+        return JsonResponse({'message': 'Logout successful'}, status=status.HTTP_200_OK)
     except Exception as e:
-        print(str(e))
-        return None
+        return JsonResponse({'error': f'Error: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
 
 
 def reset_password(request):
@@ -162,31 +178,23 @@ def reset_password(request):
     )
 
 
-@api_view(['POST'])
-def update_password(request):
-    supabase_uid = get_user_id_from_token(request)
-
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    try:
-        user = User.objects.get(supabase_user_id=supabase_uid)
-    except User.DoesNotExist:
-        return Response({'error': 'User does not exist.'}, status=status.HTTP_404_NOT_FOUND)
+@_async_api_view()
+async def update_password(request):
+    user = request.user
 
     data = request.data
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client(request)
     current_password = data.get('current_password')
     new_password = data.get('new_password')
 
     try:
-        auth_response = supabase.auth.sign_in_with_password({
+        auth_response = await supabase.auth.sign_in_with_password({
             'email': user.email,
             'password': current_password
         })
-        supabase.auth.update_user({'password': new_password})
+        await supabase.auth.update_user({'password': new_password})
     except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return JsonResponse({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     return_data = {
         'message': 'Password updated successfully',
@@ -194,22 +202,12 @@ def update_password(request):
         'refresh_token': auth_response.session.refresh_token,
     }
 
-    return Response(return_data, status=status.HTTP_200_OK)
-
-
+    return JsonResponse(return_data, status=status.HTTP_200_OK)
 
 
 @api_view(['GET'])
 def get_user_details(request):
-    supabase_uid = get_user_id_from_token(request)
-
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    try:
-        user = User.objects.get(supabase_user_id=supabase_uid)
-    except User.DoesNotExist:
-        return Response({'error': 'User does not exist.'}, status=status.HTTP_404_NOT_FOUND)
+    user = request.user
 
     user_data = {
         'first_name': user.first_name,
@@ -223,68 +221,55 @@ def get_user_details(request):
 
 @api_view(['GET'])
 def get_lessons_overall(request):
-    user_id = get_user_id_from_token(request)
-
-    if not user_id:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
+    version, updated_at = get_version_info(LESSONS)
+    etag = make_etag(LESSONS, version)
+    if is_not_modified(request, etag, updated_at):
+        return not_modified(etag, updated_at)
 
     lessons = Lesson.objects.all().values('id', 'lesson_name')
 
-    return Response(lessons, status=status.HTTP_200_OK)
+    return set_validators(Response(lessons, status=status.HTTP_200_OK), etag, updated_at)
 
 
 @api_view(['GET'])
 def get_lesson(request, lesson_id):
-    user_id = get_user_id_from_token(request)
-
-    if not user_id:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
+    user = request.user
+    lesson = get_object_or_404(Lesson.objects.only('id', 'lesson_name', 'version', 'updated_at'), id=lesson_id)
 
-    user = get_object_or_404(User, supabase_user_id=user_id)
-    lesson = get_object_or_404(Lesson, id=lesson_id)
-    chapters = lesson.chapters.all().order_by("chapter_number")
-
-    lesson_data = {
-        "id": lesson.id,
-        "lesson_name": lesson.lesson_name,
-        "chapters": [
-            {
-                "id": chapter.id,
-                "chapter_name": chapter.chapter_name,
-                "chapter_number": chapter.chapter_number,
-                "content": chapter.content
-            }
-            for chapter in chapters
-        ]
-    }
+    etag_parts = ['lesson', lesson.id, lesson.version]
+    last_modified = lesson.updated_at
 
     # If the user is a student, add their lesson progress
+    lesson_progress = None
     if user.role == "student":
         lesson_progress, created = LessonProgress.objects.get_or_create(
             user=user,
             lesson=lesson,
             defaults={"progress_percentage": 0.0}  # Default progress if new
         )
+        # Progress is part of the representation, so it is part of the validators too
+        etag_parts += [lesson_progress.current_chapter_id, lesson_progress.progress_percentage]
+        last_modified = max(last_modified, lesson_progress.updated_at)
+
+    etag = make_etag(*etag_parts)
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(etag, last_modified)
 
+    lesson_data = dict(get_lesson_body(lesson.id, lesson.lesson_name, lesson.version))
+
+    if lesson_progress is not None:
         lesson_data["progress"] = {
-            "current_chapter": lesson_progress.current_chapter.id if lesson_progress.current_chapter else None,
+            "current_chapter": lesson_progress.current_chapter_id,
             "progress_percentage": lesson_progress.progress_percentage
         }
 
-    return Response(lesson_data, status=status.HTTP_200_OK)
+    return set_validators(Response(lesson_data, status=status.HTTP_200_OK), etag, last_modified)
 
 
 @api_view(['POST'])
+@permission_classes([IsStudent])
 def update_lesson_progress(request, lesson_id):
-    user_id = get_user_id_from_token(request)
-
-    if not user_id:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    user = get_object_or_404(User, supabase_user_id=user_id)
-
-    if user.role != "student":
-        return Response({'error': 'Only students can update progress.'}, status=status.HTTP_403_FORBIDDEN)
+    user = request.user
 
     lesson = get_object_or_404(Lesson, id=lesson_id)
     data = request.data
@@ -319,3 +304,15 @@ def update_lesson_progress(request, lesson_id):
             "progress_percentage": lesson_progress.progress_percentage
         }
     }, status=status.HTTP_200_OK)
+
+
+def metrics(request):
+    """Prometheus text exposition of the request metrics; not served unless ``API_METRICS_TOKEN`` is set."""
+    expected = settings.API_METRICS_TOKEN
+    if not expected:
+        return HttpResponse('Not Found\n', status=404, content_type='text/plain')
+    provided = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not hmac.compare_digest(provided.encode(), expected.encode()):
+        return HttpResponse('Unauthorized\n', status=401, content_type='text/plain')
+
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
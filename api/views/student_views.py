@@ -1,53 +1,47 @@
 from datetime import timedelta
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-import random
 from django.utils import timezone
-from unicodedata import category
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
+from django.utils.dateparse import parse_datetime
+import numpy as np
 
 from ..models import User, Question, Assessment, Answer, AssessmentResult, UserAbility, Category, Class, Lesson, \
     LessonProgress, Class, AssessmentProgress
 from collections import defaultdict
-from ..ai.estimate_student_ability import estimate_student_ability_per_category
-from api.views.general_views import get_user_id_from_token
+from ..ai.adaptive_testing import estimate_theta_eap, select_next_item, should_stop
+from ..ai.item_bank import get_item_bank, sample_questions
+from ..jobs import enqueue_finish_submission
+from ..permissions import IsStudent
+from ..utils.grading import get_answer_key
+from ..utils.assessment_results import fill_result_tallies, get_result_document, tally_categories
+from ..utils.pagination import NEXT_CURSOR_HEADER, decode_cursor, get_page_size, paginate
 from django.shortcuts import get_object_or_404
 
 
 @api_view(['GET'])
+@permission_classes([IsStudent])
 def get_class(request):
-    supabase_uid = get_user_id_from_token(request)
-
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    try:
-        user = User.objects.get(supabase_user_id=supabase_uid)
-    except User.DoesNotExist:
-        return Response({'error': 'User does not exist.'}, status=status.HTTP_404_NOT_FOUND)
-
-    if user.role != 'student':
-        return Response({"error": "You are not authorized to access this link"}, status=status.HTTP_403_FORBIDDEN)
+    user = request.user
 
     # Get the classes the student is enrolled in
     if user.enrolled_class is None:
         return Response({"message": "You are not enrolled in any class."}, status=status.HTTP_200_OK)
 
-    lessons = Lesson.objects.all()
-    lesson_data = []
-    for lesson in lessons:
-
-        progress = LessonProgress.objects.filter(user=user, lesson=lesson).first()
-
-        if not progress:
-            progress = LessonProgress(user=user, lesson=lesson)
-
-        progress_percentage = progress.progress_percentage if progress else 0.0  # Default to 0% if no progress
+    lessons = Lesson.objects.all().values_list('id', 'lesson_name')
+    progress_by_lesson = dict(
+        LessonProgress.objects.filter(user=user).values_list('lesson_id', 'progress_percentage')
+    )
 
+    lesson_data = []
+    for lesson_id, lesson_name in lessons:
         lesson_data.append({
-            "id": lesson.id,
-            "lesson_name": lesson.lesson_name,
-            "progress_percentage": progress_percentage
+            "id": lesson_id,
+            "lesson_name": lesson_name,
+            "progress_percentage": progress_by_lesson.get(lesson_id, 0.0)  # Default to 0% if no progress
         })
 
     class_obj = user.enrolled_class
@@ -65,19 +59,9 @@ def get_class(request):
 
 
 @api_view(['POST'])
+@permission_classes([IsStudent])
 def join_class(request):
-    supabase_uid = get_user_id_from_token(request)
-
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    try:
-        user = User.objects.get(supabase_user_id=supabase_uid)
-    except User.DoesNotExist:
-        return Response({'error': 'User does not exist.'}, status=status.HTTP_404_NOT_FOUND)
-
-    if user.role != 'student':
-        return Response({"error": "You are not authorized to access this link"}, status=status.HTTP_403_FORBIDDEN)
+    user = request.user
 
     if user.enrolled_class is not None:
         return Response({'error': 'You are already enrolled in a class. You cannot join another.'},
@@ -94,25 +78,15 @@ def join_class(request):
         return Response({'error': 'Class does not exist.'}, status=status.HTTP_404_NOT_FOUND)
 
     user.enrolled_class = class_instance
-    user.save()
+    user.save(update_fields=['enrolled_class'])
 
     return Response({'message': 'Successfully joined the class.'}, status=status.HTTP_200_OK)
 
 
 @api_view(['GET'])
+@permission_classes([IsStudent])
 def get_initial_exam(request):
-    supabase_uid = get_user_id_from_token(request)
-
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    try:
-        user = User.objects.get(supabase_user_id=supabase_uid)
-    except User.DoesNotExist:
-        return Response({'error': 'User does not not exist.'}, status=status.HTTP_404_NOT_FOUND)
-
-    if user.role != 'student':
-        return Response({"error": "You are not authorized to access this link."}, status=status.HTTP_403_FORBIDDEN)
+    user = request.user
 
     if user.enrolled_class is None:
         return Response({"error": "Student is not enrolled to a class"}, status=status.HTTP_403_FORBIDDEN)
@@ -131,19 +105,10 @@ def get_initial_exam(request):
     return Response(exam_data, status=status.HTTP_200_OK)
 
 
+@api_view(['GET'])
+@permission_classes([IsStudent])
 def initial_exam_taken(request):
-    supabase_uid = get_user_id_from_token(request)
-
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    try:
-        user = User.objects.get(supabase_user_id=supabase_uid)
-    except User.DoesNotExist:
-        return Response({'error': 'User does not not exist.'}, status=status.HTTP_404_NOT_FOUND)
-
-    if user.role != 'student':
-        return Response({"error": "You are not authorized to access this link."}, status=status.HTTP_403_FORBIDDEN)
+    user = request.user
 
     if user.enrolled_class is None:
         return Response({"error": "Student is not enrolled to a class"}, status=status.HTTP_403_FORBIDDEN)
@@ -151,25 +116,15 @@ def initial_exam_taken(request):
     # Retrieve the exam object; ensure that the exam belongs to the authenticated user
     exam = get_object_or_404(Assessment, class_owner=user.enrolled_class, is_initial=True)
 
-    exam_result = AssessmentResult.objects.filter(exam=exam, user=user)
+    exam_result = AssessmentResult.objects.filter(assessment=exam, user=user)
 
     return Response({"taken": exam_result.exists()}, status=status.HTTP_200_OK)
 
 
 @api_view(['GET'])
+@permission_classes([IsStudent])
 def take_initial_exam(request):
-    supabase_uid = get_user_id_from_token(request)
-
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    try:
-        user = User.objects.get(supabase_user_id=supabase_uid)
-    except User.DoesNotExist:
-        return Response({'error': 'User does not exist.'}, status=status.HTTP_404_NOT_FOUND)
-
-    if user.role != 'student':
-        return Response({"error": "You are not authorized to access this link"}, status=403)
+    user = request.user
 
     exam = Assessment.objects.filter(class_owner=user.enrolled_class, is_initial=True).first()
 
@@ -210,28 +165,15 @@ def take_initial_exam(request):
 
 
 @api_view(['GET'])
+@permission_classes([IsStudent])
 def take_exam(request):
-    supabase_uid = get_user_id_from_token(request)
-
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    try:
-        user = User.objects.get(supabase_user_id=supabase_uid)
-    except User.DoesNotExist:
-        return Response({'error': 'User does not exist.'}, status=status.HTTP_404_NOT_FOUND)
-
-    if user.role != 'student':
-        return Response({"error": "You are not authorized to access this link"}, status=403)
+    user = request.user
 
-    # Get all questions from the database
-    all_questions = Question.objects.all()
+    selected_questions = sample_questions(None, 1)
 
-    if not all_questions:
+    if not selected_questions:
         return Response({'error': 'No questions available to generate an exam.'}, status=status.HTTP_404_NOT_FOUND)
 
-    selected_questions = random.sample(list(all_questions), 1)
-
     # Create a new exam instance for the authenticated user
     exam = Assessment.objects.create(
         created_by=user,
@@ -239,12 +181,7 @@ def take_exam(request):
         source='student_initiated',
     )
 
-    categories = set()
-    for question in selected_questions:
-        category = Category.objects.get(id=question.category_id)
-        categories.add(category)
-
-    exam.selected_categories.set(categories)
+    exam.selected_categories.set({question.category_id for question in selected_questions})
     exam.questions.set(selected_questions)
     exam.time_limit = 90 * len(selected_questions)
     exam.save()
@@ -273,19 +210,9 @@ def take_exam(request):
 
 
 @api_view(['GET'])
+@permission_classes([IsStudent])
 def check_time_limit(request, assessment_id):
-    supabase_uid = get_user_id_from_token(request)
-
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    try:
-        user = User.objects.get(supabase_user_id=supabase_uid)
-    except User.DoesNotExist:
-        return Response({'error': 'User does not exist.'}, status=status.HTTP_404_NOT_FOUND)
-
-    if user.role != 'student':
-        return Response({"error": "You are not authorized to access this link"}, status=status.HTTP_403_FORBIDDEN)
+    user = request.user
 
     progress = get_object_or_404(AssessmentProgress, user=user, assessment_id=assessment_id)
 
@@ -301,28 +228,20 @@ def check_time_limit(request, assessment_id):
 
 
 @api_view(['POST'])
+@permission_classes([IsStudent])
 def submit_assessment(request, assessment_id):
-    supabase_uid = get_user_id_from_token(request)
-
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    try:
-        user = User.objects.get(supabase_user_id=supabase_uid)
-    except User.DoesNotExist:
-        return Response({'error': 'User does not exist.'}, status=status.HTTP_404_NOT_FOUND)
-
-    if user.role != 'student':
-        return Response({"error": "You are not authorized to access this link."}, status=status.HTTP_403_FORBIDDEN)
+    user = request.user
 
     # Retrieve the exam object
     assessment = get_object_or_404(Assessment, id=assessment_id)
 
     if assessment.deadline:
         assessment_progress = AssessmentProgress.objects.filter(user=user, assessment=assessment).first()
-        time_elapsed = (timezone.now() - assessment_progress.start_time).total_seconds()
+        is_auto_submission = False
 
-        is_auto_submission = time_elapsed >= assessment.time_limit if assessment.time_limit else False
+        if assessment_progress and assessment.time_limit:
+            time_elapsed = (timezone.now() - assessment_progress.start_time).total_seconds()
+            is_auto_submission = time_elapsed >= assessment.time_limit
 
         if not is_auto_submission:
             # Prevent manual submission after the deadline
@@ -335,152 +254,87 @@ def submit_assessment(request, assessment_id):
         #         return Response({'error': 'Auto-submission failed due to excessive delay.'},
         #                         status=status.HTTP_400_BAD_REQUEST)
 
-    # Check if exam was already taken
-    if AssessmentResult.objects.filter(assessment=assessment, user=user).exists():
-        return Response({'error': 'Exam was already taken.'}, status=status.HTTP_400_BAD_REQUEST)
-
     data = request.data
     answers = data.get('answers', [])
 
     if not answers:
         return Response({'error': 'No answers provided.'}, status=status.HTTP_400_BAD_REQUEST)
 
-    # Create an assessment result
-    assessment_result = AssessmentResult.objects.create(
-        assessment=assessment,
-        score=0,
-        time_taken=0,
-        user=user
-    )
-
-    assessment_questions = {q.id: q for q in assessment.questions.all()}
+    answer_key = get_answer_key(assessment)
+    selected_categories = list(assessment.selected_categories.order_by('id').values_list('id', 'name'))
 
+    # Grade in a single pass over the submitted answers; the first answer per question wins
     answers_to_create = []
+    graded = []
+    graded_questions = set()
     score = 0
 
-    for question in assessment_questions.values():
-        answer_data = next((a for a in answers if a["question_id"] == question.id), None)
+    for answer_data in answers:
+        question_id = answer_data.get('question_id')
+        key = answer_key.get(question_id)
 
-        if answer_data:
-            chosen_answer = answer_data.get('answer')
-            time_spent = answer_data.get('time_spent', 0)
-            correct_answer = question.choices[question.correct_answer]
+        if key is None or question_id in graded_questions:
+            continue
+        graded_questions.add(question_id)
 
-            is_correct = chosen_answer == correct_answer
-            if is_correct:
-                score += 1
+        chosen_answer = answer_data.get('answer')
+        is_correct = chosen_answer == key.correct_choice
+        if is_correct:
+            score += 1
 
-            answers_to_create.append(Answer(
-                assessment_result=assessment_result,
-                question=question,
-                time_spent=time_spent,
-                chosen_answer=chosen_answer,
-                is_correct=is_correct
-            ))
+        answers_to_create.append(Answer(
+            question_id=question_id,
+            time_spent=answer_data.get('time_spent', 0),
+            chosen_answer=chosen_answer,
+            is_correct=is_correct
+        ))
+        graded.append((key.category_id, is_correct))
 
-    Answer.objects.bulk_create(answers_to_create)
+    # The unique (assessment, user) constraint turns a racing double submit into an IntegrityError
+    try:
+        with transaction.atomic():
+            assessment_result = AssessmentResult.objects.create(
+                assessment=assessment,
+                score=score,
+                time_taken=data.get('total_time_taken_seconds', 0),
+                user=user,
+                category_tallies=tally_categories(selected_categories, graded),
+                total_items=len(answer_key),
+            )
 
-    assessment_result.score = score
-    assessment_result.time_taken = data.get('total_time_taken_seconds', 0)
-    assessment_result.save()
+            for answer in answers_to_create:
+                answer.assessment_result = assessment_result
+            Answer.objects.bulk_create(answers_to_create)
+
+            # Ability estimation and the results payload are left to a job, which commits with the result
+            enqueue_finish_submission(assessment_result)
+    except IntegrityError:
+        return Response({'error': 'Exam was already taken.'}, status=status.HTTP_400_BAD_REQUEST)
 
     return Response({'message': 'Exam submitted successfully.'}, status=status.HTTP_201_CREATED)
 
 
 @api_view(['GET'])
+@permission_classes([IsStudent])
 def get_exam_results(request, assessment_id):
-    supabase_uid = get_user_id_from_token(request)
-
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    try:
-        user = User.objects.get(supabase_user_id=supabase_uid)
-    except User.DoesNotExist:
-        return Response({'error': 'User does not exist.'}, status=status.HTTP_404_NOT_FOUND)
-
-    if user.role != 'student':
-        return Response({"error": "You are not authorized to access this link."}, status=403)
-
-    # Retrieve the exam object; ensure that the exam belongs to the authenticated user
-    exam = get_object_or_404(Assessment, id=assessment_id)
-    exam_results = get_object_or_404(AssessmentResult, assessment=exam, user=user)
-    answers = Answer.objects.filter(assessment_result=exam_results)
-
-    overall_correct_answers = 0
-    overall_wrong_answers = 0
-    category_stats = defaultdict(lambda: {'total_questions': 0, 'correct_answers': 0, 'wrong_answers': 0})
-
-    # Serialize answers
-    serialized_answers = []
-    for answer in answers:
-        category_name = answer.question.category.name
-        category_stats[category_name]['total_questions'] += 1
-
-        if answer.is_correct:
-            category_stats[category_name]['correct_answers'] += 1
-            overall_correct_answers += 1
-        else:
-            category_stats[category_name]['wrong_answers'] += 1
-            overall_wrong_answers += 1
-
-        serialized_answers.append({
-            'question_id': answer.question.id,
-            'question_text': answer.question.question_text,
-            'choices': list(answer.question.choices.values()),
-            'correct_answer': answer.question.choices[answer.question.correct_answer],
-            'chosen_answer': answer.chosen_answer,
-            'is_correct': answer.is_correct,
-            'time_spent': answer.time_spent,
-        })
-
-    categories = [
-        {
-            'category_name': category_name,
-            'total_questions': stats['total_questions'],
-            'correct_answers': stats['correct_answers'],
-            'wrong_answers': stats['wrong_answers'],
-        }
-        for category_name, stats in category_stats.items()
-    ]
+    user = request.user
 
-    result_data = {
-        'exam_id': exam.id,
-        'student_id': exam_results.user.id,
-        'total_time_taken_seconds': exam_results.time_taken,
-        'score': exam_results.score,
-        'categories': categories,
-        'overall_correct_answers': overall_correct_answers,
-        'overall_wrong_answers': overall_wrong_answers,
-        'total_questions': len(exam.questions.all()),
-        'answers': serialized_answers,
-    }
+    # Results are precomputed at submit time, so this is a single-row read
+    exam_results = get_object_or_404(AssessmentResult, assessment_id=assessment_id, user=user)
+    result_data = get_result_document(exam_results)
 
     return Response(result_data, status=status.HTTP_200_OK)
 
 
 @api_view(['GET'])
+@permission_classes([IsStudent])
 def get_ability(request):
-    supabase_uid = get_user_id_from_token(request)
-
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
+    user = request.user
 
-    try:
-        user = User.objects.get(supabase_user_id=supabase_uid)
-    except User.DoesNotExist:
-        return Response({'error': 'User does not exist.'}, status=status.HTTP_404_NOT_FOUND)
-
-    if user.role != 'student':
-        return Response({"error": "You are not authorized to access this link."}, status=403)
-
-    estimate_student_ability_per_category(user.id)
-
-    # Retrieve stored abilities
-    user_abilities = UserAbility.objects.filter(user_id=user.id)
-    stored_abilities = {
-        user_ability.category.name: user_ability.ability_level for user_ability in user_abilities
-    }
+    # Abilities are kept current when assessments are submitted, so this is a pure read
+    stored_abilities = dict(
+        UserAbility.objects.filter(user_id=user.id).values_list('category__name', 'ability_level')
+    )
 
     return Response({
         "abilities": stored_abilities,
@@ -488,37 +342,21 @@ def get_ability(request):
 
 
 @api_view(['POST'])
+@permission_classes([IsStudent])
 def create_student_quiz(request):
-    supabase_uid = get_user_id_from_token(request)
-
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    try:
-        user = User.objects.get(supabase_user_id=supabase_uid)
-    except User.DoesNotExist:
-        return Response({'error': 'User does not exist.'}, status=status.HTTP_404_NOT_FOUND)
-
-    if user.role != 'student':
-        return Response({"error": "You are not authorized to access this link"}, status=403)
-
-    print(request.data)
+    user = request.user
 
     selected_categories = request.data.get('selected_categories', [])
     selected_categories = [int(cat) for cat in selected_categories] if selected_categories else []
 
-    print(selected_categories)
-
     no_of_questions = int(request.data.get('no_of_questions', 5))
     question_source = request.data.get('question_source')
 
     if question_source == 'previous_exam':
-        all_questions = Question.objects.filter(category_id__in=selected_categories)
-
-        if all_questions.count() < no_of_questions:
+        if get_item_bank().count(selected_categories) < no_of_questions:
             return Response({'error': 'No questions available to generate an exam.'}, status=status.HTTP_404_NOT_FOUND)
 
-        selected_questions = random.sample(list(all_questions), no_of_questions)
+        selected_questions = sample_questions(selected_categories, no_of_questions)
 
     elif question_source == 'ai_generated':
         return Response({'message': 'AI-generated questions feature has not been implemented yet.'},
@@ -558,19 +396,9 @@ def create_student_quiz(request):
 
 
 @api_view(['GET'])
+@permission_classes([IsStudent])
 def take_lesson_quiz(request):
-    supabase_uid = get_user_id_from_token(request)
-
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    try:
-        user = User.objects.get(supabase_user_id=supabase_uid)
-    except User.DoesNotExist:
-        return Response({'error': 'User does not exist.'}, status=status.HTTP_404_NOT_FOUND)
-
-    if user.role != 'student':
-        return Response({"error": "You are not authorized to access this link"}, status=403)
+    user = request.user
 
     data = request.data
 
@@ -581,12 +409,10 @@ def take_lesson_quiz(request):
     selected_categories = [category.id]
     no_of_questions = data.get('no_of_questions')
 
-    all_questions = Question.objects.filter(category_id__in=selected_categories)
-
-    if all_questions.count() < no_of_questions:
+    if get_item_bank().count(selected_categories) < no_of_questions:
         return Response({'error': 'No questions available to generate an exam.'}, status=status.HTTP_404_NOT_FOUND)
 
-    selected_questions = random.sample(list(all_questions), no_of_questions)
+    selected_questions = sample_questions(selected_categories, no_of_questions)
 
     lesson_quiz = Assessment.objects.create(
         lesson=lesson,
@@ -618,28 +444,26 @@ def take_lesson_quiz(request):
 
 
 @api_view(['GET'])
+@permission_classes([IsStudent])
 def get_class_assessments(request):
-    supabase_uid = get_user_id_from_token(request)
-
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    try:
-        user = User.objects.get(supabase_user_id=supabase_uid)
-    except User.DoesNotExist:
-        return Response({'error': 'User does not exist.'}, status=status.HTTP_404_NOT_FOUND)
-
-    if user.role != 'student':
-        return Response({"error": "You are not authorized to access this link"}, status=403)
+    user = request.user
 
-    class_owner = Class.objects.get(id=user.enrolled_class.id)
-    assessments = Assessment.objects.filter(class_owner=class_owner).order_by('-created_at')
+    if user.enrolled_class is None:
+        return Response([], status=status.HTTP_200_OK)
+
+    assessments = Assessment.objects.filter(class_owner=user.enrolled_class).annotate(
+        no_of_items=Count('questions')
+    ).order_by('-created_at')
+    taken = set(AssessmentResult.objects.filter(
+        user=user, assessment__class_owner=user.enrolled_class).values_list('assessment_id', flat=True))
+    started = set(AssessmentProgress.objects.filter(
+        user=user, assessment__class_owner=user.enrolled_class).values_list('assessment_id', flat=True))
     assessments_data = []
 
     for assessment in assessments:
-        was_taken = AssessmentResult.objects.filter(assessment=assessment, user=user).exists()
+        was_taken = assessment.id in taken
         is_open = assessment.deadline is None or assessment.deadline >= timezone.now()
-        in_progress = AssessmentProgress.objects.filter(assessment=assessment, user=user).exists()
+        in_progress = assessment.id in started
 
         if was_taken:
             assessment_status = 'Completed'
@@ -652,7 +476,7 @@ def get_class_assessments(request):
             'id': assessment.id,
             'name': assessment.name,
             'type': assessment.type,
-            'items': assessment.questions.count(),
+            'items': assessment.no_of_items,
             'is_open': is_open,
             'status': assessment_status
         }
@@ -666,56 +490,283 @@ def get_class_assessments(request):
 
 
 @api_view(['GET'])
+@permission_classes([IsStudent])
 def get_history(request):
-    supabase_uid = get_user_id_from_token(request)
-
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
+    user = request.user
 
     try:
-        user = User.objects.get(supabase_user_id=supabase_uid)
-    except User.DoesNotExist:
-        return Response({'error': 'User does not exist.'}, status=status.HTTP_404_NOT_FOUND)
-
-    if user.role != 'student':
-        return Response({"error": "You are not authorized to access this link"}, status=403)
-
-    assessment_results = AssessmentResult.objects.filter(user_id=user.id)
-
-    history = []
-    for result in assessment_results:
-        selected_categories = result.assessment.selected_categories.all()
-        categories = []
-
-        print(selected_categories)
-
-        for category in selected_categories:
-            # Get answers related to the category
-            answers = Answer.objects.filter(
-                assessment_result=result,
-                question__category=category
-            )
-
-            correct_answers = answers.filter(is_correct=True).count()
-            wrong_answers = answers.filter(is_correct=False).count()
+        page_size = get_page_size(request)
+    except ValueError:
+        return Response({'error': 'limit must be a positive integer.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Newest first; the (submitted_at, id) pair is the keyset, so deep pages cost the same as the first one
+    assessment_results = AssessmentResult.objects.filter(user_id=user.id).select_related('assessment').only(
+        'id', 'score', 'time_taken', 'category_tallies', 'total_items', 'submitted_at', 'assessment_id',
+        'assessment__type', 'assessment__question_source', 'assessment__source', 'assessment__created_at',
+    ).order_by('-submitted_at', '-id')
+
+    cursor = request.query_params.get('cursor')
+    if cursor:
+        try:
+            submitted_at, result_id = decode_cursor(cursor)
+            submitted_at, result_id = parse_datetime(submitted_at), int(result_id)
+            if submitted_at is None:
+                raise ValueError
+        except (TypeError, ValueError):
+            return Response({'error': 'Invalid cursor.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        assessment_results = assessment_results.filter(
+            Q(submitted_at__lt=submitted_at) | Q(submitted_at=submitted_at, id__lt=result_id)
+        )
+
+    if 'limit' in request.query_params or cursor:
+        page, next_cursor = paginate(assessment_results, page_size, lambda result: (result.submitted_at, result.id))
+    else:
+        # Clients from before pagination send neither and expect the whole history
+        page, next_cursor = list(assessment_results), None
 
-            categories.append({
-                'category_name': category.name,
-                'correct_answer': correct_answers,
-                'wrong_answer': wrong_answers
-            })
+    # Results graded before tallies were stored are filled in once, then served like any other
+    fill_result_tallies(page)
 
-        item = {
-            'assessment_id': result.assessment.id,
+    history = [
+        {
+            'assessment_id': result.assessment_id,
             'type': result.assessment.type,
             'score': result.score,
-            'total_items': result.assessment.questions.count(),
+            'total_items': result.total_items,
             'time_taken': result.time_taken,
             'date_taken': result.assessment.created_at,
             'question_source': result.assessment.question_source,
             'source': result.assessment.source,
-            'categories': categories,
+            'categories': result.category_tallies,
         }
-        history.append(item)
+        for result in page
+    ]
+
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+    return Response(history, status=status.HTTP_200_OK, headers=headers)
+
+
+def _load_adaptive_session(user, assessment_id, lock=False):
+    """
+    Return ``(assessment, progress, result, answered_rows, pending_question_id)`` for one of the user's adaptive
+    tests; ``result`` is ``None`` until the test finishes. With ``lock`` the progress row is locked, which
+    serializes answers to the same test (call it inside a transaction).
+    """
+    assessment = get_object_or_404(Assessment, id=assessment_id, created_by=user, is_adaptive=True)
+    progress = AssessmentProgress.objects.filter(assessment=assessment, user=user)
+    progress = get_object_or_404(progress.select_for_update() if lock else progress)
+    assessment_result = AssessmentResult.objects.filter(assessment=assessment, user=user).first()
+
+    responses = progress.adaptive_responses
+    parameters = {
+        question_id: rest for question_id, *rest in Question.objects.filter(
+            id__in=[response['question_id'] for response in responses]
+        ).values_list('id', 'discrimination', 'difficulty', 'guessing')
+    } if responses else {}
+    answered = [(response['question_id'], *parameters[response['question_id']], response['is_correct'])
+                for response in responses]
+
+    pending_id = None
+    if assessment_result is None:
+        answered_ids = {response['question_id'] for response in responses}
+        pending = [question_id for question_id in assessment.questions.values_list('id', flat=True)
+                   if question_id not in answered_ids]
+        pending_id = pending[0] if pending else None
+
+    return assessment, progress, assessment_result, answered, pending_id
+
+
+def _adaptive_prior(user, category_id):
+    ability = UserAbility.objects.filter(user=user, category_id=category_id).values_list('ability_level', flat=True)
+    return ability.first() or 0.0
+
+
+def _adaptive_estimate(answered, prior_mean):
+    responses = np.array([row[1:] for row in answered], dtype=float).reshape(-1, 4)
+    return estimate_theta_eap(*responses.T, prior_mean=prior_mean)
+
+
+def _administer_next_item(assessment, category_id, theta):
+    """Pick the most informative unseen item in the category at ``theta`` and attach it to the assessment."""
+    ids, discrimination, difficulty, guessing = get_item_bank().category_items(category_id)
+    if not len(ids):
+        return None
+
+    administered = set(assessment.questions.values_list('id', flat=True))
+    available = np.array([question_id not in administered for question_id in ids], dtype=bool)
+
+    index = select_next_item(theta, discrimination, difficulty, guessing, available,
+                             randomesque=settings.ADAPTIVE_TEST_RANDOMESQUE)
+    if index is None:
+        return None
+
+    question = Question.objects.get(id=ids[index])
+    assessment.questions.add(question)
+    return question
+
+
+def _adaptive_question_data(question):
+    return {
+        'question_id': question.id,
+        'image_url': question.image_url,
+        'question_text': question.question_text,
+        'choices': list(question.choices.values()),
+    }
+
+
+def _finish_adaptive_test(user, assessment, progress, category_id, theta, standard_error):
+    """Grade an adaptive test: turn its responses into the result and answers like a submitted exam."""
+    responses = progress.adaptive_responses
+    selected_categories = list(assessment.selected_categories.order_by('id').values_list('id', 'name'))
+
+    assessment_result = AssessmentResult.objects.create(
+        assessment=assessment,
+        user=user,
+        score=sum(response['is_correct'] for response in responses),
+        time_taken=sum(response['time_spent'] for response in responses),
+        category_tallies=tally_categories(selected_categories, [
+            (category_id, response['is_correct']) for response in responses
+        ]),
+        total_items=len(responses),
+    )
+    Answer.objects.bulk_create(
+        Answer(
+            assessment_result=assessment_result,
+            question_id=response['question_id'],
+            time_spent=response['time_spent'],
+            chosen_answer=response['chosen_answer'],
+            is_correct=response['is_correct'],
+        )
+        for response in responses
+    )
+    enqueue_finish_submission(assessment_result)
+
+    return {
+        'assessment_id': assessment.id,
+        'finished': True,
+        'items_answered': len(responses),
+        'score': assessment_result.score,
+        'theta': theta,
+        'standard_error': standard_error,
+    }
+
+
+@api_view(['POST'])
+@permission_classes([IsStudent])
+def start_adaptive_test(request):
+    user = request.user
+
+    category_id = request.data.get('category_id')
+    if not category_id:
+        return Response({'error': 'category_id is required.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    category = get_object_or_404(Category, id=category_id)
+    prior_mean = _adaptive_prior(user, category.id)
+
+    assessment = Assessment.objects.create(
+        created_by=user,
+        type='quiz',
+        source='student_initiated',
+        question_source='previous_exam',
+        is_adaptive=True,
+    )
+    assessment.selected_categories.set([category])
+
+    question = _administer_next_item(assessment, category.id, prior_mean)
+    if question is None:
+        assessment.delete()
+        return Response({'error': 'No questions available to generate an exam.'}, status=status.HTTP_404_NOT_FOUND)
+
+    # The result is only created when the test finishes, so unfinished tests stay out of results and history
+    AssessmentProgress.objects.create(assessment=assessment, user=user)
+
+    theta, standard_error = _adaptive_estimate([], prior_mean)
 
-    return Response(history, status=status.HTTP_200_OK)
+    return Response({
+        'assessment_id': assessment.id,
+        'finished': False,
+        'items_answered': 0,
+        'theta': theta,
+        'standard_error': standard_error,
+        'question': _adaptive_question_data(question),
+    }, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET'])
+@permission_classes([IsStudent])
+def get_adaptive_item(request, assessment_id):
+    user = request.user
+
+    assessment, _, assessment_result, answered, pending_id = _load_adaptive_session(user, assessment_id)
+    category_id = assessment.selected_categories.values_list('id', flat=True).first()
+    theta, standard_error = _adaptive_estimate(answered, _adaptive_prior(user, category_id))
+
+    data = {
+        'assessment_id': assessment.id,
+        'finished': pending_id is None,
+        'items_answered': len(answered),
+        'theta': theta,
+        'standard_error': standard_error,
+    }
+
+    if pending_id is not None:
+        data['question'] = _adaptive_question_data(Question.objects.get(id=pending_id))
+    else:
+        data['score'] = assessment_result.score
+
+    return Response(data, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([IsStudent])
+def answer_adaptive_item(request, assessment_id):
+    user = request.user
+
+    with transaction.atomic():
+        assessment, progress, _, answered, pending_id = _load_adaptive_session(user, assessment_id, lock=True)
+
+        if pending_id is None:
+            return Response({'error': 'This adaptive test is already finished.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        data = request.data
+        if data.get('question_id') != pending_id:
+            return Response({'error': 'Answer the current question first.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        question = Question.objects.get(id=pending_id)
+        chosen_answer = data.get('answer')
+        is_correct = chosen_answer == question.choices[question.correct_answer]
+
+        progress.adaptive_responses.append({
+            'question_id': question.id,
+            'chosen_answer': chosen_answer,
+            'is_correct': is_correct,
+            'time_spent': data.get('time_spent', 0),
+        })
+        progress.save(update_fields=['adaptive_responses'])
+
+        answered.append((question.id, question.discrimination, question.difficulty, question.guessing, is_correct))
+
+        category_id = question.category_id
+        theta, standard_error = _adaptive_estimate(answered, _adaptive_prior(user, category_id))
+
+        if should_stop(len(answered), standard_error, settings.ADAPTIVE_TEST_MIN_ITEMS,
+                       settings.ADAPTIVE_TEST_MAX_ITEMS, settings.ADAPTIVE_TEST_TARGET_SE):
+            next_question = None
+        else:
+            next_question = _administer_next_item(assessment, category_id, theta)
+
+        if next_question is None:
+            return Response(_finish_adaptive_test(user, assessment, progress, category_id, theta, standard_error),
+                            status=status.HTTP_200_OK)
+
+    return Response({
+        'assessment_id': assessment.id,
+        'finished': False,
+        'is_correct': is_correct,
+        'items_answered': len(answered),
+        'theta': theta,
+        'standard_error': standard_error,
+        'question': _adaptive_question_data(next_question),
+    }, status=status.HTTP_200_OK)
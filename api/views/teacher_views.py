@@ -1,24 +1,23 @@
-from pyasn1_modules.rfc2315 import data
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from ..models import User, Class, UserAbility, Assessment, AssessmentResult, Question, AssessmentProgress
+from ..models import User, Class, UserAbility, Assessment, AssessmentResult, Question, AssessmentProgress, Category
+from django.db.models import Count, Prefetch
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils.dateparse import parse_datetime
-from api.views.general_views import get_user_id_from_token
+from ..permissions import IsTeacher
+from ..utils import exports, gradebook
+from ..utils.assessment_results import fill_result_tallies
+from ..utils.content_version import ITEM_BANK, get_version
+from ..utils.http import etag_matches, make_etag, not_modified, query_fingerprint, set_validators
+from ..utils.pagination import NEXT_CURSOR_HEADER, decode_cursor, get_page_size, paginate
 
 
 @api_view(['POST'])
+@permission_classes([IsTeacher])
 def create_class(request):
-    supabase_uid = get_user_id_from_token(request)
-
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    user = User.objects.get(supabase_user_id=supabase_uid)
-
-    if user.role != 'teacher':
-        return Response({"error": "Only teachers can create classes"}, status=403)
+    user = request.user
 
     data = request.data
     class_name = data.get('class_name')
@@ -72,27 +71,19 @@ def create_class(request):
 
 
 @api_view(['GET'])
+@permission_classes([IsTeacher])
 def get_classes(request):
-    supabase_uid = get_user_id_from_token(request)
-
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    user = User.objects.get(supabase_user_id=supabase_uid)
+    user = request.user
 
-    if user.role != 'teacher':
-        return Response({"error": "Only teachers can get classes"}, status=403)
-
-    classes = Class.objects.filter(teacher=user)
+    classes = Class.objects.filter(teacher=user).annotate(num_students=Count('user'))
 
     data_result = []
 
     for class_obj in classes:
-        num_students = User.objects.filter(enrolled_class=class_obj).count()
         data_result.append({
             'class_id': class_obj.id,
             'class_name': class_obj.name,
-            'number_of_students': num_students
+            'number_of_students': class_obj.num_students
         })
 
     # Return the data in the response
@@ -100,17 +91,9 @@ def get_classes(request):
 
 
 @api_view(['GET'])
+@permission_classes([IsTeacher])
 def get_class(request, class_id):
-    print("Get Class was called with class_id:", class_id)  # Debugging line
-    supabase_uid = get_user_id_from_token(request)
-
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    user = User.objects.get(supabase_user_id=supabase_uid)
-
-    if user.role != 'teacher':
-        return Response({"error": "Only teachers can get classes"}, status=403)
+    user = request.user
 
     teacher_class = Class.objects.get(id=class_id)
 
@@ -138,17 +121,9 @@ def get_class(request, class_id):
 
 
 @api_view(['GET'])
+@permission_classes([IsTeacher])
 def view_initial_exam(request, class_id):
-    print("View Initial Exam was called")
-    supabase_uid = get_user_id_from_token(request)
-
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    user = User.objects.get(supabase_user_id=supabase_uid)
-
-    if user.role != 'teacher':
-        return Response({"error": "Only teachers can get classes"}, status=status.HTTP_403_FORBIDDEN)
+    user = request.user
 
     class_owner = Class.objects.get(id=class_id)
 
@@ -164,16 +139,9 @@ def view_initial_exam(request, class_id):
 
 
 @api_view(['POST'])
+@permission_classes([IsTeacher])
 def open_initial_exam(request, class_id):
-    supabase_uid = get_user_id_from_token(request)
-
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    user = User.objects.get(supabase_user_id=supabase_uid)
-
-    if user.role != 'teacher':
-        return Response({"error": "Only teachers can get classes"}, status=403)
+    user = request.user
 
     data = request.data
 
@@ -190,42 +158,34 @@ def open_initial_exam(request, class_id):
 
 
 @api_view(['GET'])
+@permission_classes([IsTeacher])
 def get_student_data(request, student_id):
-    supabase_uid = get_user_id_from_token(request)
-
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    teacher = get_object_or_404(User, supabase_user_id=supabase_uid)
-
-    if teacher.role != 'teacher':
-        return Response({"error": "Only teachers can access student data"}, status=status.HTTP_403_FORBIDDEN)
+    teacher = request.user
 
     student = get_object_or_404(User, id=student_id)
 
     if student.role != 'student':
         return Response({"error": "Student ID specified is not a student"}, status=status.HTTP_403_FORBIDDEN)
 
-    user_ability = UserAbility.objects.filter(user_id=student_id)
-    stored_abilities = {user_ability.category.name: user_ability.ability_level for user_ability in user_ability}
-
-    assessment_results = AssessmentResult.objects.filter(user=student)
+    stored_abilities = dict(UserAbility.objects.filter(user_id=student_id).values_list('category__name', 'ability_level'))
 
-    history = []
-    for assessment_result in assessment_results:
-        assessment = assessment_result.assessment
+    assessment_results = list(
+        AssessmentResult.objects.filter(user=student).select_related('assessment').order_by('-submitted_at', '-id')
+    )
+    fill_result_tallies(assessment_results)
 
-        item = {
-            'assessment_id': assessment.id,
-            'type': assessment.type,
+    history = [
+        {
+            'assessment_id': assessment_result.assessment_id,
+            'type': assessment_result.assessment.type,
             'score': assessment_result.score,
-            'total_items': assessment.questions.count(),
+            'total_items': assessment_result.total_items,
             'time_taken': assessment_result.time_taken,
-            'date_taken': assessment.created_at,
-            'categories': [category.name for category in assessment.selected_categories.all()]
+            'date_taken': assessment_result.assessment.created_at,
+            'categories': [tally['category_name'] for tally in assessment_result.category_tallies],
         }
-
-        history.append(item)
+        for assessment_result in assessment_results
+    ]
 
     return Response({
         "name": student.full_name,
@@ -235,43 +195,65 @@ def get_student_data(request, student_id):
 
 
 @api_view(['GET'])
+@permission_classes([IsTeacher])
 def get_all_questions(request):
-    supabase_uid = get_user_id_from_token(request)
-
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    teacher = get_object_or_404(User, supabase_user_id=supabase_uid)
-
-    if teacher.role != 'teacher':
-        return Response({"error": "Only teachers can access student data"}, status=status.HTTP_403_FORBIDDEN)
-
-    questions = Question.objects.all()
-
-    response_data = []
-    for question in questions:
-        question_data = {
+    teacher = request.user
+    params = request.query_params
+
+    try:
+        page_size = get_page_size(request)
+        category_ids = [int(category_id) for category_id in params.getlist('category')]
+        min_difficulty = float(params['min_difficulty']) if params.get('min_difficulty') else None
+        max_difficulty = float(params['max_difficulty']) if params.get('max_difficulty') else None
+    except ValueError:
+        return Response({'error': 'Invalid limit, category or difficulty filter.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    is_ai_generated = params.get('is_ai_generated')
+    if is_ai_generated not in (None, 'true', 'false'):
+        return Response({'error': 'is_ai_generated must be true or false.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # The bank only changes through imports, which bump its version, so version + query identify the page
+    etag = make_etag(get_version(ITEM_BANK), query_fingerprint(request))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    questions = Question.objects.select_related('category').only('id', 'question_text', 'category__name')
+    if category_ids:
+        questions = questions.filter(category_id__in=category_ids)
+    if min_difficulty is not None:
+        questions = questions.filter(difficulty__gte=min_difficulty)
+    if max_difficulty is not None:
+        questions = questions.filter(difficulty__lte=max_difficulty)
+    if is_ai_generated is not None:
+        questions = questions.filter(is_ai_generated=is_ai_generated == 'true')
+
+    cursor = params.get('cursor')
+    if cursor:
+        try:
+            last_id, = decode_cursor(cursor)
+        except ValueError:
+            return Response({'error': 'Invalid cursor.'}, status=status.HTTP_400_BAD_REQUEST)
+        questions = questions.filter(id__gt=last_id)
+
+    page, next_cursor = paginate(questions.order_by('id'), page_size, lambda question: (question.id,))
+
+    response_data = [
+        {
             'question_id': question.id,
             'question_text': question.question_text,
             'category_name': question.category.name,
         }
-        response_data.append(question_data)
+        for question in page
+    ]
 
-    return Response(response_data, status=status.HTTP_200_OK)
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+    return set_validators(Response(response_data, status=status.HTTP_200_OK, headers=headers), etag)
 
 
 @api_view(['POST'])
+@permission_classes([IsTeacher])
 def create_quiz(request, class_id):
-    print("Create Quiz was Called")
-    supabase_uid = get_user_id_from_token(request)
-
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    teacher = get_object_or_404(User, supabase_user_id=supabase_uid)
-
-    if teacher.role != 'teacher':
-        return Response({"error": "Only teachers can access student data"}, status=status.HTTP_403_FORBIDDEN)
+    teacher = request.user
 
     data = request.data
     question_source = data.get('question_source')
@@ -313,22 +295,15 @@ def create_quiz(request, class_id):
 
 
 @api_view(['GET'])
+@permission_classes([IsTeacher])
 def get_class_assessments(request, class_id):
-    print("Get All Quizzes was called")
-
-    supabase_uid = get_user_id_from_token(request)
-
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    teacher = get_object_or_404(User, supabase_user_id=supabase_uid)
-
-    if teacher.role != 'teacher':
-        return Response({"error": "Only teachers can access student data"}, status=status.HTTP_403_FORBIDDEN)
+    teacher = request.user
 
     class_obj = Class.objects.get(id=class_id)
 
-    assessments = Assessment.objects.filter(class_owner=class_obj)
+    assessments = Assessment.objects.filter(class_owner=class_obj).annotate(
+        number_of_questions=Count('questions', distinct=True)
+    ).prefetch_related(Prefetch('selected_categories', queryset=Category.objects.only('id', 'name')))
 
     quizzes_data = []
 
@@ -338,10 +313,10 @@ def get_class_assessments(request, class_id):
             "name": assessment.name,
             "type": assessment.type,
             "question_source": assessment.question_source,
-            "number_of_questions": assessment.questions.count(),
+            "number_of_questions": assessment.number_of_questions,
             "created_at": assessment.created_at,
             "deadline": assessment.deadline,
-            "categories": list(assessment.selected_categories.values_list('name', flat=True))
+            "categories": [category.name for category in assessment.selected_categories.all()]
 
         }
         quizzes_data.append(quiz_data)
@@ -350,43 +325,29 @@ def get_class_assessments(request, class_id):
 
 
 @api_view(['GET'])
+@permission_classes([IsTeacher])
 def get_assessment(request, class_id, assessment_id):
-    supabase_uid = get_user_id_from_token(request)
+    teacher = request.user
 
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    teacher = get_object_or_404(User, supabase_user_id=supabase_uid)
-
-    if teacher.role != 'teacher':
-        return Response({"error": "Only teachers can access student data"}, status=status.HTTP_403_FORBIDDEN)
-
-    class_obj = Class.objects.get(id=class_id)
+    class_obj = get_object_or_404(Class, id=class_id)
     assessment = get_object_or_404(Assessment, id=assessment_id)
 
-    students = User.objects.filter(enrolled_class=class_obj)
+    students = list(User.objects.filter(enrolled_class=class_obj))
+    # One query for every student's score; students missing from it have not taken the assessment
+    scores = dict(
+        AssessmentResult.objects.filter(assessment=assessment, user__enrolled_class=class_obj)
+        .values_list('user_id', 'score')
+    )
 
     students_data = []
-
-    total_score = 0
-
     for student in students:
-
-        assessment_result = AssessmentResult.objects.get(assessment=assessment, user=student)
-
-        if assessment_result is not None:
-            students_data.append({
-                "student_id": student.id,
-                "student_name": student.full_name,
-                "taken": True,
-                "score": assessment_result.score
-            })
-
-            total_score += assessment_result.score
-        else:
-            students_data.append({
-                "taken": False,
-            })
+        score = scores.get(student.id)
+        students_data.append({
+            "student_id": student.id,
+            "student_name": student.full_name,
+            "taken": score is not None,
+            "score": score,
+        })
 
     questions_data = []
     for question in assessment.questions.all():
@@ -404,7 +365,7 @@ def get_assessment(request, class_id, assessment_id):
         "question_source": assessment.question_source,
         "source": assessment.source,
         "no_of_items": assessment.questions.count(),
-        "average_score": total_score / students.count(),
+        "average_score": sum(scores.values()) / len(scores) if scores else 0,
         "questions": questions_data,
         "students_data": students_data,
     }
@@ -415,19 +376,72 @@ def get_assessment(request, class_id, assessment_id):
     return Response(response_data, status=status.HTTP_200_OK)
 
 
-def update_quiz(request, quiz_id):
-    supabase_uid = get_user_id_from_token(request)
+@api_view(['GET'])
+@permission_classes([IsTeacher])
+def get_gradebook(request, class_id):
+    teacher = request.user
+
+    class_obj = get_object_or_404(Class, id=class_id, teacher=teacher)
+
+    return Response(gradebook.get_gradebook(class_obj), status=status.HTTP_200_OK)
+
+
+def _export_response(request, name, **filters):
+    """Stream an export of answer rows; ``?output=csv|ndjson``, ``?gzip=1``, ``?since=`` and ``?until=``."""
+    params = request.query_params
+
+    # ``format`` is reserved by DRF for renderer selection, hence ``output``
+    export_format = params.get('output', 'csv')
+    if export_format not in exports.EXPORT_FORMATS:
+        return Response({'error': 'output must be one of: ' + ', '.join(exports.EXPORT_FORMATS)},
+                        status=status.HTTP_400_BAD_REQUEST)
 
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
+    try:
+        since = exports.parse_date_bound(params['since']) if params.get('since') else None
+        until = exports.parse_date_bound(params['until'], end=True) if params.get('until') else None
+    except ValueError as error:
+        return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
 
-    teacher = get_object_or_404(User, supabase_user_id=supabase_uid)
+    compress = params.get('gzip') in ('1', 'true')
+    rows = exports.export_rows(since=since, until=until, **filters)
 
-    if teacher.role != 'teacher':
-        return Response({"error": "You are not authorized to access this link"}, status=status.HTTP_403_FORBIDDEN)
+    response = StreamingHttpResponse(
+        exports.render_export(rows, export_format, compress),
+        content_type='application/gzip' if compress else exports.EXPORT_FORMATS[export_format],
+    )
+    filename = exports.export_filename(name, export_format, compress)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsTeacher])
+def export_class_results(request, class_id):
+    teacher = request.user
+
+    class_obj = get_object_or_404(Class, id=class_id, teacher=teacher)
+
+    return _export_response(request, f'class-{class_obj.id}-results', class_id=class_obj.id)
+
+
+@api_view(['GET'])
+@permission_classes([IsTeacher])
+def export_assessment_results(request, class_id, assessment_id):
+    teacher = request.user
 
-    questions = request.data
-    assessment = get_object_or_404(Assessment, id=quiz_id)
+    assessment = get_object_or_404(Assessment, id=assessment_id, class_owner_id=class_id, class_owner__teacher=teacher)
+
+    return _export_response(request, f'assessment-{assessment.id}-results', assessment_id=assessment.id)
+
+
+@api_view(['PUT'])
+@permission_classes([IsTeacher])
+def update_quiz(request, quiz_id):
+    teacher = request.user
+
+    data = request.data
+    questions = data.get('questions', [])
+    assessment = get_object_or_404(Assessment, id=quiz_id, class_owner__teacher=teacher)
     deadline = parse_datetime(data.get('deadline')) if data.get('deadline') else None
     assessment.deadline = deadline
     assessment.save()
@@ -443,18 +457,12 @@ def update_quiz(request, quiz_id):
     return Response({"message": "Quiz was successfully updated"}, status=status.HTTP_200_OK)
 
 
+@api_view(['DELETE'])
+@permission_classes([IsTeacher])
 def delete_quiz(request, quiz_id):
-    supabase_uid = get_user_id_from_token(request)
-
-    if not supabase_uid:
-        return Response({'error': 'User not authenticated.'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    teacher = get_object_or_404(User, supabase_user_id=supabase_uid)
-
-    if teacher.role != 'teacher':
-        return Response({"error": "Only teachers can access student data"}, status=status.HTTP_403_FORBIDDEN)
+    teacher = request.user
 
-    assessment = get_object_or_404(Assessment, id=quiz_id)
+    assessment = get_object_or_404(Assessment, id=quiz_id, class_owner__teacher=teacher)
 
     # Check for related AssessmentResult or AssessmentProgress
     has_results = AssessmentResult.objects.filter(assessment=assessment).exists()